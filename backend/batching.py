@@ -0,0 +1,58 @@
+# batching.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def dedupe(items: Iterable[str], key_func: Callable[[str], str]) -> Tuple[List[str], List[str]]:
+    """Return (unique items in first-seen order, the key of every input item)."""
+    unique, keys, seen = [], [], set()
+    for item in items:
+        key = key_func(item)
+        keys.append(key)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique, keys
+
+
+def chunked(items: Sequence[T], size: int) -> List[Sequence[T]]:
+    """Split a sequence into consecutive groups of at most `size` items."""
+    size = max(1, size)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def gather_bounded(work: Iterable[Callable[[], Awaitable[T]]], limit: int) -> List[Any]:
+    """Await each work() with at most `limit` running at once.
+
+    Results come back in input order; a failed call leaves its exception in
+    place of a result instead of cancelling the others.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(call):
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(run(call) for call in work), return_exceptions=True)
+
+
+def match_group_results(requested: Sequence[str], results: Sequence[Any], name_field: str,
+                        key_func: Callable[[str], str]) -> Dict[str, Optional[Any]]:
+    """Pair the objects of a grouped model reply with the items that were asked for.
+
+    Objects are matched on `name_field` only. Items the model skipped or
+    renamed map to None for the caller to retry on their own; an object is
+    never assigned by position, since that could save one product's
+    analysis under another's name.
+    """
+    matched: Dict[str, Optional[Any]] = {item: None for item in requested}
+    by_key = {key_func(item): item for item in requested}
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        item = by_key.get(key_func(str(result.get(name_field, ""))))
+        if item is not None and matched[item] is None:
+            matched[item] = result
+    return matched
@@ -0,0 +1,103 @@
+# bench_validation.py
+"""Micro-benchmark of product_validation over generated model payloads.
+
+Payloads mix what the model actually sends: clean numbers, numbers with
+units ("$4.99", "120 kcal", "4.5/5"), "N/A", out-of-range ratings, odd
+casing, missing sections and short or malformed alternative lists. Each
+payload is validated the way infoBot (padded to three alternatives) and
+urlBot do it, and into typed records; a json.loads of the same payload is
+timed for scale.
+
+Examples:
+    python bench_validation.py
+    python bench_validation.py --payloads 20000 --repeat 7
+"""
+import argparse
+import json
+import random
+import time
+
+from product_validation import Product, validate_product
+
+NUTRIENTS = ("Calories", "Total_Fat", "Sodium", "Total_Carbohydrates", "Total_Sugars", "Protein")
+
+
+def sample_number(rng, value):
+    """The same number as the model might write it."""
+    return rng.choice((
+        value, round(value, 1), str(value), f"${value}", f"{value} g", f"{value}/5", "N/A", None, -value, value * 10
+    ))
+
+
+def sample_section(rng, alternative=False):
+    section = {
+        "Health_Information": {
+            "Nutrients": {name: sample_number(rng, rng.randint(0, 300)) for name in NUTRIENTS},
+            "Ingredients": [f"ingredient {i}" for i in range(rng.randint(0, 8))],
+            "Health_index": sample_number(rng, round(rng.uniform(2, 5), 1))
+        },
+        "Sustainability_Information": {
+            "Biodegradable": rng.choice(("Yes", "No", "yes", "NO", "N/A", None)),
+            "Recyclable": rng.choice(("Yes", "No", "yes", "partially", None)),
+            "Sustainability_rating": sample_number(rng, round(rng.uniform(2, 5), 1))
+        },
+        "Price": sample_number(rng, round(rng.uniform(0.5, 40), 2)),
+        "Reliability_index": sample_number(rng, round(rng.uniform(2, 5), 1))
+    }
+    if alternative:
+        section.update({"Name": f"Alternative {rng.randint(1, 999)}", "Brand": rng.choice(("Acme", "", None)),
+                        "Key_Differences": "Lighter packaging"})
+    else:
+        section.update({"product_name": f"Product {rng.randint(1, 99999)}",
+                        "Color_of_the_dustbin": rng.choice(("blue", "Green", "black", "yellow", None))})
+    if rng.random() < 0.1:
+        del section[rng.choice(("Health_Information", "Sustainability_Information", "Price"))]
+    return section
+
+
+def sample_payloads(count, seed):
+    rng = random.Random(seed)
+    payloads = []
+    for _ in range(count):
+        payload = sample_section(rng)
+        payload["Alternatives"] = [sample_section(rng, alternative=True) for _ in range(rng.choice((0, 1, 3, 3, 3, 4)))]
+        if rng.random() < 0.05:
+            payload["Alternatives"].append("not an object")
+        payloads.append(payload)
+    return payloads
+
+
+def best_time(run, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark product validation over generated payloads.")
+    parser.add_argument("--payloads", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    payloads = sample_payloads(args.payloads, args.seed)
+    encoded = [json.dumps(payload) for payload in payloads]
+    measurements = {
+        "infoBot (3 alternatives)": lambda: [validate_product(p, min_alternatives=3) for p in payloads],
+        "urlBot": lambda: [validate_product(p) for p in payloads],
+        "typed records": lambda: [Product.from_model(p) for p in payloads],
+        "json.loads (reference)": lambda: [json.loads(text) for text in encoded],
+    }
+
+    print(f"{args.payloads} payloads, best of {args.repeat} runs")
+    for label, run in measurements.items():
+        elapsed = best_time(run, args.repeat)
+        print(f"{label:<26} {elapsed * 1e6 / args.payloads:8.1f} us/payload  "
+              f"{args.payloads / elapsed:10.0f} payloads/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# benchmark_vision.py
+"""Replay a frame source through the vision pipeline and report throughput.
+
+Examples:
+    python benchmark_vision.py --source "../ML/detected_objects/*.png"
+    python benchmark_vision.py --source recording.mp4 --frames 300 --window 3
+    python benchmark_vision.py --source synthetic --frames 100 --json bench.json
+"""
+import argparse
+import json
+import resource
+import sys
+import time
+
+from frame_sources import open_frame_source
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_benchmark(models, source, frames, window, warmup):
+    """Feed frames through detect_and_extract_text and collect per-stage timings."""
+    timings = {"decode": []}
+    products = 0
+    processed = 0
+    batch = []
+
+    # Warm up lazy model initialization so it does not skew the first samples
+    for _ in range(warmup):
+        ret, frame = source.read()
+        if not ret:
+            break
+        models.detect_and_extract_text(frame)
+
+    started = time.perf_counter()
+    while processed < frames:
+        decode_start = time.perf_counter()
+        ret, frame = source.read()
+        if not ret:
+            break
+        timings["decode"].append((time.perf_counter() - decode_start) * 1000)
+        batch.append(frame)
+        processed += 1
+
+        if len(batch) >= window or processed >= frames:
+            products += len(models.detect_and_extract_text(batch, timings))
+            batch = []
+    if batch:
+        products += len(models.detect_and_extract_text(batch, timings))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "frames": processed,
+        "window": window,
+        "elapsed_s": round(elapsed, 3),
+        "frames_per_second": round(processed / elapsed, 2) if elapsed else 0.0,
+        "products_detected": products,
+        "stages_ms": {
+            stage: {
+                "p50": round(percentile(values, 50), 2),
+                "p95": round(percentile(values, 95), 2),
+                "samples": len(values)
+            }
+            for stage, values in timings.items()
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def print_report(report):
+    """Print a human readable summary of a benchmark run."""
+    print(f"Frames: {report['frames']} (window {report['window']}) in {report['elapsed_s']}s")
+    print(f"Throughput: {report['frames_per_second']} frames/s, {report['products_detected']} products")
+    print(f"{'stage':<8}{'p50 ms':>10}{'p95 ms':>10}{'samples':>10}")
+    for stage, stats in report["stages_ms"].items():
+        print(f"{stage:<8}{stats['p50']:>10}{stats['p95']:>10}{stats['samples']:>10}")
+    print(f"Peak RSS: {report['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the YOLO + OCR vision pipeline offline.")
+    parser.add_argument("--source", default="../ML/detected_objects",
+                        help="Image directory/glob, video file, camera index or 'synthetic[:N]'")
+    parser.add_argument("--frames", type=int, default=100, help="Number of frames to replay")
+    parser.add_argument("--window", type=int, default=1, help="Frames per detect_and_extract_text call")
+    parser.add_argument("--warmup", type=int, default=2, help="Frames to run before timing starts")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    source = open_frame_source(int(args.source) if args.source.isdigit() else args.source)
+    if not source.isOpened():
+        parser.error(f"Could not open frame source: {args.source}")
+
+    # Importing main loads the shared models once, exactly as the service does
+    from main import vision_models
+
+    try:
+        report = run_benchmark(vision_models, source, args.frames, max(1, args.window), args.warmup)
+    finally:
+        source.release()
+        vision_models.executor.shutdown(wait=False)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as file:
+            json.dump(report, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# enrich_catalog.py
+"""Pre-populate the product catalog from a list of product names or URLs.
+
+Each item goes through the same model call and cleaning as a live lookup
+(infoBot's call_openai_api / clean_json_structure for names, urlBot's
+ProductAnalyzer for URLs). Results are bulk-loaded into the product store
+and the services' caches, so later scans of those products are cache hits.
+
+Completed items are appended to a checkpoint file after their batch is
+written, so an interrupted run picks up where it stopped. Failed items are
+retried on the next run.
+
+The job starts none of the services' background work: no write-behind
+queue and no vision event subscription. With PRODUCT_SYNC set it copies
+products upstream through its own journal (enrich_catalog_sync.jsonl),
+never the running service's.
+
+Input is CSV (a column named by --column, else product_name/name/url, else
+the first column) or JSON lines (strings or objects with that key).
+
+Examples:
+    python enrich_catalog.py launch_products.csv
+    python enrich_catalog.py urls.jsonl --kind urls --concurrency 8 --rpm 300
+    python enrich_catalog.py launch_products.csv --checkpoint launch.checkpoint.jsonl --batch-size 100
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import time
+
+from model_client import ModelUnavailableError
+from product_cache import normalize_product_key, normalize_url_key
+from write_behind import SyncedProductRepository
+
+DEFAULT_COLUMNS = ("product_name", "name", "url")
+# Seconds to wait for products to be copied upstream when PRODUCT_SYNC is set
+SYNC_TIMEOUT = 120
+
+
+def read_items(path, column=None):
+    """Return the non-empty product names or URLs listed in a CSV or JSON-lines file."""
+    items = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    key = column or next((c for c in DEFAULT_COLUMNS if c in record), None)
+                    record = record.get(key) if key else None
+                if isinstance(record, str) and record.strip():
+                    items.append(record.strip())
+        else:
+            reader = csv.DictReader(f)
+            fields = reader.fieldnames or []
+            key = column or next((c for c in DEFAULT_COLUMNS if c in fields), fields[0] if fields else None)
+            if key not in fields:
+                sys.exit(f"Column {key!r} not found in {path}")
+            for row in reader:
+                value = (row.get(key) or "").strip()
+                if value:
+                    items.append(value)
+    return items
+
+
+def load_checkpoint(path):
+    """Return the keys of items already written by earlier runs."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from an interrupted run
+                continue
+            if record.get("status") == "done":
+                done.add(record["key"])
+    return done
+
+
+class RequestPacer:
+    """Spaces model calls to stay under a requests-per-minute budget.
+
+    This keeps the job under its own budget, below the services' quota,
+    so live traffic keeps headroom. When the model client gives up on a
+    call, the next slot is pushed back for every worker, so the whole run
+    slows down together instead of each worker retrying on its own.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+    def back_off(self, delay):
+        self.next_slot = max(self.next_slot, time.monotonic() + delay)
+
+
+class NameEnricher:
+    """Analyzes product names the way infoBot's /fetch_product does."""
+
+    key_func = staticmethod(normalize_product_key)
+
+    def __init__(self):
+        import infoBot
+        self.service = infoBot
+        self.store = infoBot.product_store
+        self.upstream = infoBot.upstream
+
+    async def analyze(self, name):
+        raw_info = await self.service.call_openai_api(name)
+        return name, self.service.clean_json_structure(raw_info, name)
+
+    def cache(self, item, product_id, data):
+        self.service.product_cache.set(item, {"product_id": product_id, "data": data})
+
+
+class UrlEnricher:
+    """Analyzes product URLs the way urlBot's /analyze_url does."""
+
+    key_func = staticmethod(normalize_url_key)
+
+    def __init__(self):
+        import urlBot
+        self.service = urlBot
+        self.store = urlBot.product_store
+        self.upstream = urlBot.upstream
+        self.analyzer = urlBot.ProductAnalyzer(urlBot.model_client, urlBot.product_store, urlBot.upstream)
+
+    async def analyze(self, url):
+        try:
+            data = self.analyzer.validate_product_data(await self.analyzer.analyze_product_url(url))
+        except self.service.APIError as e:
+            raise Exception(e.message)
+        return data["product_name"], data
+
+    def cache(self, item, product_id, data):
+        self.service.url_results.set(item, {"product_id": product_id, "data": data})
+
+
+async def enrich(enricher, items, checkpoint_path, concurrency, rpm, batch_size, retries):
+    """Analyze items with bounded, paced concurrency and bulk-load them in batches."""
+    from persistence import new_product_id
+
+    pacer = RequestPacer(rpm)
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    pending = []  # (key, item, product_id, name, data) waiting for the next bulk write
+    counts = {"done": 0, "failed": 0}
+    write_lock = asyncio.Lock()
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8")
+
+    def record(entries):
+        for entry in entries:
+            checkpoint.write(json.dumps(entry) + "\n")
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+    async def flush():
+        async with write_lock:
+            batch = pending[:]
+            del pending[:]
+            if not batch:
+                return
+            try:
+                await enricher.upstream.offload(enricher.store.save_products,
+                                                [(product_id, name, data) for _, _, product_id, name, data in batch])
+            except Exception as e:
+                print(f"Bulk write of {len(batch)} products failed: {e}")
+                record([{"key": key, "item": item, "status": "failed", "error": str(e)} for key, item, *_ in batch])
+                counts["failed"] += len(batch)
+                return
+            for _, item, product_id, _, data in batch:
+                enricher.cache(item, product_id, data)
+            record([{"key": key, "item": item, "status": "done", "product_id": product_id}
+                    for key, item, product_id, _, _ in batch])
+            counts["done"] += len(batch)
+            print(f"Loaded {counts['done']}/{len(items)} products ({counts['failed']} failed)")
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            for attempt in range(retries + 1):
+                await pacer.wait()
+                try:
+                    name, data = await enricher.analyze(item)
+                    break
+                except Exception as e:
+                    delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                    if isinstance(e, ModelUnavailableError):
+                        # The shared client already retried; slow the whole run down
+                        delay = max(delay, e.retry_after or 0.0)
+                        pacer.back_off(delay)
+                    if attempt == retries:
+                        print(f"Giving up on {item!r}: {e}")
+                        record([{"key": enricher.key_func(item), "item": item, "status": "failed", "error": str(e)}])
+                        counts["failed"] += 1
+                        name = None
+                    else:
+                        await asyncio.sleep(delay)
+            if name is not None:
+                pending.append((enricher.key_func(item), item, new_product_id(), name, data))
+                if len(pending) >= batch_size:
+                    await flush()
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    finally:
+        # Write whatever finished before an interruption so it is not analyzed again
+        await flush()
+        checkpoint.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or JSON-lines file of product names or URLs")
+    parser.add_argument("--kind", choices=("auto", "names", "urls"), default="auto")
+    parser.add_argument("--column", help="CSV column or JSON key holding the name or URL")
+    parser.add_argument("--checkpoint", help="Progress file (default: <input>.checkpoint.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Model calls in flight")
+    parser.add_argument("--rpm", type=float, default=60, help="Model requests per minute; 0 for no pacing")
+    parser.add_argument("--batch-size", type=int, default=50, help="Products per bulk write")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per item before it is marked failed")
+    args = parser.parse_args()
+
+    items = read_items(args.input, args.column)
+    kind = args.kind
+    if kind == "auto":
+        kind = "urls" if items and all(item.startswith(("http://", "https://")) for item in items) else "names"
+
+    # The job writes to the store directly; it must not share the services' write-behind or
+    # upstream sync journals, nor subscribe to the vision service's detections
+    os.environ["WRITE_BEHIND"] = "0"
+    os.environ["SYNC_JOURNAL_PATH"] = "enrich_catalog_sync.jsonl"
+    os.environ["VISION_EVENTS_URL"] = ""
+    enricher = UrlEnricher() if kind == "urls" else NameEnricher()
+
+    checkpoint_path = args.checkpoint or f"{args.input}.checkpoint.jsonl"
+    done = load_checkpoint(checkpoint_path)
+    todo, seen = [], set(done)
+    for item in items:
+        key = enricher.key_func(item)
+        if key not in seen:
+            seen.add(key)
+            todo.append(item)
+    print(f"{len(items)} {kind} listed, {len(done)} already loaded, {len(todo)} to analyze")
+
+    started = time.perf_counter()
+    try:
+        counts = asyncio.run(enrich(enricher, todo, checkpoint_path, args.concurrency, args.rpm,
+                                    args.batch_size, args.retries))
+    except KeyboardInterrupt:
+        sys.exit("Interrupted; rerun the same command to resume from the checkpoint")
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {counts['done']} products, {counts['failed']} failed, in {elapsed:.1f}s")
+
+    if isinstance(enricher.store, SyncedProductRepository):
+        # With PRODUCT_SYNC set, copy the loaded products upstream before exiting; whatever is
+        # left stays in the job's own sync journal and is sent on the next run
+        print("Waiting for the upstream sync to finish")
+        if not enricher.store.sync_queue.flush(SYNC_TIMEOUT):
+            pending = enricher.store.get_sync_stats()["pending"]
+            print(f"{pending} products not yet synced upstream; rerun to send them")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# frame_sources.py
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+class FrameSource:
+    """Minimal cv2.VideoCapture-compatible interface for non-camera sources.
+
+    VisionProcessor only uses isOpened/read/set/release, so anything that
+    implements them can stand in for a live camera.
+    """
+
+    def __init__(self, fps=None, loop=True):
+        self.fps = fps  # None replays as fast as the consumer reads
+        self.loop = loop
+        self.opened = True
+        self.last_read = 0.0
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        """Accept camera properties; only FPS affects replay pacing."""
+        if prop == cv2.CAP_PROP_FPS and self.fps is not None:
+            self.fps = value
+        return True
+
+    def release(self):
+        self.opened = False
+
+    def next_frame(self):
+        """Return the next frame, or None when the source is exhausted."""
+        raise NotImplementedError
+
+    def pace(self):
+        """Sleep so replay runs at the configured frame rate."""
+        if not self.fps:
+            return
+        delay = 1 / self.fps - (time.monotonic() - self.last_read)
+        if delay > 0:
+            time.sleep(delay)
+        self.last_read = time.monotonic()
+
+    def read(self, image=None):
+        if not self.opened:
+            return False, None
+        self.pace()
+        frame = self.next_frame()
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape and image.dtype == frame.dtype:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+
+class ImageDirectorySource(FrameSource):
+    """Replay still images from a directory or glob pattern, e.g. ML/detected_objects/*.png."""
+
+    def __init__(self, pattern, fps=None, loop=True, size=(640, 480)):
+        super().__init__(fps, loop)
+        if os.path.isdir(pattern):
+            paths = [
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+        else:
+            paths = glob.glob(pattern)
+        self.paths = sorted(paths)
+        self.size = size
+        self.position = 0
+        self.opened = bool(self.paths)
+
+    def next_frame(self):
+        if self.position >= len(self.paths):
+            if not self.loop:
+                return None
+            self.position = 0
+        frame = cv2.imread(self.paths[self.position])
+        self.position += 1
+        if frame is None:
+            return None
+        # Camera frames have a fixed shape, so keep replayed frames uniform too
+        if self.size and (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size)
+        return frame
+
+
+class VideoFileSource(FrameSource):
+    """Replay a recorded video file, optionally looping at the end."""
+
+    def __init__(self, path, fps=None, loop=True):
+        super().__init__(fps, loop)
+        self.capture = cv2.VideoCapture(path)
+        self.opened = self.capture.isOpened()
+
+    def next_frame(self):
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        return frame if ret else None
+
+    def release(self):
+        super().release()
+        self.capture.release()
+
+
+class SyntheticSource(FrameSource):
+    """Generate shelf-like frames with labelled boxes, for runs without any media."""
+
+    LABELS = ["SPARKLING APPLE", "OAT MILK", "ORGANIC PASTA", "GREEN TEA", "DARK CHOCOLATE"]
+
+    def __init__(self, count=None, fps=None, size=(640, 480), seed=0):
+        super().__init__(fps, loop=count is None)
+        self.count = count
+        self.size = size
+        self.generated = 0
+        self.rng = np.random.default_rng(seed)
+
+    def next_frame(self):
+        if self.count is not None and self.generated >= self.count:
+            return None
+        width, height = self.size
+        frame = np.full((height, width, 3), 200, dtype=np.uint8)
+        for slot in range(3):
+            x = 20 + slot * (width // 3) + int(self.rng.integers(0, 20))
+            y = 80 + int(self.rng.integers(0, 40))
+            color = tuple(int(c) for c in self.rng.integers(60, 255, 3))
+            cv2.rectangle(frame, (x, y), (x + width // 3 - 60, y + 260), color, -1)
+            label = self.LABELS[(self.generated + slot) % len(self.LABELS)]
+            cv2.putText(frame, label, (x + 5, y + 130), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.5, (0, 0, 0), 2)
+        self.generated += 1
+        return frame
+
+
+def open_frame_source(spec, fps=None, loop=True):
+    """Open a camera index, device path, video file, image directory/glob or 'synthetic[:N]'."""
+    if isinstance(spec, str):
+        if spec.startswith("synthetic"):
+            _, _, count = spec.partition(":")
+            return SyntheticSource(count=int(count) if count else None, fps=fps)
+        if os.path.isdir(spec) or any(ch in spec for ch in "*?["):
+            return ImageDirectorySource(spec, fps=fps, loop=loop)
+        if os.path.isfile(spec):
+            if spec.lower().endswith(IMAGE_EXTENSIONS):
+                return ImageDirectorySource(spec, fps=fps, loop=loop)
+            return VideoFileSource(spec, fps=fps, loop=loop)
+    return cv2.VideoCapture(spec)
@@ -1,19 +1,31 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import json
+import math
 import os
 from datetime import datetime
 from supabase import create_client, Client
-from typing import Dict, Any, List
-import re
+from typing import Dict, Any, List, Tuple
 from dotenv import load_dotenv
 from pathlib import Path
 from flask.views import MethodView
-from asgiref.wsgi import WsgiToAsgi
 from hypercorn.config import Config
 from hypercorn.asyncio import serve
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from flask_cors import CORS
-from openai import OpenAI
+from openai import AsyncOpenAI
+from vision_events import VisionEventSubscriber
+from product_cache import ProductCache, normalize_product_key
+from single_flight import SingleFlight
+from upstream import UpstreamRunner
+from persistence import SupabaseProductRepository, open_repository, new_product_id
+from write_behind import SyncedProductRepository, WriteBehindQueue
+from batching import chunked, dedupe, gather_bounded, match_group_results
+from json_stream import STREAM_MIMETYPES, encode_events, requested_stream_mode
+from model_client import ModelClient, ModelUnavailableError
+from product_schema import (ALTERNATIVE_PROPERTIES, PRODUCT_PROPERTIES, batch_properties, pick,
+                            request_fingerprint, response_format)
+from product_validation import validate_alternative, validate_product
 
 # Load environment variables
 load_dotenv()
@@ -30,15 +42,115 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 VISION_PROCESS_PATH = Path("vision_output.json")
+VISION_EVENTS_URL = os.getenv('VISION_EVENTS_URL', 'http://localhost:5002/events')
 
-# Initialize OpenAI and Supabase clients
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI and Supabase clients; retries are left to the model client wrapper
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Model calls share one rate limit sized to the quota, retry with backoff and trip a circuit breaker
+model_client = ModelClient(
+    client,
+    requests_per_minute=float(os.getenv('MODEL_RPM', 500)),
+    burst=int(os.getenv('MODEL_BURST', 10)),
+    max_retries=int(os.getenv('MODEL_MAX_RETRIES', 4)),
+    deadline=float(os.getenv('MODEL_DEADLINE', 120)),
+    failure_threshold=int(os.getenv('MODEL_BREAKER_THRESHOLD', 5)),
+    reset_timeout=float(os.getenv('MODEL_BREAKER_RESET', 30))
+)
+
+# Model calls run on a shared event loop; blocking supabase calls on a bounded pool
+upstream = UpstreamRunner(max_blocking_workers=int(os.getenv('DB_CONCURRENCY', 16)), name="infobot")
+# Products go to Supabase unless PRODUCT_STORE points at a local store (e.g. sqlite:products.sqlite3)
+product_store = open_repository(os.getenv('PRODUCT_STORE', 'supabase'), supabase,
+                                rpc_name=os.getenv('SUPABASE_SAVE_RPC'))
+# With PRODUCT_SYNC=supabase a local store also copies every write to Supabase in the background
+if os.getenv('PRODUCT_SYNC') == 'supabase' and not isinstance(product_store, SupabaseProductRepository):
+    product_store = SyncedProductRepository(
+        product_store,
+        SupabaseProductRepository(supabase, rpc_name=os.getenv('SUPABASE_SAVE_RPC')),
+        journal_path=os.getenv('SYNC_JOURNAL_PATH', 'infobot_sync.jsonl'),
+        batch_size=int(os.getenv('WRITE_BATCH_SIZE', 50))
+    )
+
+# Saves are journaled locally and written in the background unless WRITE_BEHIND=0.
+# /process_vision and /fetch_product still answer only once the row is readable (the kiosk
+# reads it from Supabase right away), waiting up to WRITE_CONFIRM_TIMEOUT seconds for it;
+# streamed and batch lookups return the pre-assigned product_id with status "queued".
+WRITE_CONFIRM_TIMEOUT = float(os.getenv('WRITE_CONFIRM_TIMEOUT', 10))
+write_queue = None
+if os.getenv('WRITE_BEHIND', '1') != '0':
+    write_queue = WriteBehindQueue(
+        product_store,
+        journal_path=os.getenv('WRITE_JOURNAL_PATH', 'infobot_writes.jsonl'),
+        batch_size=int(os.getenv('WRITE_BATCH_SIZE', 50))
+    )
+
 # Validate environment variables
 if not all([OPENAI_API_KEY, SUPABASE_URL, SUPABASE_KEY]):
     raise EnvironmentError("Missing required environment variables. Please check your .env file.")
 
+# Model settings shared by the blocking and streaming lookups; fixed so the same product gets the same answer
+PRODUCT_MODEL_OPTIONS = {
+    "model": "gpt-4o",  # or "gpt-3.5-turbo" if you prefer
+    "temperature": 0,
+    "seed": int(os.getenv('MODEL_SEED', 7))
+}
+# Bump whenever a prompt or response schema changes, so cached analyses of the old prompt are not reused
+PROMPT_VERSION = "product-2"
+# Constrain replies to the response schema; STRUCTURED_OUTPUT=0 falls back to plain JSON mode
+STRUCTURED_OUTPUT = os.getenv('STRUCTURED_OUTPUT', '1') != '0'
+
+def product_fingerprint(product_name: str) -> str:
+    """Fingerprint of the model request for a product: settings, prompt version and normalized name."""
+    return request_fingerprint({**PRODUCT_MODEL_OPTIONS, "structured": STRUCTURED_OUTPUT},
+                               PROMPT_VERSION, normalize_product_key(product_name))
+
+# Cache of cleaned analyses keyed on the request fingerprint; expired
+# entries are still served for PRODUCT_CACHE_STALE_TTL while the model is unavailable
+product_cache = ProductCache(
+    path=os.getenv('PRODUCT_CACHE_PATH', 'product_cache.sqlite3'),
+    ttl=float(os.getenv('PRODUCT_CACHE_TTL', 7 * 24 * 3600)),
+    max_memory_entries=int(os.getenv('PRODUCT_CACHE_SIZE', 1000)),
+    stale_ttl=float(os.getenv('PRODUCT_CACHE_STALE_TTL', 30 * 24 * 3600)),
+    key_func=product_fingerprint
+)
+
+# Fan the product request out into parallel per-section calls instead of one long reply
+PRODUCT_FANOUT = os.getenv('PRODUCT_FANOUT', '0') == '1'
+
+# Sections of fanned-out requests, cached separately so prices can refresh on their own
+section_cache = ProductCache(
+    path=os.getenv('PRODUCT_CACHE_PATH', 'product_cache.sqlite3'),
+    ttl=float(os.getenv('SECTION_CACHE_TTL', 30 * 24 * 3600)),
+    max_memory_entries=int(os.getenv('PRODUCT_CACHE_SIZE', 1000)) * 6,  # six sections per product
+    namespace="product_section",
+    key_func=product_fingerprint
+)
+PRICE_SECTION_TTL = float(os.getenv('PRICE_SECTION_TTL', 24 * 3600))
+
+# Batch lookups: products per grouped model call, grouped calls in flight, and names per request
+BATCH_GROUP_SIZE = int(os.getenv('BATCH_GROUP_SIZE', 5))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))
+MAX_BATCH_ITEMS = int(os.getenv('MAX_BATCH_ITEMS', 100))
+
+# Concurrent lookups of the same product share one model call and one insert;
+# COALESCE_REQUESTS=0 turns this off (the load test's baseline)
+product_lookups = SingleFlight(enabled=os.getenv('COALESCE_REQUESTS', '1') != '0')
+
+# Subscribe to detections pushed by the vision service; the file is only a fallback.
+# An empty VISION_EVENTS_URL leaves the subscription off (enrich_catalog.py sets it so).
+vision_events = VisionEventSubscriber(VISION_EVENTS_URL)
+if VISION_EVENTS_URL:
+    vision_events.start()
+
+def read_latest_detection(session_id: str = None) -> Dict[str, Any]:
+    """Return the newest detection, from the event stream or the fallback file."""
+    event = vision_events.latest(session_id)
+    if event and event.get("product_name"):
+        return event
+    return {"product_name": read_vision_process_file(), "seq": None}
+
 def read_vision_process_file() -> str:
     """Read and parse the vision process JSON file to get product name."""
     try:
@@ -58,17 +170,10 @@ def read_vision_process_file() -> str:
     except Exception as e:
         raise Exception(f"Error reading vision process file: {str(e)}")
     
-def call_openai_api(product_name: str) -> Dict[str, Any]:
-    """Helper function to make requests to the OpenAI API."""
-    try:
-        prompt = f"""
-        Provide a detailed JSON object for {product_name} with EXACT numeric values (no text descriptions in numeric fields). 
-        If the {product_name} cannot be fully determined, provide the closest market equivalent.
-        
-        Follow this STRICT format and return ONLY the JSON object with no additional text:
-        {{
-            "Health_Information": {{
-                "Nutrients": {{
+# JSON layout of one analyzed product, shared by the single and batch prompts
+PRODUCT_FORMAT = """{
+            "Health_Information": {
+                "Nutrients": {
                     "Calories": "number kcal",
                     "Total_Fat": "number g",
                     "Saturated_Fat": "number g",
@@ -84,305 +189,626 @@ def call_openai_api(product_name: str) -> Dict[str, Any]:
                     "Calcium": "number mg",
                     "Iron": "number mg",
                     "Potassium": "number mg"
-                }},
+                },
                 "Ingredients": ["ingredient1", "ingredient2", "ingredient3"],
                 "Health_index": number
-            }},
-            "Sustainability_Information": {{
+            },
+            "Sustainability_Information": {
                 "Biodegradable": "Yes/No",
                 "Recyclable": "Yes/No",
                 "Sustainability_rating": number
-            }},
+            },
             "Price": number,
             "Reliability_index": number,
             "Color_of_the_dustbin": "blue/green/black",
-            "Technical_Specifications": {{
+            "Technical_Specifications": {
                 "Material": "string"
-            }},
+            },
             "Alternatives": [
-                {{
+                {
                     "Name": "string",
                     "Brand": "string",
-                    "Health_Information": {{
-                        "Nutrients": {{same structure as above}},
+                    "Health_Information": {
+                        "Nutrients": {same structure as above},
                         "Ingredients": ["ingredient1", "ingredient2"],
                         "Health_index": number
-                    }},
-                    "Sustainability_Information": {{
+                    },
+                    "Sustainability_Information": {
                         "Biodegradable": "Yes/No",
                         "Recyclable": "Yes/No",
                         "Sustainability_rating": number
-                    }},
+                    },
                     "Price": number,
                     "Reliability_index": number,
                     "Key_Differences": "string"
-                }}
+                }
             ]
-        }}
-    
-        Critical Rules:
-        1. ALL numeric values must be plain numbers without units
+        }"""
+
+PRODUCT_RULES = """1. ALL numeric values must be plain numbers without units
         2. ALL ratings must be between 2.0 and 5.0
         3. Provide exactly 3 real market alternatives
         4. Use only real market ingredients
         5. Return ONLY the JSON object, no additional text
         6. Ensure all numeric fields contain actual numbers
         7. Ensure sustainability ratings of alternatives are higher than the original product
-        8. All indices must be different and non-zero
+        8. All indices must be different and non-zero"""
+
+def product_messages(product_name: str) -> List[Dict[str, str]]:
+    """Build the chat messages asking the model to describe a product."""
+    prompt = f"""
+        Provide a detailed JSON object for {product_name} with EXACT numeric values (no text descriptions in numeric fields). 
+        If the {product_name} cannot be fully determined, provide the closest market equivalent.
+        
+        Follow this STRICT format and return ONLY the JSON object with no additional text:
+        {PRODUCT_FORMAT}
+    
+        Critical Rules:
+        {PRODUCT_RULES}
         """
+    return [
+        {
+            "role": "system", 
+            "content": "You are a precise assistant that provides structured product information in JSON format. Always return valid JSON without any additional text or markdown formatting."
+        },
+        {
+            "role": "user", 
+            "content": prompt
+        }
+    ]
 
-        response = client.chat.completions.create(
-            model="gpt-4o",  # or "gpt-3.5-turbo" if you prefer
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "You are a precise assistant that provides structured product information in JSON format. Always return valid JSON without any additional text or markdown formatting."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            temperature=0.7  # Adjust for creativity vs consistency
-        )
+def batch_messages(product_names: List[str]) -> List[Dict[str, str]]:
+    """Build the chat messages asking the model to describe several products in one reply."""
+    listing = "\n".join(f"        - {name}" for name in product_names)
+    prompt = f"""
+        Provide a detailed JSON object for each of these products with EXACT numeric values (no text descriptions in numeric fields):
+{listing}
+        If a product cannot be fully determined, provide the closest market equivalent.
 
-        # Extract JSON from the response
-        response_text = response.choices[0].message.content.strip()
-        
-        # Remove any potential markdown code block formatting
-        response_text = re.sub(r'^```json\s*|\s*```$', '', response_text)
-        
-        # Parse the JSON
-        try:
-            return json.loads(response_text)
-        except json.JSONDecodeError:
-            # If direct parsing fails, try to find JSON object in the text
-            json_match = re.search(r'({[\s\S]*})', response_text)
-            if json_match:
-                return json.loads(json_match.group(1))
-            raise Exception("Failed to extract valid JSON from API response")
+        Follow this STRICT format and return ONLY the JSON object with no additional text:
+        {{
+            "Products": [
+                {{"Product": "the product name exactly as listed", ...all fields of the product format}}
+            ]
+        }}
+
+        Product format:
+        {PRODUCT_FORMAT}
+
+        Critical Rules:
+        {PRODUCT_RULES}
+        9. Return one entry in "Products" for every listed product, in the listed order
+        """
+    return [
+        {
+            "role": "system",
+            "content": "You are a precise assistant that provides structured product information in JSON format. Always return valid JSON without any additional text or markdown formatting."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+async def request_json(messages: List[Dict[str, str]], json_format: Dict[str, Any], on_section=None,
+                       item_keys=("Alternatives",)) -> Dict[str, Any]:
+    """Stream one chat completion into an incremental parser and return the object."""
+    return await upstream.run(model_client.stream_json(
+        messages, item_keys=item_keys, on_section=on_section,
+        response_format=json_format if STRUCTURED_OUTPUT else {"type": "json_object"},
+        **PRODUCT_MODEL_OPTIONS
+    ))
+
+async def call_openai_api(product_name: str, on_section=None) -> Dict[str, Any]:
+    """Helper function to make requests to the OpenAI API.
+
+    The reply is streamed into an incremental parser, which repairs common
+    defects as it goes; on_section(path, value) sees each top-level field
+    and each alternative as soon as it closes. With PRODUCT_FANOUT enabled
+    the product is requested as several smaller sections in parallel.
+    """
+    try:
+        if PRODUCT_FANOUT:
+            return await call_openai_sections(product_name, on_section)
+        return await request_json(product_messages(product_name), PRODUCT_RESPONSE_FORMAT, on_section)
 
+    except ModelUnavailableError as e:
+        print(f"OpenAI API unavailable: {str(e)}")
+        raise
     except Exception as e:
         print(f"OpenAI API Error details: {str(e)}")
         raise Exception(f"OpenAI API Error: {str(e)}")
 
-def clean_json_structure(data: Dict[str, Any], product_name: str) -> Dict[str, Any]:
-    """Clean and validate the JSON structure."""
-    try:
-        # Define valid values and defaults
-        VALID_DUSTBIN_COLORS = ["blue", "green", "black"]
-        DEFAULT_RATING = 4.0
-        DEFAULT_PRICE = 9.99
-        
-        def clean_number(value: Any, default: float) -> float:
-            """Clean and validate numeric values."""
-            try:
-                if isinstance(value, (int, float)):
-                    return float(value)
-                if isinstance(value, str):
-                    clean_str = re.sub(r'[^\d.]', '', value)
-                    return float(clean_str) if clean_str else default
-                return default
-            except (ValueError, TypeError):
-                return default
-
-        def clean_rating(value: Any) -> float:
-            """Clean and validate rating values to be between 3.0 and 5.0."""
-            rating = clean_number(value, DEFAULT_RATING)
-            return max(3.0, min(5.0, rating))
-
-        # Clean main product data
-        cleaned_data = {
-            "Health_Information": {
-                "Nutrients": data.get("Health_Information", {}).get("Nutrients", {}),
-                "Ingredients": data.get("Health_Information", {}).get("Ingredients", []),
-                "Health_index": clean_rating(data.get("Health_Information", {}).get("Health_index", DEFAULT_RATING))
-            },
+# Section prompts used when the product request is fanned out: (subject, fields, format)
+NUTRIENTS_FORMAT = """{
+                    "Calories": "number kcal",
+                    "Total_Fat": "number g",
+                    "Saturated_Fat": "number g",
+                    "Trans_Fat": "number g",
+                    "Cholesterol": "number mg",
+                    "Sodium": "number mg",
+                    "Total_Carbohydrates": "number g",
+                    "Dietary_Fiber": "number g",
+                    "Total_Sugars": "number g",
+                    "Added_Sugars": "number g",
+                    "Protein": "number g",
+                    "Vitamin_D": "number mcg",
+                    "Calcium": "number mg",
+                    "Iron": "number mg",
+                    "Potassium": "number mg"
+                }"""
+
+SECTION_FORMATS = {
+    "facts": ("the nutrition facts and ingredients of", ("Health_Information",), f"""{{
+            "Health_Information": {{
+                "Nutrients": {NUTRIENTS_FORMAT},
+                "Ingredients": ["ingredient1", "ingredient2", "ingredient3"],
+                "Health_index": number
+            }}
+        }}"""),
+    "sustainability": ("the packaging sustainability of", ("Sustainability_Information", "Color_of_the_dustbin"), """{
             "Sustainability_Information": {
-                "Biodegradable": str(data.get("Sustainability_Information", {}).get("Biodegradable", "No")).capitalize(),
-                "Recyclable": str(data.get("Sustainability_Information", {}).get("Recyclable", "Yes")).capitalize(),
-                "Sustainability_rating": clean_rating(data.get("Sustainability_Information", {}).get("Sustainability_rating", DEFAULT_RATING))
+                "Biodegradable": "Yes/No",
+                "Recyclable": "Yes/No",
+                "Sustainability_rating": number
             },
-            "Price": clean_number(data.get("Price", DEFAULT_PRICE), DEFAULT_PRICE),
-            "Reliability_index": clean_rating(data.get("Reliability_index", DEFAULT_RATING)),
-            "Color_of_the_dustbin": data.get("Color_of_the_dustbin", "blue").lower(),
-            "Alternatives": []
+            "Color_of_the_dustbin": "blue/green/black"
+        }"""),
+    "price": ("the current price and reliability of", ("Price", "Reliability_index"), """{
+            "Price": number,
+            "Reliability_index": number
+        }"""),
+}
+
+ALTERNATIVE_FORMAT = f"""{{
+            "Name": "string",
+            "Brand": "string",
+            "Health_Information": {{
+                "Nutrients": {NUTRIENTS_FORMAT},
+                "Ingredients": ["ingredient1", "ingredient2"],
+                "Health_index": number
+            }},
+            "Sustainability_Information": {{
+                "Biodegradable": "Yes/No",
+                "Recyclable": "Yes/No",
+                "Sustainability_rating": number
+            }},
+            "Price": number,
+            "Reliability_index": number,
+            "Key_Differences": "string"
+        }}"""
+
+# Each alternative call asks for a different kind of alternative so the three do not repeat
+ALTERNATIVE_ANGLES = ("healthier", "more sustainable", "more affordable")
+PRODUCT_SECTIONS = tuple(SECTION_FORMATS) + tuple(f"alternative_{i + 1}" for i in range(len(ALTERNATIVE_ANGLES)))
+
+# Response schemas for the single, grouped and per-section requests
+PRODUCT_RESPONSE_FORMAT = response_format("product", PRODUCT_PROPERTIES)
+BATCH_RESPONSE_FORMAT = response_format("products", batch_properties("Product", PRODUCT_PROPERTIES))
+SECTION_RESPONSE_FORMATS = {
+    **{section: response_format(section, pick(PRODUCT_PROPERTIES, fields))
+       for section, (_, fields, _) in SECTION_FORMATS.items()},
+    **{section: response_format("alternative", ALTERNATIVE_PROPERTIES)
+       for section in PRODUCT_SECTIONS if section.startswith("alternative_")}
+}
+
+def section_messages(product_name: str, section: str) -> List[Dict[str, str]]:
+    """Build the chat messages for one section of a fanned-out product request."""
+    if section.startswith("alternative_"):
+        angle = ALTERNATIVE_ANGLES[int(section.rsplit("_", 1)[1]) - 1]
+        subject = f"one real market alternative to {product_name} that is {angle}, with a higher sustainability rating than {product_name}"
+        json_format = ALTERNATIVE_FORMAT
+    else:
+        description, _, json_format = SECTION_FORMATS[section]
+        subject = f"{description} {product_name}"
+
+    prompt = f"""
+        Provide a JSON object describing {subject} with EXACT numeric values (no text descriptions in numeric fields).
+        If the {product_name} cannot be fully determined, use the closest market equivalent.
+
+        Follow this STRICT format and return ONLY the JSON object with no additional text:
+        {json_format}
+
+        Critical Rules:
+        1. ALL numeric values must be plain numbers without units
+        2. ALL ratings must be between 2.0 and 5.0
+        3. Use only real market products and ingredients
+        4. Return ONLY the JSON object, no additional text
+        """
+    return [
+        {
+            "role": "system",
+            "content": "You are a precise assistant that provides structured product information in JSON format. Always return valid JSON without any additional text or markdown formatting."
+        },
+        {
+            "role": "user",
+            "content": prompt
         }
+    ]
 
-        # Process alternatives
-        alternatives = data.get("Alternatives", [])
-        for alt in alternatives[:3]:
-            cleaned_alt = {
-                "Name": str(alt.get("Name", "Alternative Product")),
-                "Brand": str(alt.get("Brand", "Unknown Brand")),
-                "Health_Information": {
-                    "Nutrients": alt.get("Health_Information", {}).get("Nutrients", {}),
-                    "Ingredients": alt.get("Health_Information", {}).get("Ingredients", []),
-                    "Health_index": clean_rating(alt.get("Health_Information", {}).get("Health_index", DEFAULT_RATING))
-                },
-                "Sustainability_Information": {
-                    "Biodegradable": str(alt.get("Sustainability_Information", {}).get("Biodegradable", "No")).capitalize(),
-                    "Recyclable": str(alt.get("Sustainability_Information", {}).get("Recyclable", "Yes")).capitalize(),
-                    "Sustainability_rating": clean_rating(alt.get("Sustainability_Information", {}).get("Sustainability_rating", DEFAULT_RATING))
-                },
-                "Price": clean_number(alt.get("Price", DEFAULT_PRICE), DEFAULT_PRICE),
-                "Reliability_index": clean_rating(alt.get("Reliability_index", DEFAULT_RATING)),
-                "Key_Differences": str(alt.get("Key_Differences", "Alternative product option"))
-            }
-            cleaned_data["Alternatives"].append(cleaned_alt)
-
-        # Ensure exactly 3 alternatives
-        while len(cleaned_data["Alternatives"]) < 3:
-            cleaned_data["Alternatives"].append({
-                "Name": f"Alternative {len(cleaned_data['Alternatives'])+1}",
-                "Brand": "Generic Brand",
-                "Health_Information": {
-                    "Nutrients": {},
-                    "Ingredients": [],
-                    "Health_index": DEFAULT_RATING
-                },
-                "Sustainability_Information": {
-                    "Biodegradable": "No",
-                    "Recyclable": "Yes",
-                    "Sustainability_rating": DEFAULT_RATING
-                },
-                "Price": DEFAULT_PRICE,
-                "Reliability_index": DEFAULT_RATING,
-                "Key_Differences": "Alternative product option"
-            })
+async def call_openai_sections(product_name: str, on_section=None) -> Dict[str, Any]:
+    """Request every section concurrently and merge them into one raw product object.
+
+    Sections are cached on their own, so a product whose price has expired
+    reuses its cached facts and alternatives and only asks for the price
+    again. on_section sees each field as its section arrives; alternatives
+    are numbered in the order they complete.
+    """
+    merged: Dict[str, Any] = {"Alternatives": []}
+
+    async def load(section: str):
+        key = f"{section} {product_name}"
+        value = await upstream.offload(section_cache.get, key)
+        if value is None:
+            value = await request_json(section_messages(product_name, section), SECTION_RESPONSE_FORMATS[section])
+            ttl = PRICE_SECTION_TTL if section == "price" else None
+            await upstream.offload(section_cache.set, key, value, ttl)
+        return section, value
+
+    for completed in asyncio.as_completed([load(section) for section in PRODUCT_SECTIONS]):
+        section, value = await completed
+        if section.startswith("alternative_"):
+            merged["Alternatives"].append(value)
+            if on_section is not None:
+                on_section(("Alternatives", len(merged["Alternatives"]) - 1), value)
+            continue
+        # Keep only the fields this section owns, in case the model answered more
+        for field in SECTION_FORMATS[section][1]:
+            if field in value:
+                merged[field] = value[field]
+                if on_section is not None:
+                    on_section((field,), value[field])
+    return merged
+
+ALTERNATIVE_COUNT = 3
+MAIN_PRODUCT_FIELDS = ("Health_Information", "Sustainability_Information", "Price",
+                       "Reliability_index", "Color_of_the_dustbin")
+
+def clean_product_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Clean the main product section, without its alternatives."""
+    cleaned_data = validate_product({**data, "Alternatives": []})
+    del cleaned_data["Alternatives"]
+    return cleaned_data
 
+def clean_alternative(alt: Dict[str, Any]) -> Dict[str, Any]:
+    """Clean a single alternative."""
+    return validate_alternative(alt)
+
+def clean_json_structure(data: Dict[str, Any], product_name: str) -> Dict[str, Any]:
+    """Clean and validate the JSON structure, padding it to exactly 3 alternatives."""
+    try:
+        cleaned_data = validate_product(data, min_alternatives=ALTERNATIVE_COUNT)
+        # Identifies the request behind this analysis, so identical requests can be reused and compared
+        cleaned_data["Request_Fingerprint"] = product_fingerprint(product_name)
         return cleaned_data
 
     except Exception as e:
         raise Exception(f"Error cleaning JSON structure: {str(e)}")
+
 async def save_to_supabase(product_name: str, data: Dict[str, Any]) -> Dict[str, Any]:
     """Save the structured data to Supabase database."""
     try:
-        # Ensure nutrients and ingredients are valid JSON
-        nutrients = data["Health_Information"]["Nutrients"]
-        if isinstance(nutrients, str):
-            try:
-                nutrients = json.loads(nutrients)
-            except json.JSONDecodeError:
-                nutrients = {}
-                
-        ingredients = data["Health_Information"]["Ingredients"]
-        if isinstance(ingredients, str):
-            try:
-                ingredients = json.loads(ingredients)
-            except json.JSONDecodeError:
-                ingredients = []
-        if not isinstance(ingredients, list):
-            ingredients = [str(ingredients)]
-
-        # Prepare main product data
-        main_product_data = {
-            "product_name": product_name,
-            "health_nutrients": json.dumps(nutrients),
-            "health_ingredients": json.dumps(ingredients),
-            "health_index": float(str(data["Health_Information"]["Health_index"]).replace("$", "").strip() or "4.0"),
-            "sustainability_biodegradable": data["Sustainability_Information"]["Biodegradable"],
-            "sustainability_recyclable": data["Sustainability_Information"]["Recyclable"],
-            "sustainability_rating": float(str(data["Sustainability_Information"]["Sustainability_rating"]).replace("$", "").strip() or "4.0"),
-            "price": float(str(data["Price"]).replace("$", "").strip() or "9.99"),
-            "reliability_index": float(str(data["Reliability_index"]).replace("$", "").strip() or "4.0"),
-            "dustbin_color": data["Color_of_the_dustbin"].lower()
-        }
-
-        # Insert main product
-        result = supabase.table("product_information").insert(main_product_data).execute()
-        product_id = result.data[0]["id"]
-
-        # Insert alternatives
-        for alt in data["Alternatives"]:
-            # Process alternative nutrients
-            alt_nutrients = alt["Health_Information"]["Nutrients"]
-            if isinstance(alt_nutrients, str):
-                try:
-                    alt_nutrients = json.loads(alt_nutrients)
-                except json.JSONDecodeError:
-                    alt_nutrients = {}
-
-            # Process alternative ingredients
-            alt_ingredients = alt["Health_Information"]["Ingredients"]
-            if isinstance(alt_ingredients, str):
-                try:
-                    alt_ingredients = json.loads(alt_ingredients)
-                except json.JSONDecodeError:
-                    alt_ingredients = []
-            if not isinstance(alt_ingredients, list):
-                alt_ingredients = [str(alt_ingredients)]
-
-            alternative_data = {
-                "product_id": product_id,
-                "alternative_name": alt["Name"],
-                "health_nutrients": json.dumps(alt_nutrients),
-                "health_ingredients": json.dumps(alt_ingredients),
-                "health_index": float(str(alt["Health_Information"]["Health_index"]).replace("$", "").strip() or "4.0"),
-                "sustainability_biodegradable": alt["Sustainability_Information"]["Biodegradable"],
-                "sustainability_recyclable": alt["Sustainability_Information"]["Recyclable"],
-                "sustainability_rating": float(str(alt["Sustainability_Information"]["Sustainability_rating"]).replace("$", "").strip() or "4.0"),
-                "price": float(str(alt["Price"]).replace("$", "").strip() or "9.99"),
-                "reliability_index": float(str(alt["Reliability_index"]).replace("$", "").strip() or "4.0")
-            }
-            supabase.table("product_alternatives").insert(alternative_data).execute()
+        if write_queue is not None:
+            # The id is assigned now; the rows reach the database shortly after
+            product_id = await upstream.offload(write_queue.enqueue, product_name, data)
+            return {"product_id": product_id, "status": "queued"}
 
+        # One insert for the product and one batched insert for its alternatives
+        product_id = await upstream.offload(product_store.save_product, product_name, data)
         return {"product_id": product_id, "status": "success"}
 
     except Exception as e:
         print(f"Save error details: {str(e)}")
         raise Exception(f"Database error: {str(e)}")
 
+async def save_many_to_supabase(entries: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    """Save several (product_name, data) analyses in one bulk write."""
+    try:
+        if write_queue is not None:
+            product_ids = await upstream.offload(write_queue.enqueue_many, entries)
+            return {"product_ids": product_ids, "status": "queued"}
+
+        product_ids = [new_product_id() for _ in entries]
+        await upstream.offload(product_store.save_products,
+                               [(product_id, name, data) for product_id, (name, data) in zip(product_ids, entries)])
+        return {"product_ids": product_ids, "status": "success"}
+
+    except Exception as e:
+        print(f"Bulk save error details: {str(e)}")
+        raise Exception(f"Database error: {str(e)}")
+
+async def wait_until_saved(product_id: str) -> None:
+    """Wait for a queued save to reach the product store, so the caller can read the row at once."""
+    if write_queue is not None and not await upstream.offload(write_queue.wait_written, [product_id],
+                                                              WRITE_CONFIRM_TIMEOUT):
+        raise Exception(f"Database error: product {product_id} has not been saved yet")
+
+async def lookup_product(product_name: str, on_section=None) -> Dict[str, Any]:
+    """Analyze and save a product once across all concurrent lookups of it.
+
+    Requests that arrive while the same product is in flight, streamed or
+    not, wait for the leader's result. on_section only sees the model's
+    reply when this request leads.
+    """
+    async def lead() -> Dict[str, Any]:
+        # A leader that finished just before this one started has already cached the analysis
+        cached = await upstream.offload(product_cache.get, product_name)
+        if cached is not None:
+            return {**cached, "cached": True}
+        return await fetch_and_save(product_name, on_section)
+
+    return await product_lookups.do(normalize_product_key(product_name), lead)
+
+async def analyze_and_save(product_name: str) -> Dict[str, Any]:
+    """Return the stored analysis for a product, calling the model only on a cache miss.
+
+    Returns once the product row is in the store, even with write-behind on.
+    """
+    cached = await upstream.offload(product_cache.get, product_name)
+    if cached is not None:
+        print("\nCache hit:", product_name)
+        # The entry may come from a streamed or batch lookup whose save is still queued
+        await wait_until_saved(cached["product_id"])
+        return {**cached, "cached": True}
+
+    try:
+        result = await lookup_product(product_name)
+    except ModelUnavailableError:
+        # Better an outdated analysis than none while the model API is degraded
+        stale = await upstream.offload(product_cache.get_stale, product_name)
+        if stale is None:
+            raise
+        print("\nServing stale cache entry:", product_name)
+        result = {**stale, "cached": True, "stale": True}
+    await wait_until_saved(result["product_id"])
+    return result
+
+async def fetch_and_save(product_name: str, on_section=None) -> Dict[str, Any]:
+    """Call the model, clean the result, save it and populate the cache."""
+    # Get product information from OpenAI API
+    raw_info = await call_openai_api(product_name, on_section=on_section)
+    print("\nRaw info:", raw_info)
+
+    # Clean and validate the JSON structure
+    cleaned_data = clean_json_structure(raw_info, product_name)
+    print("\nCleaned data:", cleaned_data)
+
+    # Save to Supabase
+    result = await save_to_supabase(product_name, cleaned_data)
+    print("\nSave result:", result)
+
+    entry = {"product_id": result["product_id"], "data": cleaned_data}
+    await upstream.offload(product_cache.set, product_name, entry)
+    return {**entry, "cached": False}
+
+async def stream_product_analysis(product_name: str, emit) -> None:
+    """Emit the product section, each alternative as it completes, then the saved result."""
+    cached = await upstream.offload(product_cache.get, product_name)
+    if cached is not None:
+        print("\nCache hit:", product_name)
+        emit_analysis(emit, product_name, cached["data"])
+        emit(done_event(cached["product_id"], cached["data"], cached=True))
+        return
+
+    fields, alternatives = {}, []
+    product_sent = False
+
+    def send_product():
+        nonlocal product_sent
+        if not product_sent:
+            product_sent = True
+            emit({"event": "product", "product_name": product_name, "data": clean_product_fields(fields)})
+
+    def on_section(path, value):
+        if len(path) == 1:
+            fields[path[0]] = value
+            if all(key in fields for key in MAIN_PRODUCT_FIELDS):
+                send_product()
+        elif isinstance(value, dict) and len(alternatives) < ALTERNATIVE_COUNT:
+            # In a single reply the model has moved on to the alternatives, so the main product is complete
+            if not PRODUCT_FANOUT:
+                send_product()
+            alternatives.append(clean_alternative(value))
+            emit({"event": "alternative", "index": len(alternatives) - 1, "data": alternatives[-1]})
+
+    try:
+        result = await lookup_product(product_name, on_section=on_section)
+    except ModelUnavailableError:
+        stale = await upstream.offload(product_cache.get_stale, product_name)
+        # Events already sent cannot be replaced with the stale analysis
+        if stale is None or product_sent or alternatives:
+            raise
+        print("\nServing stale cache entry:", product_name)
+        emit_analysis(emit, product_name, stale["data"])
+        emit({**done_event(stale["product_id"], stale["data"], cached=True), "stale": True})
+        return
+
+    cleaned_data = result["data"]
+    if fields or alternatives:
+        # This request led the lookup: finish the sections the model has not streamed yet
+        send_product()
+        for index in range(len(alternatives), ALTERNATIVE_COUNT):
+            emit({"event": "alternative", "index": index, "data": cleaned_data["Alternatives"][index]})
+    else:
+        # Another request's lookup (or its cached result) answered this one
+        emit_analysis(emit, product_name, cleaned_data)
+    emit(done_event(result["product_id"], cleaned_data, cached=result["cached"]))
+
+async def fetch_group(product_names: List[str]) -> Dict[str, Any]:
+    """Ask for a group of products in one model call; names the model skipped or renamed map to None."""
+    try:
+        reply = await request_json(batch_messages(product_names), BATCH_RESPONSE_FORMAT, item_keys=("Products",))
+    except ModelUnavailableError as e:
+        print(f"OpenAI API unavailable: {str(e)}")
+        raise
+    except Exception as e:
+        print(f"OpenAI API Error details: {str(e)}")
+        raise Exception(f"OpenAI API Error: {str(e)}")
+    return match_group_results(product_names, reply.get("Products", []), "Product", normalize_product_key)
+
+async def fetch_and_save_many(product_names: List[str]) -> Dict[str, Any]:
+    """Analyze products in grouped model calls and save them in one bulk write.
+
+    Returns a lookup result like fetch_and_save's, or the exception that
+    failed it, for each name.
+    """
+    # Leaders that finished just before these lookups started have already cached some of them
+    cached = await upstream.offload(lambda: {name: product_cache.get(name) for name in product_names})
+    outcomes = {name: {**cached[name], "cached": True} for name in product_names if cached[name] is not None}
+    misses = [name for name in product_names if cached[name] is None]
+
+    groups = chunked(misses, BATCH_GROUP_SIZE)
+    replies = await gather_bounded([lambda group=group: fetch_group(group) for group in groups], BATCH_CONCURRENCY)
+
+    analyzed, unmatched = [], []
+    for group, reply in zip(groups, replies):
+        for name in group:
+            if isinstance(reply, Exception):
+                outcomes[name] = reply
+            elif reply[name] is None:
+                unmatched.append(name)
+            else:
+                analyzed.append((name, clean_json_structure(reply[name], name)))
+
+    # Products the grouped reply skipped or renamed are asked for one at a time
+    retries = await gather_bounded([lambda name=name: call_openai_api(name) for name in unmatched], BATCH_CONCURRENCY)
+    for name, reply in zip(unmatched, retries):
+        if isinstance(reply, Exception):
+            outcomes[name] = reply
+        else:
+            analyzed.append((name, clean_json_structure(reply, name)))
+
+    if not analyzed:
+        return outcomes
+    try:
+        saved = await save_many_to_supabase(analyzed)
+    except Exception as e:
+        outcomes.update((name, e) for name, _ in analyzed)
+        return outcomes
+
+    entries = {name: {"product_id": product_id, "data": data}
+               for (name, data), product_id in zip(analyzed, saved["product_ids"])}
+    await upstream.offload(lambda: [product_cache.set(name, entry) for name, entry in entries.items()])
+    outcomes.update((name, {**entry, "cached": False}) for name, entry in entries.items())
+    return outcomes
+
+async def analyze_batch(product_names: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Return a result for each of several distinct product names.
+
+    Cache hits are answered without a model call. Misses join lookups of
+    the same products already in flight; the rest are asked for
+    BATCH_GROUP_SIZE at a time with at most BATCH_CONCURRENCY calls in
+    flight, and all new analyses are saved in one bulk write. A failed group
+    only fails its own products, which fall back to stale cache entries
+    when the model API is unavailable.
+    """
+    cached = await upstream.offload(lambda: {name: product_cache.get(name) for name in product_names})
+    results, misses = {}, {}
+    for name in product_names:
+        if cached[name] is not None:
+            results[name] = {"status": "cached", **cached[name]}
+        else:
+            misses[normalize_product_key(name)] = name
+
+    async def lead(keys: List[str]) -> Dict[str, Any]:
+        outcomes = await fetch_and_save_many([misses[key] for key in keys])
+        return {key: outcomes[misses[key]] for key in keys}
+
+    outcomes = await product_lookups.do_many(list(misses), lead) if misses else {}
+
+    stale = {}
+    if any(isinstance(outcome, ModelUnavailableError) for outcome in outcomes.values()):
+        stale = await upstream.offload(lambda: {name: product_cache.get_stale(name) for name in misses.values()})
+
+    # Saves are queued rather than written when write-behind is on
+    saved_status = "queued" if write_queue is not None else "success"
+    for key, name in misses.items():
+        outcome = outcomes[key]
+        if isinstance(outcome, ModelUnavailableError) and stale.get(name) is not None:
+            results[name] = {"status": "stale", **stale[name]}
+        elif isinstance(outcome, Exception):
+            results[name] = {"status": "error", "error": str(outcome)}
+        else:
+            results[name] = {"status": "cached" if outcome["cached"] else saved_status,
+                             "product_id": outcome["product_id"], "data": outcome["data"]}
+    return results
+
+def emit_analysis(emit, product_name: str, data: Dict[str, Any]) -> None:
+    """Replay a finished analysis as product and alternative events."""
+    emit({"event": "product", "product_name": product_name,
+          "data": {key: value for key, value in data.items() if key != "Alternatives"}})
+    for index, alternative in enumerate(data["Alternatives"]):
+        emit({"event": "alternative", "index": index, "data": alternative})
+
+def done_event(product_id: str, data: Dict[str, Any], cached: bool) -> Dict[str, Any]:
+    return {
+        "event": "done",
+        "status": "success",
+        "product_id": product_id,
+        "data": data,
+        "cached": cached,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
 async def delete_all_data() -> Dict[str, Any]:
     """Delete all data from the database tables."""
     try:
-        # First count the records that will be deleted
-        alternatives_count = supabase.table("product_alternatives").select("id", count="exact").execute()
-        products_count = supabase.table("product_information").select("id", count="exact").execute()
-        
-        # Delete all records using proper conditions for UUID columns
-        alternatives_result = supabase.table("product_alternatives").delete().gte('id', '00000000-0000-0000-0000-000000000000').execute()
-        products_result = supabase.table("product_information").delete().gte('id', '00000000-0000-0000-0000-000000000000').execute()
-        
+        # Let queued saves land first so they are not written after the delete
+        if write_queue is not None and not await upstream.offload(write_queue.flush, 30):
+            raise TimeoutError("Queued saves are still being written; nothing was deleted")
+        deleted_alternatives, deleted_products = await upstream.offload(product_store.delete_all)
+
         return {
             "status": "success",
-            "deleted_alternatives": alternatives_count.count if hasattr(alternatives_count, 'count') else 0,
-            "deleted_products": products_count.count if hasattr(products_count, 'count') else 0
+            "deleted_alternatives": deleted_alternatives,
+            "deleted_products": deleted_products
         }
+    except TimeoutError:
+        raise
     except Exception as e:
         print(f"Detailed error: {str(e)}")
         raise Exception(f"Database deletion error: {str(e)}")
 
+def model_unavailable_response(error: ModelUnavailableError):
+    """503 telling the client when the model API is worth trying again."""
+    response = jsonify({
+        "status": "error",
+        "error": str(error),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+    response.status_code = 503
+    if error.retry_after is not None:
+        response.headers["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
     
 class VisionProcessView(MethodView):
     async def get(self):
         """
-        Endpoint to process vision data from JSON file and store in database.
-        Simply reads product name from vision_output.json and processes it.
+        Endpoint to process vision data and store in database.
+        Uses the latest detection pushed by the vision service, falling back
+        to vision_output.json when the event stream is not connected.
+        The product row is in the database by the time this answers, so the
+        returned product_id can be read straight away.
         """
         try:
-            # Read product name from vision process file
-            product_name = read_vision_process_file()
+            # Read the latest detected product name
+            detection = read_latest_detection(request.args.get('session_id'))
+            product_name = detection["product_name"]
             print("\nProduct name from vision:", product_name)
             
-            # Get product information from OpenAI API
-            raw_info = call_openai_api(product_name)
-            print("\nRaw API info:", raw_info)
-            
-            # Clean and validate the JSON structure
-            cleaned_data = clean_json_structure(raw_info, product_name)
-            print("\nCleaned data:", cleaned_data)
-            
-            # Save to Supabase
-            result = await save_to_supabase(product_name, cleaned_data)
-            print("\nSave result:", result)
+            # Analyze (or reuse a cached analysis) and save
+            result = await analyze_and_save(product_name)
             
             return jsonify({
                 "status": "success",
                 "message": "Vision data successfully processed and saved",
                 "product_id": result["product_id"],
-                "data": cleaned_data,
+                "data": result["data"],
+                "cached": result["cached"],
+                "stale": result.get("stale", False),
                 "product_name": product_name,
+                "detection_seq": detection.get("seq"),
                 "timestamp": datetime.utcnow().isoformat()
             })
             
@@ -398,6 +824,8 @@ class VisionProcessView(MethodView):
                 "error": str(e),
                 "timestamp": datetime.utcnow().isoformat()
             }), 400
+        except ModelUnavailableError as e:
+            return model_unavailable_response(e)
         except Exception as e:
             print(f"Error details: {str(e)}")
             return jsonify({
@@ -421,27 +849,31 @@ async def fetch_product():
                 "status": "error",
                 "error": "Product name is required"
             }), 400
+
+        stream_mode = requested_stream_mode(data.get('stream'), request.headers.get('Accept', ''))
+        if stream_mode:
+            # Sections are sent as soon as the model has written them
+            return Response(
+                encode_events(upstream.stream(lambda emit: stream_product_analysis(product_name, emit)), stream_mode),
+                mimetype=STREAM_MIMETYPES[stream_mode],
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
-        # Get product information from OpenAI API
-        raw_info = call_openai_api(product_name)
-        print("\nRaw info:", raw_info)
-        
-        # Clean and validate the JSON structure
-        cleaned_data = clean_json_structure(raw_info, product_name)
-        print("\nCleaned data:", cleaned_data)
-        
-        # Save to Supabase
-        result = await save_to_supabase(product_name, cleaned_data)
-        print("\nSave result:", result)
+        # Analyze (or reuse a cached analysis) and save
+        result = await analyze_and_save(product_name)
         
         return jsonify({
             "status": "success",
             "message": "Data successfully processed and saved to Supabase",
             "product_id": result["product_id"],
-            "data": cleaned_data,
+            "data": result["data"],
+            "cached": result["cached"],
+            "stale": result.get("stale", False),
             "timestamp": datetime.utcnow().isoformat()
         })
-        
+
+    except ModelUnavailableError as e:
+        return model_unavailable_response(e)
     except Exception as e:
         print(f"Error details: {str(e)}")
         return jsonify({
@@ -450,6 +882,49 @@ async def fetch_product():
             "timestamp": datetime.utcnow().isoformat()
         }), 500
         
+@app.route('/fetch_products', methods=['POST'])
+async def fetch_products():
+    """Endpoint to analyze a list of products at once, e.g. a whole cart or receipt."""
+    try:
+        data = request.get_json(silent=True) or {}
+        product_names = data.get('product_names')
+
+        if (not isinstance(product_names, list) or not product_names
+                or not all(isinstance(name, str) and name.strip() for name in product_names)):
+            return jsonify({
+                "status": "error",
+                "error": "product_names must be a non-empty list of product names"
+            }), 400
+        if len(product_names) > MAX_BATCH_ITEMS:
+            return jsonify({
+                "status": "error",
+                "error": f"At most {MAX_BATCH_ITEMS} products can be analyzed per request"
+            }), 400
+
+        # Repeated names (after normalization) are analyzed once and reported for every occurrence
+        unique_names, keys = dedupe(product_names, normalize_product_key)
+        results = await analyze_batch(unique_names)
+        by_key = {normalize_product_key(name): results[name] for name in unique_names}
+        items = [{"product_name": name, **by_key[key]} for name, key in zip(product_names, keys)]
+
+        failed = sum(1 for name in unique_names if results[name]["status"] == "error")
+        status = "success" if not failed else "partial" if failed < len(unique_names) else "error"
+        return jsonify({
+            "status": status,
+            "items": items,
+            "unique_products": len(unique_names),
+            "failed": failed,
+            "timestamp": datetime.utcnow().isoformat()
+        }), 500 if status == "error" else 200
+
+    except Exception as e:
+        print(f"Error details: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "error": str(e),
+            "timestamp": datetime.utcnow().isoformat()
+        }), 500
+
 @app.route('/delete_all', methods=['DELETE'])
 async def delete_all_data_route():
     """
@@ -475,6 +950,8 @@ async def delete_all_data_route():
         
         # Perform deletion
         result = await delete_all_data()
+        # Cached entries would point at deleted product ids
+        await upstream.offload(product_cache.clear)
             
         return jsonify({
             "status": "success",
@@ -485,7 +962,15 @@ async def delete_all_data_route():
                 "products_deleted": result["deleted_products"]
             }
         }), 200
-            
+
+    except TimeoutError as e:
+        response = jsonify({
+            "status": "error",
+            "error": str(e)
+        })
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
     except Exception as e:
         print(f"Request error: {str(e)}")
         return jsonify({
@@ -494,6 +979,39 @@ async def delete_all_data_route():
             "details": str(e)
         }), 400
 
+@app.route('/write_queue/requeue', methods=['POST'])
+def requeue_failed_writes():
+    """
+    Put dead-lettered saves back into the write queues, e.g. after a migration.
+    Requires the same Bearer token as /delete_all.
+    """
+    if request.headers.get('Authorization') != f"Bearer {os.getenv('SUPABASE_KEY')}":
+        return jsonify({
+            "status": "error",
+            "error": "Invalid authentication credentials"
+        }), 401
+
+    requeued = {
+        "write_queue": write_queue.requeue_failed() if write_queue is not None else 0,
+        "upstream_sync": product_store.sync_queue.requeue_failed()
+        if isinstance(product_store, SyncedProductRepository) else 0
+    }
+    return jsonify({
+        "status": "success",
+        "requeued": requeued,
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Report product analysis cache and request coalescing counters."""
+    return jsonify({
+        "status": "success",
+        "cache": product_cache.get_stats(),
+        "single_flight": product_lookups.get_stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
@@ -502,12 +1020,15 @@ def health_check():
     """
     try:
         # Test database connection
-        supabase.table("product_information").select("id").limit(1).execute()
+        product_store.ping()
         
         return jsonify({
             "status": "healthy",
             "service": "online",
             "database": "connected",
+            "write_queue": write_queue.get_stats() if write_queue is not None else None,
+            "upstream_sync": product_store.get_sync_stats() if isinstance(product_store, SyncedProductRepository) else None,
+            "model": model_client.get_stats(),
             "timestamp": datetime.utcnow().isoformat(),
             "version": "1.0.0",
             "environment": os.getenv('FLASK_ENV', 'production')
@@ -560,6 +1081,13 @@ if __name__ == '__main__':
     config = Config()
     config.bind = [f"0.0.0.0:{5005}"]
     config.use_reloader = os.getenv('FLASK_ENV', 'production') == 'development'
-    
-    asgi_app = WsgiToAsgi(app)
-    asyncio.run(serve(asgi_app, config))
+
+    async def run_server():
+        # Hypercorn runs WSGI requests on the loop's default executor; size it
+        # so slow lookups don't queue behind each other
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=int(os.getenv('REQUEST_WORKERS', 64)))
+        )
+        await serve(app, config, mode="wsgi")
+
+    asyncio.run(run_server())
@@ -0,0 +1,360 @@
+# json_stream.py
+import json
+import re
+from json.decoder import scanstring
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+WHITESPACE = " \t\r\n"
+STREAM_MIMETYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+# A number as the model writes it: "4", "4.5", "4.", ".5" or "1e3"; product_validation
+# reads numbers out of text with the same pattern, so both agree on what a number is
+NUMBER_PATTERN = re.compile(r'-?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?')
+# A number at the start of a bare token such as "4.5 g", "$12.99" or "3/5"
+NUMBER_PREFIX = re.compile(r'\$?\s*(' + NUMBER_PATTERN.pattern + ')')
+BARE_LITERALS = {"true": True, "false": False, "null": None, "none": None}
+BARE_TERMINATORS = ",}]\n"
+MISSING = object()
+
+
+class _TolerantParser:
+    """Recursive-descent JSON parser that repairs common model output defects.
+
+    Accepts trailing and repeated commas, single-quoted strings, bare words
+    and numbers with units (4.5 g -> 4.5), Python-style literals, and
+    truncated input, where open strings and containers are closed and a key
+    without a value is dropped.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.i = 0
+        self.n = len(text)
+
+    def skip_ws(self):
+        while self.i < self.n and self.text[self.i] in WHITESPACE:
+            self.i += 1
+
+    def value(self) -> Any:
+        self.skip_ws()
+        if self.i >= self.n:
+            return MISSING
+        ch = self.text[self.i]
+        if ch == "{":
+            return self.object()
+        if ch == "[":
+            return self.array()
+        if ch in "\"'":
+            return self.string()
+        return self.bare()
+
+    def object(self) -> Dict[str, Any]:
+        self.i += 1
+        result = {}
+        while True:
+            self.skip_ws()
+            if self.i >= self.n:
+                return result
+            ch = self.text[self.i]
+            if ch == "}":
+                self.i += 1
+                return result
+            if ch == ",":
+                self.i += 1
+                continue
+            if ch in "\"'":
+                key = self.string()
+            else:
+                start = self.i
+                while self.i < self.n and self.text[self.i] not in ":,}":
+                    self.i += 1
+                key = self.text[start:self.i].strip()
+            self.skip_ws()
+            if self.i >= self.n or self.text[self.i] != ":":
+                if self.i >= self.n:
+                    return result
+                continue
+            self.i += 1
+            value = self.value()
+            if value is not MISSING:
+                result[str(key)] = value
+
+    def array(self) -> List[Any]:
+        self.i += 1
+        result = []
+        while True:
+            self.skip_ws()
+            if self.i >= self.n:
+                return result
+            ch = self.text[self.i]
+            if ch == "]":
+                self.i += 1
+                return result
+            if ch == ",":
+                self.i += 1
+                continue
+            value = self.value()
+            if value is not MISSING:
+                result.append(value)
+
+    def string(self) -> str:
+        quote = self.text[self.i]
+        if quote == '"':
+            try:
+                value, self.i = scanstring(self.text, self.i + 1)
+                return value
+            except json.JSONDecodeError:
+                pass
+        # Single-quoted, unterminated or badly escaped: read up to the closing quote
+        start = self.i + 1
+        end = start
+        while end < self.n and not (self.text[end] == quote and self.text[end - 1] != "\\"):
+            end += 1
+        self.i = min(end + 1, self.n)
+        return self.text[start:end].replace("\\" + quote, quote)
+
+    def bare(self) -> Any:
+        start = self.i
+        while self.i < self.n and self.text[self.i] not in BARE_TERMINATORS:
+            self.i += 1
+        token = self.text[start:self.i].strip()
+        if self.i < self.n and self.text[self.i] == "\n":
+            self.i += 1
+        lowered = token.lower()
+        if lowered in BARE_LITERALS:
+            return BARE_LITERALS[lowered]
+        match = NUMBER_PREFIX.match(token)
+        if match:
+            number = match.group(1)
+            return float(number) if any(c in number for c in ".eE") else int(number)
+        return token if token else MISSING
+
+
+def parse_tolerant(text: str) -> Any:
+    """Parse JSON text, repairing defects instead of failing where possible."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    start = text.find("{")
+    parser = _TolerantParser(text[start:] if start >= 0 and not text.lstrip().startswith("[") else text.strip())
+    value = parser.value()
+    if value is MISSING:
+        raise ValueError("No JSON value found")
+    return value
+
+
+class JsonSectionScanner:
+    """Finds completed sections of a JSON object while it is still streaming in.
+
+    feed() scans each new character once, tracking string and nesting
+    state, and returns (path, value) pairs for every top-level field whose
+    value has just closed, e.g. (("Price",), 4.99). Elements of the arrays
+    named in `item_keys` are reported individually as they close, e.g.
+    (("Alternatives", 0), {...}), so callers can act on each alternative
+    before the rest of the response arrives. Text before the first "{"
+    (such as a markdown fence) is ignored. Each section is parsed with
+    parse_tolerant; sections beyond repair are skipped.
+    """
+
+    def __init__(self, item_keys: Tuple[str, ...] = ("Alternatives",)):
+        self.item_keys = item_keys
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.state = "start"  # start, key, colon, value, scalar, after_value, done
+        self.key: Optional[str] = None
+        self.value_start = 0
+        self.item_start: Optional[int] = None
+        self.item_index = 0
+
+    @property
+    def current_key(self) -> Optional[str]:
+        """The top-level key whose value is being streamed, if any."""
+        return self.key if self.state in ("value", "scalar") or self.depth > 1 else None
+
+    def _section(self, start: int, end: int) -> Tuple[bool, Any]:
+        try:
+            return True, parse_tolerant(self.text[start:end])
+        except ValueError:
+            return False, None
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple[Any, ...], Any]]:
+        """Consume more text and return the sections it completed."""
+        self.text += chunk
+        found = []
+        text = self.text
+        for i in range(self.pos, len(text)):
+            ch = text[i]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.state == "key":
+                        ok, self.key = self._section(self.string_start, i + 1)
+                        self.state = "colon"
+                    elif self.depth == 1 and self.state == "value":
+                        ok, value = self._section(self.value_start, i + 1)
+                        if ok:
+                            found.append(((self.key,), value))
+                        self.state = "after_value"
+                continue
+
+            if self.state == "done":
+                break
+            if self.state == "start":
+                if ch == "{":
+                    self.depth = 1
+                    self.state = "key"
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+                if self.depth == 1 and self.state == "value":
+                    self.value_start = i
+                continue
+
+            if self.depth == 1:
+                if self.state == "colon":
+                    if ch == ":":
+                        self.state = "value"
+                    continue
+                if self.state == "value":
+                    if ch in WHITESPACE:
+                        continue
+                    self.value_start = i
+                    if ch in "{[":
+                        self.depth += 1
+                        self.item_start = None
+                        self.item_index = 0
+                    else:
+                        self.state = "scalar"
+                    continue
+                if self.state == "scalar" and ch in ",}":
+                    ok, value = self._section(self.value_start, i)
+                    if ok:
+                        found.append(((self.key,), value))
+                    self.state = "after_value"
+                if ch == ",":
+                    self.state = "key"
+                elif ch == "}":
+                    self.depth = 0
+                    self.state = "done"
+                continue
+
+            # Inside a top-level container value
+            in_items = self.depth == 2 and self.key in self.item_keys
+            if ch in "{[":
+                if in_items:
+                    self.item_start = i
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 2 and self.key in self.item_keys and self.item_start is not None:
+                    ok, value = self._section(self.item_start, i + 1)
+                    if ok:
+                        found.append(((self.key, self.item_index), value))
+                    self.item_index += 1
+                    self.item_start = None
+                elif self.depth == 1:
+                    # Item arrays were already reported element by element
+                    if not (self.key in self.item_keys and text[self.value_start] == "["):
+                        ok, value = self._section(self.value_start, i + 1)
+                        if ok:
+                            found.append(((self.key,), value))
+                    self.state = "after_value"
+        self.pos = len(text)
+        return found
+
+
+class IncrementalJsonParser:
+    """Builds a model's JSON object section by section as text streams in.
+
+    feed() returns the (path, value) sections completed by each chunk, so
+    callers can validate and forward them immediately; finish() returns the
+    whole object without parsing the text again. Output cut off mid-way
+    keeps every completed section plus a repaired version of the last one.
+    """
+
+    def __init__(self, item_keys: Tuple[str, ...] = ("Alternatives",),
+                 on_section: Optional[Callable[[Tuple[Any, ...], Any], None]] = None):
+        self.scanner = JsonSectionScanner(item_keys)
+        self.on_section = on_section
+        self.result: Dict[str, Any] = {}
+
+    def _add(self, path, value):
+        if len(path) == 1:
+            self.result[path[0]] = value
+        else:
+            self.result.setdefault(path[0], []).append(value)
+        if self.on_section is not None:
+            self.on_section(path, value)
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple[Any, ...], Any]]:
+        sections = self.scanner.feed(chunk)
+        for path, value in sections:
+            self._add(path, value)
+        return sections
+
+    def finish(self) -> Dict[str, Any]:
+        """Return the parsed object, repairing a truncated final section."""
+        scanner = self.scanner
+        if scanner.state == "start":
+            raise ValueError("No JSON object found in model output")
+        if scanner.state != "done" and scanner.key is not None:
+            in_items = scanner.key in scanner.item_keys and scanner.text[scanner.value_start:scanner.value_start + 1] == "["
+            if in_items and scanner.depth > 2 and scanner.item_start is not None:
+                value = parse_tolerant(scanner.text[scanner.item_start:])
+                if value:
+                    self._add((scanner.key, scanner.item_index), value)
+            elif not in_items and (scanner.state in ("value", "scalar") or scanner.depth > 1):
+                try:
+                    self._add((scanner.key,), parse_tolerant(scanner.text[scanner.value_start:]))
+                except ValueError:
+                    pass
+            scanner.state = "done"
+        return self.result
+
+    @classmethod
+    def parse(cls, text: str, **kwargs) -> Dict[str, Any]:
+        """Parse a complete (or truncated) response in one call."""
+        parser = cls(**kwargs)
+        parser.feed(text)
+        return parser.finish()
+
+
+def encode_event(event: dict, mode: str) -> str:
+    """Frame a streaming event as a server-sent event or an NDJSON line."""
+    if mode == "sse":
+        return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
+
+def requested_stream_mode(value: Any, accept: str = "") -> Optional[str]:
+    """Map a request's stream flag or Accept header to 'sse', 'ndjson' or None."""
+    if isinstance(value, str) and value.lower() in STREAM_MIMETYPES:
+        return value.lower()
+    if value is True or (isinstance(value, str) and value.lower() in ("1", "true", "yes")):
+        return "sse" if "text/event-stream" in accept else "ndjson"
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return None
+
+
+def encode_events(events: Iterator[dict], mode: str) -> Iterator[str]:
+    """Frame an event iterator, turning a failure part-way into a final error event."""
+    try:
+        for event in events:
+            yield encode_event(event, mode)
+    except Exception as e:
+        yield encode_event({"event": "error", "status": "error", "error": str(e)}, mode)
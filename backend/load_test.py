@@ -0,0 +1,391 @@
+# load_test.py
+"""Concurrent load test for infoBot / urlBot against a local stub model and database.
+
+The stub answers OpenAI chat completions and Supabase REST inserts after a
+fixed delay, so the measured throughput reflects how many upstream calls
+the service keeps in flight rather than real model latency.
+
+Examples:
+    python load_test.py --service infobot --requests 40 --concurrency 20
+    python load_test.py --service urlbot --model-delay 1.0
+    python load_test.py --service infobot --requests 4 --batch-size 30
+    MODEL_RPM=300 python load_test.py --service infobot --quota-rps 5
+    python load_test.py --service infobot --stream --model-delay 3.0
+    PRODUCT_FANOUT=1 python load_test.py --service infobot --model-delay 3.0
+    python load_test.py --service infobot --requests 200 --distinct 20 --baseline
+
+--baseline starts the service with request coalescing, the result caches
+and write-behind turned off (BASELINE_ENV), so the same command run with
+and without it shows what they save. --distinct repeats products the way
+a busy shelf does; without it every product is unique and only
+write-behind can help.
+
+Recorded with the default delays (0.5s model, 0.02s db), --requests 200
+--concurrency 20 --distinct 20 unless noted. Baseline throughput is held
+near 8.3 req/s by the shared model limit (MODEL_RPM=500):
+
+    run                                    req/s   p50 ms   p95 ms   model calls
+    infobot --baseline                      8.54     2391     2450           200
+    infobot                                84.16       79     1035            20
+    urlbot --baseline                       8.54     2390     2430           200
+    urlbot                                 15.24     1089     1932           114
+    infobot --requests 10 --concurrency 5
+      --batch-size 20 --distinct 50
+      --baseline                            1.21     3614     4605            40
+      (default)                             2.24      979     4446            10
+
+/analyze_url only coalesces URLs that are in flight and does not read
+url_results, so repeated URLs still reach the model once the first
+analysis has finished.
+"""
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICES = {
+    "infobot": {"script": "infoBot.py", "port": 5005},
+    "urlbot": {"script": "urlBot.py", "port": 5008},
+}
+
+# Service settings for --baseline: every lookup calls the model and writes synchronously
+BASELINE_ENV = {
+    "COALESCE_REQUESTS": "0",
+    "WRITE_BEHIND": "0",
+    "PRODUCT_CACHE_TTL": "0",
+    "PRODUCT_CACHE_STALE_TTL": "0",
+    "SECTION_CACHE_TTL": "0",
+    "URL_CACHE_TTL": "0",
+    "URL_CACHE_STALE_TTL": "0",
+}
+
+# A JWT-shaped placeholder; supabase-py only checks the format
+STUB_SUPABASE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.c3R1Yg"
+
+SAMPLE_PRODUCT = {
+    "product_name": "Stub Sparkling Water",
+    "Health_Information": {
+        "Nutrients": {"Calories": "0 kcal", "Sodium": "10 mg"},
+        "Ingredients": ["water", "carbon dioxide"],
+        "Health_index": 4.5
+    },
+    "Sustainability_Information": {"Biodegradable": "No", "Recyclable": "Yes", "Sustainability_rating": 3.5},
+    "Price": 1.99,
+    "Reliability_index": 4.2,
+    "Color_of_the_dustbin": "blue",
+    "Alternatives": [
+        {
+            "Name": f"Stub Alternative {i}",
+            "Brand": "Stub",
+            "Health_Information": {"Nutrients": {}, "Ingredients": ["water"], "Health_index": 4.6},
+            "Sustainability_Information": {"Biodegradable": "Yes", "Recyclable": "Yes", "Sustainability_rating": 4.5},
+            "Price": 2.49,
+            "Reliability_index": 4.3,
+            "Key_Differences": "Glass bottle"
+        }
+        for i in range(1, 4)
+    ]
+}
+
+
+def stub_reply(request_body):
+    """Answer with the part of the sample product that the prompt's format asks for."""
+    prompt = request_body["messages"][-1]["content"]
+    if '"Products"' in prompt:
+        listed = [line.strip()[2:] for line in prompt.splitlines() if line.strip().startswith("- ")]
+        return {"Products": [{"Product": item, "url": item, **SAMPLE_PRODUCT} for item in listed]}
+    if '"Alternatives"' in prompt:
+        return SAMPLE_PRODUCT
+    if '"Key_Differences"' in prompt:
+        return SAMPLE_PRODUCT["Alternatives"][0]
+    return {key: value for key, value in SAMPLE_PRODUCT.items() if f'"{key}"' in prompt}
+
+
+class StubUpstream:
+    """Threaded HTTP server standing in for the OpenAI and Supabase APIs."""
+
+    def __init__(self, port, model_delay, db_delay, quota_rps=0):
+        self.model_delay = model_delay
+        self.db_delay = db_delay
+        self.quota_rps = quota_rps
+        self.recent_calls = collections.deque()
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.model_calls = 0
+        self.db_calls = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(stub.db_delay)
+                self.send_json(200, [])
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request_body = json.loads(self.rfile.read(length) or b"null")
+                if self.path.endswith("/chat/completions"):
+                    stub.model_call(self, request_body)
+                else:
+                    stub.db_call(self, request_body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    def over_quota(self):
+        """Apply a requests-per-second quota the way the real API does, with a 429."""
+        now = time.monotonic()
+        with self.lock:
+            while self.recent_calls and now - self.recent_calls[0] >= 1.0:
+                self.recent_calls.popleft()
+            if len(self.recent_calls) >= self.quota_rps:
+                self.rate_limited += 1
+                return True
+            self.recent_calls.append(now)
+            return False
+
+    def model_call(self, handler, request_body):
+        if self.quota_rps and self.over_quota():
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}).encode()
+            handler.send_response(429)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(body)))
+            handler.send_header("Retry-After", "1")
+            handler.end_headers()
+            handler.wfile.write(body)
+            return
+        with self.lock:
+            self.model_calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if request_body.get("stream"):
+                self.stream_completion(handler, request_body)
+                return
+            time.sleep(self.model_delay)
+            handler.send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request_body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": json.dumps(stub_reply(request_body))}
+                }],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+            })
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def stream_completion(self, handler, request_body):
+        """Stream the reply in chunks; the full sample product takes the whole model delay."""
+        content = json.dumps(stub_reply(request_body), indent=2)
+        pieces = [content[i:i + 40] for i in range(0, len(content), 40)]
+        piece_delay = self.model_delay * 40 / len(json.dumps(SAMPLE_PRODUCT, indent=2))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.end_headers()
+        for piece in pieces:
+            time.sleep(piece_delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request_body.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            handler.wfile.flush()
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+        handler.close_connection = True
+
+    def db_call(self, handler, request_body):
+        with self.lock:
+            self.db_calls += 1
+        time.sleep(self.db_delay)
+        rows = request_body if isinstance(request_body, list) else [request_body]
+        handler.send_json(201, [{**(row or {}), "id": str(uuid.uuid4())} for row in rows])
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def wait_for_service(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return True
+        except Exception:
+            time.sleep(0.5)
+    return False
+
+
+def send_request(base_url, service, index, run_id, stream=False, batch_size=0, distinct=0):
+    """Return (ok, total ms, ms until the first streamed event or the full response).
+
+    With distinct > 0, products are drawn from only that many names or URLs,
+    so repeated lookups can be coalesced or served from the cache.
+    """
+    numbers = [index * batch_size + i for i in range(batch_size)] if batch_size else [index]
+    if distinct:
+        numbers = [number % distinct for number in numbers]
+    if batch_size and service == "infobot":
+        path, payload = "/fetch_products", {
+            "product_names": [f"load test product {number} {run_id}" for number in numbers]
+        }
+    elif batch_size:
+        path, payload = "/analyze_urls", {
+            "urls": [f"https://example.com/products/{run_id}/{number}" for number in numbers]
+        }
+    elif service == "infobot":
+        path, payload = "/fetch_product", {"product_name": f"load test product {numbers[0]} {run_id}"}
+    else:
+        path, payload = "/analyze_url", {"url": f"https://example.com/products/{run_id}/{numbers[0]}"}
+    if stream:
+        payload["stream"] = "ndjson"
+    request = urllib.request.Request(
+        base_url + path,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    started = time.perf_counter()
+    first_event = None
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            ok = response.status == 200
+            if stream:
+                last = None
+                for line in response:
+                    if first_event is None:
+                        first_event = time.perf_counter()
+                    last = json.loads(line)
+                ok = ok and last is not None and last["event"] == "done"
+            else:
+                ok = ok and json.loads(response.read()).get("status") == "success"
+    except Exception:
+        ok = False
+    finished = time.perf_counter()
+    return ok, (finished - started) * 1000, ((first_event or finished) - started) * 1000
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a backend service against stub upstreams.")
+    parser.add_argument("--service", choices=SERVICES, default="infobot")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--model-delay", type=float, default=0.5, help="Seconds per stub model call")
+    parser.add_argument("--db-delay", type=float, default=0.02, help="Seconds per stub database call")
+    parser.add_argument("--stub-port", type=int, default=5990)
+    parser.add_argument("--no-spawn", action="store_true", help="Target an already running service")
+    parser.add_argument("--stream", action="store_true", help="Request NDJSON streaming and report time to first event")
+    parser.add_argument("--batch-size", type=int, default=0, help="Products per request, sent to the batch endpoint")
+    parser.add_argument("--quota-rps", type=float, default=0, help="Stub model quota; calls above it get a 429")
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="Draw products from this many distinct names or URLs; 0 makes every one unique")
+    parser.add_argument("--baseline", action="store_true",
+                        help="Start the service without coalescing, result caches or write-behind")
+    args = parser.parse_args()
+
+    service = SERVICES[args.service]
+    base_url = f"http://127.0.0.1:{service['port']}"
+    stub = StubUpstream(args.stub_port, args.model_delay, args.db_delay, args.quota_rps).start()
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+
+    process = None
+    workdir = tempfile.mkdtemp(prefix="shelfaware-load-")
+    if not args.no_spawn:
+        env = dict(
+            os.environ,
+            OPENAI_API_KEY="stub",
+            OPENAI_BASE_URL=f"{stub_url}/v1",
+            SUPABASE_URL=stub_url,
+            SUPABASE_KEY=STUB_SUPABASE_KEY,
+            PRODUCT_CACHE_PATH=os.path.join(workdir, "cache.sqlite3"),
+            URL_CACHE_PATH=os.path.join(workdir, "url_cache.sqlite3"),
+            VISION_EVENTS_URL="http://127.0.0.1:9/events",
+            FLASK_ENV="production"
+        )
+        if args.baseline:
+            env.update(BASELINE_ENV)
+        # Run from a scratch directory so logs and output files stay out of the tree
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), service["script"])],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+    try:
+        if not wait_for_service(base_url + "/health"):
+            sys.exit(f"{args.service} did not come up on {base_url}")
+
+        run_id = uuid.uuid4().hex[:8]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(
+                lambda index: send_request(base_url, args.service, index, run_id, args.stream, args.batch_size,
+                                           args.distinct),
+                range(args.requests)
+            ))
+        elapsed = time.perf_counter() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        stub.stop()
+
+    latencies = [latency for ok, latency, _ in results if ok]
+    first_events = [first for ok, _, first in results if ok]
+    errors = sum(1 for ok, _, _ in results if not ok)
+    print(f"Service: {args.service}{' (baseline)' if args.baseline else ''}, "
+          f"{args.requests} requests at concurrency {args.concurrency}")
+    print(f"Stub model delay {args.model_delay}s, db delay {args.db_delay}s")
+    print(f"Elapsed: {elapsed:.2f}s, throughput: {args.requests / elapsed:.2f} req/s, errors: {errors}")
+    print(f"Latency p50: {percentile(latencies, 50):.0f} ms, p95: {percentile(latencies, 95):.0f} ms")
+    if args.stream:
+        print(f"First event p50: {percentile(first_events, 50):.0f} ms, p95: {percentile(first_events, 95):.0f} ms")
+    print(f"Model calls: {stub.model_calls}, peak concurrent model calls: {stub.peak_in_flight}, "
+          f"db calls: {stub.db_calls}, rate limited: {stub.rate_limited}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,21 @@
-from flask import Flask, jsonify, Response
+from flask import Flask, jsonify, Response, request
 import time
-import json
 import os
 from ultralytics import YOLO
 import easyocr
 from flask_cors import CORS
 import threading
 import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
 import subprocess
 import sys
+import re
+from frame_sources import open_frame_source
+from vision_events import DetectionEventStream, write_json_atomic
+from text_consensus import TextConsensus
 
 app = Flask(__name__)
 CORS(app, resources={
@@ -21,38 +26,399 @@ CORS(app, resources={
     }
 })
 
-class VisionProcessor:
-    def __init__(self):
-        self.FPS_LIMIT = 10
+class FrameRingBuffer:
+    """Small preallocated ring of frames where readers always get the newest.
+
+    The capture thread reads straight into the next free slot, so no
+    per-frame allocation happens once the first frame has fixed the shape.
+    Frames the consumer never picked up are overwritten and counted as
+    dropped instead of queueing up behind a slow inference step.
+    """
+
+    def __init__(self, capacity=3):
+        self.capacity = capacity
+        self.slots = None
+        self.timestamps = [0.0] * capacity
+        self.seq = 0  # Sequence number of the newest committed frame
+        self.cleared_seq = 0  # Frames up to this sequence number were dropped by clear()
+        self.frames_dropped = 0
+        self.condition = threading.Condition()
+
+    def acquire_slot(self):
+        """Return the array the next frame should be read into, if allocated."""
+        with self.condition:
+            if self.slots is None:
+                return None
+            return self.slots[self.seq % self.capacity]
+
+    def commit(self, frame, captured_at):
+        """Publish a frame, copying it only if it was not read into its slot."""
+        with self.condition:
+            if self.slots is None or self.slots[0].shape != frame.shape:
+                self.slots = [np.empty_like(frame) for _ in range(self.capacity)]
+            index = self.seq % self.capacity
+            if frame is not self.slots[index]:
+                np.copyto(self.slots[index], frame)
+            self.timestamps[index] = captured_at
+            self.seq += 1
+            self.condition.notify_all()
+
+    def latest(self, after_seq=0, timeout=None, out=None, count_dropped=True):
+        """Wait for a frame newer than after_seq and return (seq, frame, captured_at).
+
+        Returns None on timeout. The frame is copied into `out` when given so
+        callers can reuse their own array. Secondary readers such as the
+        preview encoder pass count_dropped=False to keep the metric about
+        the inference consumer.
+        """
+        with self.condition:
+            after_seq = max(after_seq, self.cleared_seq)
+            if not self.condition.wait_for(lambda: self.seq > max(after_seq, self.cleared_seq), timeout=timeout):
+                return None
+            if after_seq and count_dropped:
+                self.frames_dropped += self.seq - after_seq - 1
+            index = (self.seq - 1) % self.capacity
+            if out is None or out.shape != self.slots[index].shape:
+                out = np.empty_like(self.slots[index])
+            np.copyto(out, self.slots[index])
+            return self.seq, out, self.timestamps[index]
+
+    def has_newer(self, seq):
+        """Return True if a frame newer than seq has been committed."""
+        with self.condition:
+            return self.seq > seq
+
+    def clear(self):
+        """Drop all frames, keeping the allocated slots for reuse.
+
+        Sequence numbers keep increasing so readers that survive a restart
+        never wait for a sequence number that will not come again.
+        """
+        with self.condition:
+            self.cleared_seq = self.seq
+            self.frames_dropped = 0
+            self.condition.notify_all()
+
+class FrameBroadcaster:
+    """Encode each new frame to JPEG once and fan the bytes out to all viewers.
+
+    The encoder thread only runs while at least one client is subscribed
+    and wakes up on new frames instead of polling at a fixed rate.
+    """
+
+    def __init__(self, frame_buffer, jpeg_quality=80, preview_width=None, label="Processing"):
+        self.frame_buffer = frame_buffer
+        self.jpeg_quality = jpeg_quality
+        self.preview_width = preview_width  # None or 0 keeps the capture resolution
+        self.label = label
+
+        self.jpeg = None
+        self.seq = 0
+        self.subscribers = 0
+        self.thread = None
+        self.condition = threading.Condition()
+
+    def subscribe(self):
+        """Register a viewer, starting the encoder thread if needed."""
+        with self.condition:
+            self.subscribers += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.encode_frames, daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def encode(self, frame):
+        """Annotate, downscale and JPEG-encode a frame."""
+        if self.preview_width and frame.shape[1] > self.preview_width:
+            height = int(frame.shape[0] * self.preview_width / frame.shape[1])
+            frame = cv2.resize(frame, (self.preview_width, height), interpolation=cv2.INTER_AREA)
+
+        # Add some visual indicators for debugging
+        cv2.putText(frame, self.label, (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return buffer.tobytes()
+
+    def encode_frames(self):
+        """Encoder loop; exits once the last viewer has gone."""
+        last_seq = 0
+        scratch = None
+        while True:
+            with self.condition:
+                if self.subscribers <= 0:
+                    self.thread = None
+                    return
+
+            item = self.frame_buffer.latest(last_seq, timeout=0.5, out=scratch, count_dropped=False)
+            if item is None:
+                continue
+            last_seq, scratch, _ = item
+
+            try:
+                jpeg = self.encode(scratch)
+            except Exception as e:
+                print(f"Error encoding preview frame: {e}")
+                continue
+
+            with self.condition:
+                self.jpeg = jpeg
+                self.seq += 1
+                self.condition.notify_all()
+
+    def stream(self, is_active):
+        """Yield multipart MJPEG chunks for one viewer while is_active() holds."""
+        self.subscribe()
+        try:
+            last_seq = 0
+            while is_active():
+                with self.condition:
+                    if not self.condition.wait_for(lambda: self.seq > last_seq, timeout=1):
+                        continue
+                    jpeg = self.jpeg
+                    last_seq = self.seq
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            self.unsubscribe()
+
+class InferenceScheduler:
+    """Decide which captured frames are worth running YOLO+OCR on.
+
+    A frame is sent to inference only when its difference hash has moved
+    far enough from the last processed frame, and never faster than
+    max_rate inferences per second.
+    """
+    HASH_SIZE = 8
+
+    def __init__(self, max_rate=2.0, change_threshold=0.15):
+        self.max_rate = max_rate
+        self.change_threshold = change_threshold
+        self.reset()
+
+    def reset(self):
+        """Forget the last processed scene and zero the counters."""
+        self.last_hash = None
+        self.last_inference_time = 0.0
+        self.last_score = None
+        self.confirming = False  # Set while OCR text is still waiting for consensus
+        self.frames_processed = 0
+        self.frames_skipped_static = 0
+        self.frames_skipped_rate = 0
+
+    def frame_hash(self, frame):
+        """Compute a 64-bit difference hash of a BGR frame."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (self.HASH_SIZE + 1, self.HASH_SIZE), interpolation=cv2.INTER_AREA)
+        return (small[:, 1:] > small[:, :-1]).flatten()
+
+    def should_process(self, frame):
+        """Return True if the frame should be sent to inference."""
+        now = time.monotonic()
+        if self.max_rate and now - self.last_inference_time < 1 / self.max_rate:
+            self.frames_skipped_rate += 1
+            return False
+
+        frame_hash = self.frame_hash(frame)
+        if self.last_hash is not None:
+            self.last_score = float(np.count_nonzero(frame_hash != self.last_hash)) / frame_hash.size
+            # A static scene is still sampled while its text has not settled
+            if self.last_score < self.change_threshold and not self.confirming:
+                self.frames_skipped_static += 1
+                return False
+
+        self.last_hash = frame_hash
+        self.last_inference_time = now
+        self.frames_processed += 1
+        return True
+
+    def get_metrics(self):
+        """Return counters for the /status endpoint."""
+        skipped = self.frames_skipped_static + self.frames_skipped_rate
+        total = skipped + self.frames_processed
+        return {
+            "frames_processed": self.frames_processed,
+            "frames_skipped": skipped,
+            "frames_skipped_static": self.frames_skipped_static,
+            "frames_skipped_rate": self.frames_skipped_rate,
+            "skip_ratio": round(skipped / total, 3) if total else 0.0,
+            "last_change_score": self.last_score,
+            "confirming": self.confirming,
+            "max_inference_rate": self.max_rate,
+            "change_threshold": self.change_threshold
+        }
+
+class VisionModels:
+    """YOLO detector and EasyOCR reader shared by every capture session.
+
+    The models are loaded once per process. Inference requests from all
+    sessions go through one bounded thread pool, so adding cameras adds
+    queued work rather than extra copies of the models.
+    """
+
+    def __init__(self, max_workers=None):
         self.CONFIDENCE_THRESHOLD = 0.7
-        self.output_file = "vision_output.json"
-        
+        self.OCR_CANVAS_SIZE = 480  # Crops are letterboxed to a square canvas of this size
+
         # Initialize YOLO and OCR
         self.reader = easyocr.Reader(['en'], gpu=False)
         self.model = YOLO("yolov8n-seg.pt")
         self.model.overrides["conf"] = 0.5
         self.model.overrides["iou"] = 0.5
+        # Ultralytics predictors keep per-call state and are not thread-safe
+        self.model_lock = threading.Lock()
+
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                           thread_name_prefix="vision-inference")
+
+    def submit(self, frames):
+        """Queue a frame window for inference on the shared worker pool."""
+        return self.executor.submit(self.detect_and_extract_text, frames)
+
+    def detect_objects(self, frames):
+        """Run YOLO over a list of frames in one batch."""
+        with self.model_lock:
+            return self.model(frames, verbose=False)
+
+    def crop_objects(self, frames, results):
+        """Cut out the boxes above threshold and letterbox them for OCR."""
+        crops = []
+        for frame, result in zip(frames, results):
+            for box in result.boxes.data.tolist():
+                x1, y1, x2, y2, confidence, class_id = box
+
+                if confidence < self.CONFIDENCE_THRESHOLD:
+                    continue
+
+                object_frame = frame[int(y1):int(y2), int(x1):int(x2)]
+                if object_frame.size:
+                    crops.append(self.letterbox(object_frame))
+        return crops
+
+    def letterbox(self, crop):
+        """Scale a crop into a square canvas, keeping its aspect ratio."""
+        size = self.OCR_CANVAS_SIZE
+        height, width = crop.shape[:2]
+        scale = size / max(height, width)
+        resized = cv2.resize(crop, (max(1, int(width * scale)), max(1, int(height * scale))))
+        canvas = np.zeros((size, size, 3), dtype=np.uint8)
+        canvas[:resized.shape[0], :resized.shape[1]] = resized
+        return canvas
+
+    def extract_text_batch(self, crops):
+        """Run OCR on all crops in a single batched recognition pass."""
+        if not crops:
+            return []
+
+        ocr_results = self.reader.readtext_batched(crops, batch_size=len(crops))
+        texts = []
+        for result in ocr_results:
+            high_confidence_texts = [
+                res[1] for res in result if res[2] >= self.CONFIDENCE_THRESHOLD
+            ]
+            texts.append(" ".join(high_confidence_texts))
+        return texts
+
+    def detect_and_extract_text(self, frames, timings=None):
+        """Detect objects and extract text for every product in view.
+
+        Accepts a single frame or a list of frames; returns one text per
+        distinct product, in detection order. When a timings dict is given,
+        per-stage durations in milliseconds are appended under "yolo",
+        "crop" and "ocr".
+        """
+        if frames is None:
+            return []
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            return []
+
+        try:
+            started = time.perf_counter()
+            results = self.detect_objects(frames)
+            detected = time.perf_counter()
+            crops = self.crop_objects(frames, results)
+            cropped = time.perf_counter()
+            texts = self.extract_text_batch(crops)
+            recognized = time.perf_counter()
+
+            if timings is not None:
+                timings.setdefault("yolo", []).append((detected - started) * 1000)
+                timings.setdefault("crop", []).append((cropped - detected) * 1000)
+                timings.setdefault("ocr", []).append((recognized - cropped) * 1000)
+
+            # The same product usually shows up in every frame of the window
+            return list(dict.fromkeys(text for text in texts if text))
+        except Exception as e:
+            print(f"Error in detection: {e}")
+        return []
+
+class VisionProcessor:
+    def __init__(self, models, events, session_id="default", camera_index=None, output_file="vision_output.json"):
+        self.FPS_LIMIT = 10
+        self.OCR_FRAME_WINDOW = 3  # Frames whose crops are pooled into one OCR batch
+        self.session_id = session_id
+        self.output_file = output_file
+
+        # Shared YOLO and OCR models and the detection event stream
+        self.models = models
+        self.events = events
 
         self.processing = False
         self.detected_text = None
+        self.detected_texts = []
+        self.raw_texts = []  # Latest unfiltered OCR output
         
         # Camera variables
         self.camera = None
-        self.camera_index = 0  # Default camera index
-        self.frame_queue = queue.Queue(maxsize=10)
+        self.requested_camera = camera_index  # None means scan for a free camera
+        self.camera_index = camera_index if camera_index is not None else 0
+        self.excluded_cameras = set()  # Cameras already held by other sessions
+        self.frame_buffer = FrameRingBuffer(capacity=self.OCR_FRAME_WINDOW + 1)
         self.result_queue = queue.Queue()
         self.stop_event = threading.Event()
-        
-        self.current_frame = None
-        self.frame_lock = threading.Lock()
+
+        # Capture-to-result latency of recent detections, in milliseconds
+        self.latencies = deque(maxlen=100)
+
+        # One shared JPEG encoder for every /video_feed client
+        self.broadcaster = FrameBroadcaster(
+            self.frame_buffer,
+            jpeg_quality=int(os.getenv('VISION_PREVIEW_JPEG_QUALITY', 80)),
+            preview_width=int(os.getenv('VISION_PREVIEW_WIDTH', 0)) or None
+        )
+
+        # OCR text must agree across several inferences before it is reported
+        self.consensus = TextConsensus(
+            window=int(os.getenv('VISION_CONSENSUS_WINDOW', 4)),
+            min_confidence=float(os.getenv('VISION_CONSENSUS_CONFIDENCE', 0.5)),
+            similarity=float(os.getenv('VISION_CONSENSUS_SIMILARITY', 0.8))
+        )
+
+        # Only frames showing a changed scene are sent to inference
+        self.scheduler = InferenceScheduler(
+            max_rate=float(os.getenv('VISION_MAX_INFERENCE_RATE', 2.0)),
+            change_threshold=float(os.getenv('VISION_CHANGE_THRESHOLD', 0.15))
+        )
         
         # Error tracking
         self.error_message = None
 
     def find_available_camera(self):
         """Try to find an available camera by testing different indices and methods."""
+        if self.requested_camera is not None:
+            self.camera_index = self.requested_camera
+            return True
+
         # Try common camera indices
         for index in range(4):  # Try cameras 0-3
+            if index in self.excluded_cameras:
+                continue
             try:
                 cap = cv2.VideoCapture(index)
                 if cap.isOpened():
@@ -76,6 +442,8 @@ class VisionProcessor:
                 '/dev/video3'
             ]
             for path in device_paths:
+                if path in self.excluded_cameras:
+                    continue
                 try:
                     cap = cv2.VideoCapture(path)
                     if cap.isOpened():
@@ -103,8 +471,8 @@ class VisionProcessor:
             if not self.find_available_camera():
                 return False
 
-            # Initialize the selected camera
-            self.camera = cv2.VideoCapture(self.camera_index)
+            # Initialize the selected camera (or replay source)
+            self.camera = open_frame_source(self.camera_index, fps=self.FPS_LIMIT)
             
             # Set camera properties
             self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
@@ -140,77 +508,92 @@ class VisionProcessor:
                     continue
 
             try:
-                ret, frame = self.camera.read()
+                ret, frame = self.camera.read(self.frame_buffer.acquire_slot())
                 if not ret or frame is None:
                     print("Failed to read frame, reinitializing camera...")
                     self.initialize_camera()
                     continue
 
-                # Update current frame with thread safety
-                with self.frame_lock:
-                    self.current_frame = frame.copy()
-                
-                # Only add to queue if there's room
-                try:
-                    self.frame_queue.put_nowait(frame)
-                except queue.Full:
-                    # Skip frame if queue is full
-                    continue
-                    
+                self.frame_buffer.commit(frame, time.monotonic())
+
             except Exception as e:
                 print(f"Error reading frame: {e}")
                 time.sleep(0.1)  # Prevent tight loop on error
 
     def get_current_frame(self):
         """Thread-safe method to get the current frame."""
-        with self.frame_lock:
-            if self.current_frame is not None:
-                return self.current_frame.copy()
-            return None
-
-    def detect_and_extract_text(self, frame):
-        """Detect objects and extract text."""
-        if frame is None:
-            return None
-            
-        try:
-            results = self.model(frame, verbose=False)
-            for i, box in enumerate(results[0].boxes.data.tolist()):
-                x1, y1, x2, y2, confidence, class_id = box
-                
-                if confidence < self.CONFIDENCE_THRESHOLD:
-                    continue
-                    
-                object_frame = frame[int(y1):int(y2), int(x1):int(x2)]
-                ocr_results = self.reader.readtext(object_frame)
-                high_confidence_texts = [
-                    res[1] for res in ocr_results if res[2] >= self.CONFIDENCE_THRESHOLD
-                ]
-                if high_confidence_texts:
-                    return " ".join(high_confidence_texts)
-        except Exception as e:
-            print(f"Error in detection: {e}")
-        return None
+        item = self.frame_buffer.latest(timeout=0)
+        return item[1] if item else None
+
+    def detect_and_extract_text(self, frames):
+        """Run detection and OCR for this session on the shared worker pool."""
+        return self.models.submit(frames).result()
 
     def process_frames(self):
         """Process frames for text detection."""
+        last_seq = 0
+        scratch = None
+        pending = []
         while not self.stop_event.is_set():
             try:
-                frame = self.frame_queue.get(timeout=1)
-                detected_text = self.detect_and_extract_text(frame)
-                if detected_text:
-                    self.detected_text = detected_text
-                    self.save_text_to_file(detected_text)
-            except queue.Empty:
-                continue
+                item = self.frame_buffer.latest(last_seq, timeout=1, out=scratch)
+                if item is None:
+                    continue
+                last_seq, scratch, captured_at = item
+
+                if self.scheduler.should_process(scratch):
+                    pending.append((scratch, captured_at))
+                    scratch = None
+
+                # Pool approved frames until the window is full or we are caught up
+                if not pending or (len(pending) < self.OCR_FRAME_WINDOW
+                                   and self.frame_buffer.has_newer(last_seq)):
+                    continue
+
+                frames = [frame for frame, _ in pending]
+                newest_capture = pending[-1][1]
+                pending = []
+
+                detected_texts = self.detect_and_extract_text(frames)
+                self.latencies.append((time.monotonic() - newest_capture) * 1000)
+                self.raw_texts = detected_texts
+
+                stable_texts = self.consensus.update(detected_texts)
+                self.scheduler.confirming = self.consensus.has_candidates()
+                if stable_texts:
+                    self.detected_texts = stable_texts
+                    self.detected_text = stable_texts[0]
+                    # Only new detections reach subscribers and the fallback file
+                    event = self.events.publish(self.session_id, stable_texts)
+                    if event:
+                        self.save_text_to_file(event)
             except Exception as e:
                 print(f"Error processing frame: {e}")
 
+    def get_latency_metrics(self):
+        """Summarize capture-to-result latency for the /status endpoint."""
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {"samples": 0, "frames_dropped": self.frame_buffer.frames_dropped}
+        return {
+            "samples": len(latencies),
+            "last_ms": round(self.latencies[-1], 1),
+            "p50_ms": round(latencies[len(latencies) // 2], 1),
+            "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+            "frames_dropped": self.frame_buffer.frames_dropped
+        }
+
     def start_processing(self):
         """Start processing frames."""
         if not self.processing:
             self.processing = True
             self.detected_text = None
+            self.detected_texts = []
+            self.raw_texts = []
+            self.consensus.reset()
+            self.scheduler.reset()
+            self.latencies.clear()
+            self.events.reset_session(self.session_id)
             self.stop_event.clear()
             
             if self.initialize_camera():
@@ -228,69 +611,223 @@ class VisionProcessor:
             self.camera.release()
             self.camera = None
             
-        # Clear queues
-        while not self.frame_queue.empty():
-            try:
-                self.frame_queue.get_nowait()
-            except queue.Empty:
-                break
-
-    def save_text_to_file(self, text):
-        """Save detected text to a JSON file."""
-        data = {
-            "product_name": text,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        with open(self.output_file, "w") as file:
-            json.dump(data, file, indent=4)
+        # Drop buffered frames
+        self.frame_buffer.clear()
+
+    def save_text_to_file(self, event):
+        """Save a detection event to the JSON fallback file read by older consumers."""
+        try:
+            write_json_atomic(self.output_file, event)
+        except OSError as e:
+            print(f"Error writing {self.output_file}: {e}")
 
-# Initialize the VisionProcessor
-vision_processor = VisionProcessor()
+class VisionProcessorPool:
+    """Session-keyed capture workers that share one set of models."""
+    DEFAULT_SESSION = "default"
+
+    def __init__(self, models, events):
+        self.models = models
+        self.events = events
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the processor for a session, or None if it was never started."""
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def output_file_for(self, session_id):
+        """The default session keeps the file infoBot already reads."""
+        if session_id == self.DEFAULT_SESSION:
+            return "vision_output.json"
+        return f"vision_output_{session_id}.json"
+
+    def start(self, session_id, camera_index=None):
+        """Start (or restart) capture for a session."""
+        with self.lock:
+            processor = self.sessions.get(session_id)
+            if processor is not None and processor.processing:
+                return None, None
+
+            cameras_in_use = {
+                other.camera_index for sid, other in self.sessions.items()
+                if sid != session_id and other.processing
+            }
+            if camera_index is not None and camera_index in cameras_in_use:
+                return False, f"Camera {camera_index} is already used by another session"
+
+            if processor is None or (camera_index is not None and camera_index != processor.requested_camera):
+                processor = VisionProcessor(self.models, self.events, session_id, camera_index,
+                                            self.output_file_for(session_id))
+                self.sessions[session_id] = processor
+            processor.excluded_cameras = cameras_in_use
+        return processor.start_processing()
+
+    def stop(self, session_id):
+        """Stop capture for a session; returns False if it does not exist."""
+        processor = self.get(session_id)
+        if processor is None:
+            return False
+        processor.stop_processing()
+        return True
+
+    def list_sessions(self):
+        """Summarize every known session."""
+        with self.lock:
+            return [
+                {
+                    "session_id": session_id,
+                    "camera": processor.camera_index,
+                    "processing": processor.processing,
+                    "detected_text": processor.detected_text
+                }
+                for session_id, processor in self.sessions.items()
+            ]
+
+# Load the models once and share them across sessions
+vision_models = VisionModels(
+    max_workers=int(os.getenv('VISION_INFERENCE_WORKERS', 0)) or None
+)
+detection_events = DetectionEventStream()
+vision_pool = VisionProcessorPool(vision_models, detection_events)
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+CAMERA_DEVICE_PATTERN = re.compile(r'^/dev/video[0-9]{1,3}$')
+# Replay sources (video files, image directories, 'synthetic') can only be opened over HTTP
+# with VISION_ALLOW_REPLAY=1, since their frames can be read back through /video_feed
+ALLOW_REPLAY_SOURCES = os.getenv('VISION_ALLOW_REPLAY') == '1'
+
+def get_request_param(name):
+    """Read a parameter from the query string or JSON body."""
+    value = request.args.get(name)
+    if value is None:
+        body = request.get_json(silent=True) or {}
+        value = body.get(name)
+    return value
+
+def get_session_id():
+    """Return the requested session id, defaulting to the single-station session."""
+    session_id = get_request_param('session_id') or VisionProcessorPool.DEFAULT_SESSION
+    if not SESSION_ID_PATTERN.match(str(session_id)):
+        return None
+    return str(session_id)
+
+def get_camera_param():
+    """Return the requested camera as an index or /dev/video* path, if any; raises ValueError otherwise."""
+    camera = get_request_param('camera')
+    if camera is None or camera == "":
+        return None
+    camera = str(camera)
+    if camera.isascii() and camera.isdigit():
+        return int(camera)
+    if CAMERA_DEVICE_PATTERN.match(camera) or ALLOW_REPLAY_SOURCES:
+        return camera
+    raise ValueError("camera must be a camera index or a /dev/video* device")
+
+def invalid_session_response():
+    """Response for a malformed session id."""
+    return jsonify({"status": "error", "message": "Invalid session_id"}), 400
 
 @app.route('/video_feed')
 def video_feed():
     """Video feed route for streaming frames."""
-    def generate():
-        while vision_processor.processing:
-            frame = vision_processor.get_current_frame()
-            if frame is not None:
-                # Add some visual indicators for debugging
-                cv2.putText(frame, "Processing", (10, 30),
-                          cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                
-                _, buffer = cv2.imencode('.jpg', frame)
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            time.sleep(1/vision_processor.FPS_LIMIT)
+    session_id = get_session_id()
+    if session_id is None:
+        return invalid_session_response()
+    vision_processor = vision_pool.get(session_id)
+    if vision_processor is None:
+        return jsonify({"status": "error", "message": "Unknown session"}), 404
 
-    return Response(generate(),
+    return Response(vision_processor.broadcaster.stream(lambda: vision_processor.processing),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/start', methods=['POST'])
 def start_processing():
     """Start processing."""
-    if not vision_processor.processing:
-        success, error = vision_processor.start_processing()
-        if success:
-            return jsonify({"status": "started"})
-        return jsonify({"status": "error", "message": error or "Failed to start camera"}), 500
-    return jsonify({"status": "already running"})
+    session_id = get_session_id()
+    if session_id is None:
+        return invalid_session_response()
+    try:
+        camera = get_camera_param()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e), "session_id": session_id}), 400
+    success, error = vision_pool.start(session_id, camera)
+    if success is None:
+        return jsonify({"status": "already running", "session_id": session_id})
+    if success:
+        return jsonify({"status": "started", "session_id": session_id})
+    return jsonify({"status": "error", "message": error or "Failed to start camera", "session_id": session_id}), 500
 
 @app.route('/stop', methods=['POST'])
 def stop_processing():
     """Stop processing."""
-    vision_processor.stop_processing()
-    return jsonify({"status": "stopped"})
+    session_id = get_session_id()
+    if session_id is None:
+        return invalid_session_response()
+    vision_pool.stop(session_id)
+    return jsonify({"status": "stopped", "session_id": session_id})
 
 @app.route('/status', methods=['GET'])
 def get_status():
     """Get processing status."""
+    session_id = get_session_id()
+    if session_id is None:
+        return invalid_session_response()
+    vision_processor = vision_pool.get(session_id)
+    if vision_processor is None:
+        if session_id != VisionProcessorPool.DEFAULT_SESSION:
+            return jsonify({"status": "error", "message": "Unknown session"}), 404
+        return jsonify({
+            "session_id": session_id,
+            "processing": False,
+            "detected_text": None,
+            "detected_texts": [],
+            "error": None,
+            "output_file": None,
+            "inference_workers": vision_models.max_workers
+        })
     return jsonify({
+        "session_id": session_id,
+        "camera": vision_processor.camera_index,
         "processing": vision_processor.processing,
         "detected_text": vision_processor.detected_text,
+        "detected_texts": vision_processor.detected_texts,
+        "raw_texts": vision_processor.raw_texts,
         "error": vision_processor.error_message,
-        "output_file": vision_processor.output_file if os.path.exists(vision_processor.output_file) else None
+        "consensus": vision_processor.consensus.get_metrics(),
+        "scheduler": vision_processor.scheduler.get_metrics(),
+        "latency": vision_processor.get_latency_metrics(),
+        "output_file": vision_processor.output_file if os.path.exists(vision_processor.output_file) else None,
+        "inference_workers": vision_models.max_workers
+    })
+
+@app.route('/events', methods=['GET'])
+def detection_event_stream():
+    """Server-sent event stream of new detections, resumable via Last-Event-ID."""
+    session_id = request.args.get('session_id')
+    if session_id is not None and not SESSION_ID_PATTERN.match(session_id):
+        return invalid_session_response()
+    # Ids seen in a previous run of this service replay what we have
+    since = detection_events.resume_from(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    return Response(detection_events.stream(since, session_id),
+                    mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/events/latest', methods=['GET'])
+def latest_detection_event():
+    """Return the most recent detection event."""
+    session_id = request.args.get('session_id')
+    event = detection_events.latest(session_id)
+    if event is None:
+        return jsonify({"status": "error", "message": "No detections yet"}), 404
+    return jsonify(event)
+
+@app.route('/sessions', methods=['GET'])
+def list_sessions():
+    """List all capture sessions."""
+    return jsonify({
+        "sessions": vision_pool.list_sessions(),
+        "inference_workers": vision_models.max_workers
     })
 
 if __name__ == '__main__':
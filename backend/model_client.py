@@ -0,0 +1,264 @@
+# model_client.py
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import openai
+
+from json_stream import IncrementalJsonParser
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class ModelUnavailableError(Exception):
+    """The model API is rate limited, failing or too slow to answer within the deadline."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the Retry-After (or retry-after-ms) header from an API error, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status in RETRYABLE_STATUS or (status is not None and status >= 500)
+
+
+class TokenBucket:
+    """Request rate limiter shared by every caller of one model client.
+
+    Tokens refill at `rate_per_minute` up to `capacity`. A caller reserves a
+    token and is told how long to wait for it, so waiting happens on the
+    caller's own event loop. A 429 pauses the bucket until Retry-After and
+    cuts the rate; each success restores it gradually towards the quota.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: int = 10):
+        self.max_rate = rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def refund(self):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def penalize(self, pause: float):
+        """Back off after a rate limit: pause everyone and slow the refill."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.rate = max(self.max_rate * 0.25, self.rate * 0.75)
+
+    def reward(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "rate_per_minute": round(self.rate * 60, 1),
+                "quota_per_minute": round(self.max_rate * 60, 1),
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3)
+            }
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing, then probes it again.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are refused for `reset_timeout` seconds. Then a single probe is
+    let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_started = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self.probing = False
+            # A probe that never reported back (e.g. was cancelled) is replaced after a while
+            if self.state == "half_open" and self.probing and now - self.probe_started >= self.reset_timeout:
+                self.probing = False
+            if self.state == "closed" or (self.state == "half_open" and not self.probing):
+                if self.state == "half_open":
+                    self.probing = True
+                    self.probe_started = now
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def retry_after(self) -> float:
+        with self.lock:
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self.lock:
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"state": self.state, "consecutive_failures": self.failures, **self.stats}
+
+
+class ModelClient:
+    """Shared wrapper for streamed JSON chat completions.
+
+    Every call waits for a token from the shared bucket, runs under an
+    overall deadline, and retries rate limits, timeouts and server errors
+    with jittered exponential backoff, sleeping at least as long as any
+    Retry-After header asks. A call that has already passed sections to
+    on_section is not retried, since they cannot be taken back. Timeouts,
+    connection and server errors count towards opening the circuit; rate
+    limits only slow the bucket down. When the circuit breaker is open, or
+    retries run out, ModelUnavailableError is raised so callers can fall
+    back to stale cached results.
+    """
+
+    def __init__(self, client: openai.AsyncOpenAI, requests_per_minute: float = 500, burst: int = 10,
+                 max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                 deadline: float = 120.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.client = client
+        self.bucket = TokenBucket(requests_per_minute, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "timeouts": 0, "failures": 0}
+
+    def _count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    async def stream_json(self, messages: List[Dict[str, str]], item_keys: Tuple[str, ...] = ("Alternatives",),
+                          on_section: Optional[Callable[[Tuple[Any, ...], Any], None]] = None,
+                          deadline: Optional[float] = None, **options) -> Dict[str, Any]:
+        """Stream a completion into an incremental JSON parser and return the object."""
+        give_up_at = time.monotonic() + (deadline or self.deadline)
+        sent = False
+
+        def forward(path, value):
+            nonlocal sent
+            sent = True
+            on_section(path, value)
+
+        async def attempt() -> Dict[str, Any]:
+            parser = IncrementalJsonParser(item_keys, on_section=forward if on_section else None)
+            stream = await self.client.chat.completions.create(messages=messages, stream=True, **options)
+            # Closes the response when the deadline cancels us mid-stream, so the connection is not leaked
+            async with stream:
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parser.feed(delta)
+            return parser.finish()
+
+        for retry in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise ModelUnavailableError("Model API circuit is open", retry_after=self.breaker.retry_after())
+
+            wait = self.bucket.reserve()
+            remaining = give_up_at - time.monotonic()
+            if wait >= remaining:
+                self.bucket.refund()
+                self._count("timeouts")
+                raise ModelUnavailableError("Model API rate limit queue exceeds the request deadline",
+                                            retry_after=wait)
+            await asyncio.sleep(wait)
+
+            self._count("calls")
+            try:
+                result = await asyncio.wait_for(attempt(), give_up_at - time.monotonic())
+            except Exception as e:
+                if not is_retryable(e):
+                    # The API answered, so it is up; the request itself is at fault
+                    self.breaker.record_success()
+                    raise
+                retry_after = retry_after_seconds(e)
+                if getattr(e, "status_code", None) == 429:
+                    # The API is up but over quota: slow the bucket down instead of opening the circuit
+                    self.breaker.record_success()
+                    self._count("rate_limited")
+                    self.bucket.penalize(retry_after or self.base_delay)
+                else:
+                    self.breaker.record_failure()
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._count("timeouts")
+
+                delay = min(self.max_delay, self.base_delay * 2 ** retry) * random.uniform(0.5, 1.0)
+                delay = max(delay, retry_after or 0.0)
+                if sent or retry == self.max_retries or time.monotonic() + delay >= give_up_at:
+                    self._count("failures")
+                    raise ModelUnavailableError(f"Model API unavailable: {str(e) or type(e).__name__}",
+                                                retry_after=retry_after) from e
+                self._count("retries")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.bucket.reward()
+            return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+        return {**stats, "rate_limit": self.bucket.get_stats(), "circuit": self.breaker.get_stats()}
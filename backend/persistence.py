@@ -0,0 +1,648 @@
+# persistence.py
+import base64
+import json
+import math
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from product_cache import normalize_product_key
+
+PRODUCTS_TABLE = "product_information"
+ALTERNATIVES_TABLE = "product_alternatives"
+STATS_TABLE = "product_stats_counters"
+TRIGRAMS_TABLE = "product_name_trigrams"
+# Ranked fuzzy name search from sql/product_search.sql
+SEARCH_RPC = "search_products"
+
+# Columns returned by listings; the JSON text columns are left for /product/<id>
+LIST_COLUMNS = (
+    "id", "product_name", "health_index", "sustainability_biodegradable", "sustainability_recyclable",
+    "sustainability_rating", "price", "reliability_index", "dustbin_color", "created_at"
+)
+# Share of a query's trigrams a name must contain to count as a fuzzy match;
+# pg_trgm's default word_similarity_threshold, used by search_products()
+SEARCH_SIMILARITY = 0.6
+
+# Lower bounds of the price histogram buckets; keep in sync with sql/product_stats.sql
+PRICE_BUCKETS = (0, 5, 10, 20, 50)
+
+
+def parse_json_field(value: Any, default: Any) -> Any:
+    """Accept a JSON string or an already-parsed value."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return default
+    return value if value is not None else default
+
+
+def to_float(value: Any, default: float) -> float:
+    """Convert model output such as "$4.99" or "N/A" to a float."""
+    try:
+        text = str(value).replace("$", "").replace("N/A", "").strip()
+        return float(text) if text else default
+    except (TypeError, ValueError):
+        return default
+
+
+def ingredients_list(value: Any) -> List[Any]:
+    ingredients = parse_json_field(value, [])
+    return ingredients if isinstance(ingredients, list) else [str(ingredients)]
+
+
+def product_row(product_name: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a cleaned product analysis to a product_information row."""
+    health = data["Health_Information"]
+    sustainability = data["Sustainability_Information"]
+    row = {
+        "product_name": product_name,
+        "health_nutrients": json.dumps(parse_json_field(health["Nutrients"], {})),
+        "health_ingredients": json.dumps(ingredients_list(health["Ingredients"])),
+        "health_index": to_float(health["Health_index"], 4.0),
+        "sustainability_biodegradable": sustainability["Biodegradable"],
+        "sustainability_recyclable": sustainability["Recyclable"],
+        "sustainability_rating": to_float(sustainability["Sustainability_rating"], 4.0),
+        "price": to_float(data["Price"], 9.99),
+        "reliability_index": to_float(data["Reliability_index"], 4.0),
+        "dustbin_color": str(data.get("Color_of_the_dustbin") or "blue").lower()
+    }
+    if data.get("Request_Fingerprint"):
+        row["request_fingerprint"] = data["Request_Fingerprint"]
+    return row
+
+
+def alternative_row(alt: Dict[str, Any], product_id: Optional[str] = None) -> Dict[str, Any]:
+    """Map a cleaned alternative to a product_alternatives row."""
+    health = alt["Health_Information"]
+    sustainability = alt["Sustainability_Information"]
+    row = {
+        "alternative_name": alt["Name"],
+        "health_nutrients": json.dumps(parse_json_field(health["Nutrients"], {})),
+        "health_ingredients": json.dumps(ingredients_list(health["Ingredients"])),
+        "health_index": to_float(health["Health_index"], 4.0),
+        "sustainability_biodegradable": sustainability["Biodegradable"],
+        "sustainability_recyclable": sustainability["Recyclable"],
+        "sustainability_rating": to_float(sustainability["Sustainability_rating"], 4.0),
+        "price": to_float(alt["Price"], 9.99),
+        "reliability_index": to_float(alt["Reliability_index"], 4.0)
+    }
+    if product_id is not None:
+        row["product_id"] = product_id
+    return row
+
+
+def new_product_id() -> str:
+    return str(uuid.uuid4())
+
+
+def entry_rows(product_id: str, product_name: str, data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Build the product row and alternative rows for one entry.
+
+    Alternative ids are derived from the product id so retried writes
+    produce the same rows.
+    """
+    namespace = uuid.UUID(product_id)
+    main_row = {"id": product_id, **product_row(product_name, data)}
+    alternative_rows = [
+        {"id": str(uuid.uuid5(namespace, str(index))), **alternative_row(alt, product_id)}
+        for index, alt in enumerate(data.get("Alternatives", []))
+    ]
+    return main_row, alternative_rows
+
+
+def without_score(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A listed row without the search score that only the cursor needs."""
+    row.pop("score", None)
+    return row
+
+
+def name_trigrams(name: str) -> Set[str]:
+    """Trigrams of each word of a normalized name, padded like pg_trgm."""
+    trigrams = set()
+    for word in normalize_product_key(name).split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque keyset cursor pointing just past a listed row; search results also carry their score."""
+    key = [str(row["created_at"]), row["id"]]
+    if "score" in row:
+        key.append(row["score"])
+    raw = json.dumps(key)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, ranked: bool = False) -> Tuple[Any, ...]:
+    """Return (created_at, id), or (score, created_at, id) for a search cursor if ranked.
+
+    Cursors come from clients, so every part is checked to be a timestamp,
+    a UUID or a number before it goes anywhere near a query.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if ranked:
+            created_at, product_id, score = key
+        else:
+            created_at, product_id = key
+        if not isinstance(created_at, str) or not isinstance(product_id, str):
+            raise ValueError("Invalid cursor")
+        datetime.fromisoformat(created_at)
+        product_id = str(uuid.UUID(product_id))
+        if ranked:
+            score = float(score)
+            if not math.isfinite(score):
+                raise ValueError("Invalid cursor")
+            return score, created_at, product_id
+        return created_at, product_id
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def product_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a product_information row back to the analysis shape the API returns."""
+    product = {
+        "product_name": row["product_name"],
+        "Health_Information": {
+            "Nutrients": parse_json_field(row["health_nutrients"], {}),
+            "Ingredients": parse_json_field(row["health_ingredients"], []),
+            "Health_index": row["health_index"]
+        },
+        "Sustainability_Information": {
+            "Biodegradable": row["sustainability_biodegradable"],
+            "Recyclable": row["sustainability_recyclable"],
+            "Sustainability_rating": row["sustainability_rating"]
+        },
+        "Price": row["price"],
+        "Reliability_index": row["reliability_index"],
+        "Color_of_the_dustbin": row["dustbin_color"]
+    }
+    if row.get("request_fingerprint"):
+        product["Request_Fingerprint"] = row["request_fingerprint"]
+    return product
+
+
+def alternative_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a product_alternatives row back to the analysis shape the API returns."""
+    return {
+        "Name": row["alternative_name"],
+        "Health_Information": {
+            "Nutrients": parse_json_field(row["health_nutrients"], {}),
+            "Ingredients": parse_json_field(row["health_ingredients"], []),
+            "Health_index": row["health_index"]
+        },
+        "Sustainability_Information": {
+            "Biodegradable": row["sustainability_biodegradable"],
+            "Recyclable": row["sustainability_recyclable"],
+            "Sustainability_rating": row["sustainability_rating"]
+        },
+        "Price": row["price"],
+        "Reliability_index": row["reliability_index"]
+    }
+
+
+def stat_counters(row: Dict[str, Any]) -> List[Tuple[str, str, float]]:
+    """The (metric, bucket, amount) counters one product row adds to, as in apply_product_stats."""
+    counters = [("total", "", 0.0)]
+    rating, price, health = row.get("sustainability_rating"), row.get("price"), row.get("health_index")
+    if rating is not None:
+        counters.append(("sustainability_rating", "all", rating))
+        counters.append(("sustainability_rating_bucket", str(min(max(math.floor(rating), 0), 4)), 0.0))
+    if price is not None:
+        counters.append(("price", "all", price))
+        counters.append(("price_bucket", str(max((low for low in PRICE_BUCKETS if price >= low),
+                                                 default=PRICE_BUCKETS[0])), 0.0))
+    if health is not None:
+        counters.append(("health_index", "all", health))
+    counters.append(("dustbin_color", row.get("dustbin_color") or "unknown", 0.0))
+    counters.append(("recyclable", row.get("sustainability_recyclable") or "unknown", 0.0))
+    counters.append(("biodegradable", row.get("sustainability_biodegradable") or "unknown", 0.0))
+    return counters
+
+
+def summarize_counters(counters: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Turn (metric, bucket, count, total) counter rows into the stats payload."""
+    grouped: Dict[str, Dict[str, Tuple[int, float]]] = {}
+    for row in counters:
+        if row["count"]:
+            grouped.setdefault(row["metric"], {})[row["bucket"]] = (int(row["count"]), float(row["total"] or 0))
+
+    def average(metric):
+        count, total = grouped.get(metric, {}).get("all", (0, 0.0))
+        return round(total / count, 2) if count else 0
+
+    def counts(metric):
+        return {bucket: count for bucket, (count, _) in sorted(grouped.get(metric, {}).items())}
+
+    rating_histogram = {f"{b}-{b + 1}": 0 for b in range(5)}
+    for bucket, count in counts("sustainability_rating_bucket").items():
+        rating_histogram[f"{bucket}-{int(bucket) + 1}"] = count
+
+    price_labels = {
+        str(low): f"{low}-{high}" for low, high in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:])
+    }
+    price_labels[str(PRICE_BUCKETS[-1])] = f"{PRICE_BUCKETS[-1]}+"
+    price_histogram = {label: 0 for label in price_labels.values()}
+    for bucket, count in counts("price_bucket").items():
+        price_histogram[price_labels[bucket]] = count
+
+    return {
+        "total_products": grouped.get("total", {}).get("", (0, 0.0))[0],
+        "average_sustainability_rating": average("sustainability_rating"),
+        "average_price": average("price"),
+        "average_health_index": average("health_index"),
+        "by_dustbin_color": counts("dustbin_color"),
+        "recyclable": counts("recyclable"),
+        "biodegradable": counts("biodegradable"),
+        "histograms": {
+            "sustainability_rating": rating_histogram,
+            "price": price_histogram
+        }
+    }
+
+
+class ProductRepository:
+    """Storage interface for products and their alternatives.
+
+    Methods are blocking; the services call them through
+    UpstreamRunner.offload so they never stall a request's event loop.
+    """
+
+    def save_product(self, product_name: str, data: Dict[str, Any], product_id: Optional[str] = None) -> str:
+        """Insert a product with its alternatives and return the product id."""
+        product_id = product_id or new_product_id()
+        self.save_products([(product_id, product_name, data)])
+        return product_id
+
+    def save_products(self, entries: List[Tuple[str, str, Dict[str, Any]]]) -> None:
+        """Write (product_id, product_name, data) entries.
+
+        Ids are assigned by the caller, so writing the same entry twice is a
+        no-op and a failed batch can simply be retried.
+        """
+        raise NotImplementedError
+
+    def get_product(self, product_id: str) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Return (product row, alternative rows), or None if the id is unknown."""
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Aggregate counts, averages and histograms over all products."""
+        raise NotImplementedError
+
+    def list_products(self, limit: int = 20, cursor: Optional[str] = None, search: Optional[str] = None,
+                      dustbin_color: Optional[str] = None, recyclable: Optional[str] = None,
+                      biodegradable: Optional[str] = None, min_rating: Optional[float] = None,
+                      max_rating: Optional[float] = None, min_price: Optional[float] = None,
+                      max_price: Optional[float] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of products and the cursor for the next page.
+
+        Text filters match case-insensitively. Without `search`, products
+        come newest first. With it, names with a word close to the query
+        (most of the query's trigrams, so typos still match) come best
+        match first, then newest first.
+        """
+        raise NotImplementedError
+
+    def delete_all(self) -> Tuple[int, int]:
+        """Delete every product and alternative; return (alternatives, products) deleted."""
+        raise NotImplementedError
+
+    def ping(self) -> None:
+        """Raise if the backend is unreachable."""
+        raise NotImplementedError
+
+
+class SupabaseProductRepository(ProductRepository):
+    """Products stored in Supabase.
+
+    Products and alternatives each go in as one batched upsert, so a batch
+    of scans costs two round trips instead of 1 + N per scan. If `rpc_name`
+    names the save_product_with_alternatives function from
+    sql/save_product_with_alternatives.sql, both are written atomically in
+    a single call per product. Without it, a failed alternatives insert
+    deletes the product rows again so no half-written products are left
+    behind.
+
+    Whether sql/request_fingerprint.sql has been applied is checked once,
+    when the repository is created (or on the first save if Supabase was
+    unreachable then). Without the column, products are saved without
+    their fingerprint; the save function needs the column, so with
+    `rpc_name` a missing column is an error.
+    """
+
+    # Matches every UUID; PostgREST refuses an unfiltered delete
+    ALL_IDS = "00000000-0000-0000-0000-000000000000"
+    # PostgREST codes for an unknown column in a select or an insert
+    MISSING_COLUMN_CODES = ("42703", "PGRST204")
+
+    def __init__(self, client, rpc_name: Optional[str] = None):
+        self.client = client
+        self.rpc_name = rpc_name
+        self.has_fingerprint_column = None
+        self.check_fingerprint_column()
+
+    def check_fingerprint_column(self) -> Optional[bool]:
+        """Whether product_information has request_fingerprint; None while Supabase is unreachable."""
+        if self.has_fingerprint_column is None:
+            try:
+                self.client.table(PRODUCTS_TABLE).select("request_fingerprint").limit(1).execute()
+                self.has_fingerprint_column = True
+            except Exception as e:
+                if getattr(e, "code", None) not in self.MISSING_COLUMN_CODES:
+                    print(f"Could not check for the request_fingerprint column: {e}")
+                    return None
+                if self.rpc_name:
+                    raise RuntimeError(f"{self.rpc_name} needs the request_fingerprint column; "
+                                       f"apply sql/request_fingerprint.sql")
+                print("product_information has no request_fingerprint column; saving products without "
+                      "fingerprints until sql/request_fingerprint.sql is applied")
+                self.has_fingerprint_column = False
+        return self.has_fingerprint_column
+
+    def save_products(self, entries):
+        rows = [entry_rows(*entry) for entry in entries]
+        if self.check_fingerprint_column() is False:
+            for main_row, _ in rows:
+                main_row.pop("request_fingerprint", None)
+
+        if self.rpc_name:
+            for main_row, alternative_rows in rows:
+                self.client.rpc(self.rpc_name, {"product": main_row, "alternatives": alternative_rows}).execute()
+            return
+
+        product_rows = [main_row for main_row, _ in rows]
+        alternative_rows = [alt for _, alternatives in rows for alt in alternatives]
+        self.client.table(PRODUCTS_TABLE).upsert(product_rows, ignore_duplicates=True).execute()
+        if alternative_rows:
+            try:
+                self.client.table(ALTERNATIVES_TABLE).upsert(alternative_rows, ignore_duplicates=True).execute()
+            except Exception:
+                ids = [row["id"] for row in product_rows]
+                self.client.table(PRODUCTS_TABLE).delete().in_("id", ids).execute()
+                raise
+
+    def get_product(self, product_id: str):
+        # Alternatives are embedded through the foreign key, so this is one round trip
+        result = (
+            self.client.table(PRODUCTS_TABLE)
+            .select(f"*, {ALTERNATIVES_TABLE}(*)")
+            .eq("id", product_id)
+            .execute()
+        )
+        if not result.data:
+            return None
+        product = dict(result.data[0])
+        alternatives = product.pop(ALTERNATIVES_TABLE, None) or []
+        return product, alternatives
+
+    def list_products(self, limit=20, cursor=None, search=None, dustbin_color=None, recyclable=None,
+                      biodegradable=None, min_rating=None, max_rating=None, min_price=None, max_price=None):
+        search = normalize_product_key(search) if search else ""
+        if search:
+            # Ranked with pg_trgm's word_similarity by search_products() from sql/product_search.sql
+            params = {
+                "search_query": search, "result_limit": limit + 1, "color_filter": dustbin_color or None,
+                "recyclable_filter": recyclable or None, "biodegradable_filter": biodegradable or None,
+                "min_rating": min_rating, "max_rating": max_rating, "min_price": min_price, "max_price": max_price
+            }
+            if cursor:
+                params["after_score"], params["after_created_at"], params["after_id"] = decode_cursor(cursor, ranked=True)
+            rows = self.client.rpc(SEARCH_RPC, params).execute().data
+        else:
+            query = self.client.table(PRODUCTS_TABLE).select(", ".join(LIST_COLUMNS))
+            # ilike without wildcards is a case-insensitive equality check
+            for column, value in (("dustbin_color", dustbin_color), ("sustainability_recyclable", recyclable),
+                                  ("sustainability_biodegradable", biodegradable)):
+                if value:
+                    query = query.ilike(column, value)
+            for column, op, value in (("sustainability_rating", "gte", min_rating), ("sustainability_rating", "lte", max_rating),
+                                      ("price", "gte", min_price), ("price", "lte", max_price)):
+                if value is not None:
+                    query = getattr(query, op)(column, value)
+            if cursor:
+                created_at, product_id = decode_cursor(cursor)
+                query = query.or_(
+                    f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{product_id}")'
+                )
+            rows = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute().data
+
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return [without_score(row) for row in rows[:limit]], next_cursor
+
+    def get_stats(self):
+        # A handful of trigger-maintained counter rows, whatever the table size
+        result = self.client.table(STATS_TABLE).select("metric, bucket, count, total").execute()
+        return summarize_counters(result.data)
+
+    def delete_all(self):
+        alternatives = self.client.table(ALTERNATIVES_TABLE).select("id", count="exact").execute()
+        products = self.client.table(PRODUCTS_TABLE).select("id", count="exact").execute()
+        self.client.table(ALTERNATIVES_TABLE).delete().gte("id", self.ALL_IDS).execute()
+        self.client.table(PRODUCTS_TABLE).delete().gte("id", self.ALL_IDS).execute()
+        return alternatives.count or 0, products.count or 0
+
+    def ping(self):
+        self.client.table(PRODUCTS_TABLE).select("id").limit(1).execute()
+
+
+class SQLiteProductRepository(ProductRepository):
+    """Products stored in a local SQLite file, for edge kiosks and tests.
+
+    Uses the same table and column names as Supabase so rows can be synced
+    upstream unchanged. WAL mode lets reads proceed while a scan is being
+    written.
+    """
+
+    def __init__(self, path: str = "products.sqlite3"):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {PRODUCTS_TABLE} (
+                id TEXT PRIMARY KEY,
+                product_name TEXT NOT NULL,
+                health_nutrients TEXT,
+                health_ingredients TEXT,
+                health_index REAL,
+                sustainability_biodegradable TEXT,
+                sustainability_recyclable TEXT,
+                sustainability_rating REAL,
+                price REAL,
+                reliability_index REAL,
+                dustbin_color TEXT,
+                request_fingerprint TEXT,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE TABLE IF NOT EXISTS {ALTERNATIVES_TABLE} (
+                id TEXT PRIMARY KEY,
+                product_id TEXT NOT NULL REFERENCES {PRODUCTS_TABLE} (id) ON DELETE CASCADE,
+                alternative_name TEXT NOT NULL,
+                health_nutrients TEXT,
+                health_ingredients TEXT,
+                health_index REAL,
+                sustainability_biodegradable TEXT,
+                sustainability_recyclable TEXT,
+                sustainability_rating REAL,
+                price REAL,
+                reliability_index REAL,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+            CREATE INDEX IF NOT EXISTS idx_products_name ON {PRODUCTS_TABLE} (product_name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS idx_alternatives_product ON {ALTERNATIVES_TABLE} (product_id);
+            CREATE INDEX IF NOT EXISTS idx_products_created ON {PRODUCTS_TABLE} (created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS idx_products_price ON {PRODUCTS_TABLE} (price);
+            CREATE INDEX IF NOT EXISTS idx_products_rating ON {PRODUCTS_TABLE} (sustainability_rating);
+            CREATE INDEX IF NOT EXISTS idx_products_color ON {PRODUCTS_TABLE} (dustbin_color COLLATE NOCASE);
+            CREATE TABLE IF NOT EXISTS {TRIGRAMS_TABLE} (
+                trigram TEXT NOT NULL,
+                product_id TEXT NOT NULL REFERENCES {PRODUCTS_TABLE} (id) ON DELETE CASCADE,
+                PRIMARY KEY (trigram, product_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_trigrams_product ON {TRIGRAMS_TABLE} (product_id);
+            CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+                metric TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (metric, bucket)
+            ) WITHOUT ROWID;
+        """)
+        # Files created before request fingerprints were recorded lack the column
+        columns = {row["name"] for row in self.db.execute(f"PRAGMA table_info({PRODUCTS_TABLE})")}
+        if "request_fingerprint" not in columns:
+            self.db.execute(f"ALTER TABLE {PRODUCTS_TABLE} ADD COLUMN request_fingerprint TEXT")
+        self.db.execute(f"CREATE INDEX IF NOT EXISTS idx_products_fingerprint ON {PRODUCTS_TABLE} (request_fingerprint)")
+        # Index names of products stored before the trigram table existed
+        missing = self.db.execute(
+            f"SELECT id, product_name FROM {PRODUCTS_TABLE} "
+            f"WHERE id NOT IN (SELECT product_id FROM {TRIGRAMS_TABLE})"
+        ).fetchall()
+        for row in missing:
+            self._index_name(row["id"], row["product_name"])
+        # Count products stored before the counters table existed
+        if self.db.execute(f"SELECT 1 FROM {STATS_TABLE} LIMIT 1").fetchone() is None:
+            for row in self.db.execute(f"SELECT * FROM {PRODUCTS_TABLE}").fetchall():
+                self._count(dict(row))
+        self.db.commit()
+
+    def _index_name(self, product_id: str, product_name: str) -> None:
+        self.db.executemany(
+            f"INSERT OR IGNORE INTO {TRIGRAMS_TABLE} (trigram, product_id) VALUES (?, ?)",
+            [(trigram, product_id) for trigram in name_trigrams(product_name)]
+        )
+
+    def _count(self, row: Dict[str, Any]) -> None:
+        self.db.executemany(
+            f"INSERT INTO {STATS_TABLE} (metric, bucket, count, total) VALUES (?, ?, 1, ?) "
+            f"ON CONFLICT (metric, bucket) DO UPDATE SET count = count + 1, total = total + excluded.total",
+            stat_counters(row)
+        )
+
+    def _insert(self, table: str, row: Dict[str, Any]) -> None:
+        columns = ", ".join(row)
+        placeholders = ", ".join("?" for _ in row)
+        cursor = self.db.execute(f"INSERT OR IGNORE INTO {table} ({columns}) VALUES ({placeholders})",
+                                 tuple(row.values()))
+        # Keep the stats counters in step with the products table, like the Supabase trigger;
+        # a replayed write that was already stored is ignored and not counted twice
+        if table == PRODUCTS_TABLE and cursor.rowcount:
+            self._count(row)
+
+    def save_products(self, entries):
+        rows = [entry_rows(*entry) for entry in entries]
+        with self.lock, self.db:
+            for main_row, alternative_rows in rows:
+                self._insert(PRODUCTS_TABLE, main_row)
+                self._index_name(main_row["id"], main_row["product_name"])
+                for row in alternative_rows:
+                    self._insert(ALTERNATIVES_TABLE, row)
+
+    def get_product(self, product_id: str):
+        with self.lock:
+            product = self.db.execute(f"SELECT * FROM {PRODUCTS_TABLE} WHERE id = ?", (product_id,)).fetchone()
+            if product is None:
+                return None
+            alternatives = self.db.execute(
+                f"SELECT * FROM {ALTERNATIVES_TABLE} WHERE product_id = ? ORDER BY rowid", (product_id,)
+            ).fetchall()
+        return dict(product), [dict(row) for row in alternatives]
+
+    def list_products(self, limit=20, cursor=None, search=None, dustbin_color=None, recyclable=None,
+                      biodegradable=None, min_rating=None, max_rating=None, min_price=None, max_price=None):
+        source, columns, order = PRODUCTS_TABLE, ", ".join(LIST_COLUMNS), "created_at DESC, id DESC"
+        clauses, params = [], []
+        trigrams = sorted(name_trigrams(search)) if search else []
+        if trigrams:
+            # Score each name by the share of the query's trigrams it contains, like word_similarity
+            source += (
+                f" JOIN (SELECT product_id, COUNT(*) * 1.0 / ? AS score FROM {TRIGRAMS_TABLE} "
+                f"WHERE trigram IN ({', '.join('?' for _ in trigrams)}) "
+                f"GROUP BY product_id HAVING COUNT(*) >= ?) ON product_id = id"
+            )
+            params.extend((len(trigrams), *trigrams, max(1, math.ceil(len(trigrams) * SEARCH_SIMILARITY))))
+            columns += ", score"
+            order = "score DESC, " + order
+        for column, value in (("dustbin_color", dustbin_color), ("sustainability_recyclable", recyclable),
+                              ("sustainability_biodegradable", biodegradable)):
+            if value:
+                clauses.append(f"{column} = ? COLLATE NOCASE")
+                params.append(value)
+        for column, op, value in (("sustainability_rating", ">=", min_rating), ("sustainability_rating", "<=", max_rating),
+                                  ("price", ">=", min_price), ("price", "<=", max_price)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        if cursor and trigrams:
+            clauses.append("(score, created_at, id) < (?, ?, ?)")
+            params.extend(decode_cursor(cursor, ranked=True))
+        elif cursor:
+            clauses.append("(created_at, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = f"SELECT {columns} FROM {source} {where} ORDER BY {order} LIMIT ?"
+        with self.lock:
+            rows = [dict(row) for row in self.db.execute(query, (*params, limit + 1)).fetchall()]
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return [without_score(row) for row in rows[:limit]], next_cursor
+
+    def get_stats(self):
+        # Counter rows kept up to date by _insert and delete_all, whatever the table size
+        with self.lock:
+            rows = self.db.execute(f"SELECT metric, bucket, count, total FROM {STATS_TABLE}").fetchall()
+        return summarize_counters([dict(row) for row in rows])
+
+    def delete_all(self):
+        with self.lock, self.db:
+            self.db.execute(f"DELETE FROM {TRIGRAMS_TABLE}")
+            self.db.execute(f"DELETE FROM {STATS_TABLE}")
+            alternatives = self.db.execute(f"DELETE FROM {ALTERNATIVES_TABLE}").rowcount
+            products = self.db.execute(f"DELETE FROM {PRODUCTS_TABLE}").rowcount
+        return alternatives, products
+
+    def ping(self):
+        with self.lock:
+            self.db.execute(f"SELECT 1 FROM {PRODUCTS_TABLE} LIMIT 1").fetchall()
+
+
+def open_repository(spec: str, supabase_client=None, rpc_name: Optional[str] = None) -> ProductRepository:
+    """Open 'supabase' or 'sqlite:<path>' as a product repository.
+
+    To copy a local store upstream, wrap it in write_behind.SyncedProductRepository.
+    """
+    if spec.startswith("sqlite"):
+        _, _, path = spec.partition(":")
+        return SQLiteProductRepository(path or "products.sqlite3")
+    if spec == "supabase":
+        return SupabaseProductRepository(supabase_client, rpc_name=rpc_name)
+    raise ValueError(f"Unknown product store: {spec}")
@@ -0,0 +1,186 @@
+# product_cache.py
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+PUNCTUATION = re.compile(r'[^\w\s]')
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_product_key(name: str) -> str:
+    """Fold case, accents, punctuation and whitespace so equivalent names share a key."""
+    text = unicodedata.normalize("NFKD", str(name))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = PUNCTUATION.sub(" ", text.casefold()).replace("_", " ")
+    return WHITESPACE.sub(" ", text).strip()
+
+
+def normalize_url_key(url: str) -> str:
+    """Fold scheme/host case, fragments and trailing slashes so equivalent URLs share a key."""
+    parts = urlsplit(str(url).strip())
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+
+class ProductCache:
+    """Two-tier cache of product analyses keyed on the normalized product name.
+
+    An in-memory LRU answers repeat scans without any I/O; a SQLite file
+    keeps entries across restarts. Both tiers expire entries after `ttl`
+    seconds and keep hit/miss counters for monitoring. Keys are normalized
+    product names unless `key_func` (e.g. normalize_url_key) says otherwise.
+    Expired entries are kept for a further `stale_ttl` seconds, where only
+    get_stale() returns them, as a fallback while the model is unavailable.
+    """
+
+    def __init__(self, path: Optional[str] = "product_cache.sqlite3", ttl: float = 7 * 24 * 3600,
+                 max_memory_entries: int = 1000, max_disk_entries: int = 50000, namespace: str = "product",
+                 key_func: Optional[Callable[[str], str]] = None, stale_ttl: float = 0.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.key_func = key_func
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.namespace = namespace
+        self.memory = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "stale_hits": 0}
+
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            self.db.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache_entries (namespace, accessed_at)")
+            self.db.commit()
+
+    def key_for(self, name: str) -> str:
+        return (self.key_func or normalize_product_key)(name)
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for a product name, or None on a miss."""
+        key = self.key_for(name)
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self.memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                if expires_at + self.stale_ttl <= now:
+                    del self.memory[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    value = json.loads(row[0])
+                    self.db.execute(
+                        "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                        (now, self.namespace, key)
+                    )
+                    self.db.commit()
+                    self._remember(key, row[1], value)
+                    self.stats["disk_hits"] += 1
+                    return value
+
+            self.stats["misses"] += 1
+            return None
+
+    def get_stale(self, name: str) -> Optional[Dict[str, Any]]:
+        """Return a value even if it has expired, as long as it is within the stale window."""
+        key = self.key_for(name)
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None and self.db is not None:
+                row = self.db.execute(
+                    "SELECT expires_at, value FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+                entry = (row[0], json.loads(row[1])) if row is not None else None
+            if entry is None or entry[0] + self.stale_ttl <= now:
+                return None
+            self.stats["stale_hits"] += 1
+            return entry[1]
+
+    def set(self, name: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Store a value in both tiers, optionally with its own time to live."""
+        key = self.key_for(name)
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self._remember(key, expires_at, value)
+            self.stats["writes"] += 1
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value), expires_at, now)
+                )
+                # Pruning scans the table, so only do it every so often
+                if self.stats["writes"] % 100 == 0:
+                    self._prune_disk(now)
+                self.db.commit()
+
+    def invalidate(self, name: str) -> None:
+        key = self.key_for(name)
+        with self.lock:
+            self.memory.pop(key, None)
+            if self.db is not None:
+                self.db.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                self.db.commit()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+                self.db.commit()
+
+    def _remember(self, key, expires_at, value):
+        """Insert into the memory tier, evicting least recently used entries."""
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _prune_disk(self, now):
+        """Drop rows past their stale window and the least recently used rows above the size limit."""
+        self.db.execute("DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+                        (self.namespace, now - self.stale_ttl))
+        self.db.execute("""
+            DELETE FROM cache_entries WHERE namespace = ? AND key IN (
+                SELECT key FROM cache_entries WHERE namespace = ?
+                ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.namespace, self.namespace, self.max_disk_entries))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,78 @@
+# product_schema.py
+import hashlib
+import json
+from typing import Any, Dict, Tuple
+
+NUTRIENT_FIELDS = (
+    "Calories", "Total_Fat", "Saturated_Fat", "Trans_Fat", "Cholesterol", "Sodium",
+    "Total_Carbohydrates", "Dietary_Fiber", "Total_Sugars", "Added_Sugars", "Protein",
+    "Vitamin_D", "Calcium", "Iron", "Potassium"
+)
+
+NUMBER = {"type": "number"}
+STRING = {"type": "string"}
+YES_NO = {"type": "string", "enum": ["Yes", "No"]}
+
+
+def object_schema(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """A strict object schema: every property required, nothing else allowed."""
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+HEALTH_SCHEMA = object_schema({
+    "Nutrients": object_schema({name: NUMBER for name in NUTRIENT_FIELDS}),
+    "Ingredients": {"type": "array", "items": STRING},
+    "Health_index": NUMBER
+})
+
+SUSTAINABILITY_SCHEMA = object_schema({
+    "Biodegradable": YES_NO,
+    "Recyclable": YES_NO,
+    "Sustainability_rating": NUMBER
+})
+
+ALTERNATIVE_PROPERTIES = {
+    "Name": STRING,
+    "Brand": STRING,
+    "Health_Information": HEALTH_SCHEMA,
+    "Sustainability_Information": SUSTAINABILITY_SCHEMA,
+    "Price": NUMBER,
+    "Reliability_index": NUMBER,
+    "Key_Differences": STRING
+}
+
+PRODUCT_PROPERTIES = {
+    "Health_Information": HEALTH_SCHEMA,
+    "Sustainability_Information": SUSTAINABILITY_SCHEMA,
+    "Price": NUMBER,
+    "Reliability_index": NUMBER,
+    "Color_of_the_dustbin": {"type": "string", "enum": ["blue", "green", "black"]},
+    "Technical_Specifications": object_schema({"Material": STRING}),
+    "Alternatives": {"type": "array", "items": object_schema(ALTERNATIVE_PROPERTIES)}
+}
+
+
+def response_format(name: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Chat completions response_format constraining the reply to a strict JSON schema."""
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": object_schema(properties)}}
+
+
+def batch_properties(name_field: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Properties of a grouped reply: a "Products" list of named products."""
+    return {"Products": {"type": "array", "items": object_schema({name_field: STRING, **properties})}}
+
+
+def pick(properties: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    return {field: properties[field] for field in fields}
+
+
+def request_fingerprint(model_options: Dict[str, Any], prompt_version: str, key: str) -> str:
+    """Stable id of a model request: the model settings, the prompt version and the normalized subject.
+
+    Identical requests share a fingerprint, so their results can be cached
+    and compared; changing the model, temperature, schema or prompt
+    version changes it.
+    """
+    payload = json.dumps({"model": model_options, "prompt_version": prompt_version, "key": key},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
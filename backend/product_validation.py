@@ -0,0 +1,285 @@
+# product_validation.py
+"""Shared validation of model analyses for infoBot and urlBot.
+
+Each record lists its fields once as (attribute, JSON key, spec). A spec
+turns whatever the model wrote into a clean value or its default, so a
+payload is validated in one pass over the fields and never raises. The
+services use the cleaned JSON from validate_product; Product.from_model
+gives typed records. Both services use the same defaults and ranges:
+ratings between 1.0 and 5.0 (the scale the frontend shows), non-negative
+prices, Yes/No flags and one of the three dustbin colours.
+"""
+import json
+import math
+from dataclasses import dataclass
+from typing import Any, ClassVar, Dict, List, Optional, Tuple
+
+from json_stream import NUMBER_PATTERN
+
+DEFAULT_RATING = 4.0
+DEFAULT_PRICE = 9.99
+RATING_RANGE = (1.0, 5.0)
+MAX_ALTERNATIVES = 3
+
+
+class Number:
+    """A number within [low, high]; values outside are clamped, or replaced by the default if clamp is False."""
+
+    __slots__ = ("default", "low", "high", "clamp")
+
+    def __init__(self, default: float, low: float = -math.inf, high: float = math.inf, clamp: bool = True):
+        self.default = default
+        self.low = low
+        self.high = high
+        self.clamp = clamp
+
+    def __call__(self, value: Any) -> float:
+        if type(value) is float or type(value) is int:
+            number = float(value)
+            if not math.isfinite(number):
+                return self.default
+        elif isinstance(value, str):
+            # The first number in text such as "4.99", "$4.99", "120 kcal" or "4.5/5"; searching
+            # directly avoids raising and catching ValueError for every unit or "N/A"
+            match = NUMBER_PATTERN.search(value.replace(",", "") if "," in value else value)
+            if match is None:
+                return self.default
+            number = float(match.group())
+        else:
+            return self.default
+        if number < self.low:
+            return self.low if self.clamp else self.default
+        if number > self.high:
+            return self.high if self.clamp else self.default
+        return number
+
+
+class Choice:
+    """One of a fixed set of strings, matched case-insensitively."""
+
+    __slots__ = ("lookup", "default")
+
+    def __init__(self, choices: Tuple[str, ...], default: str):
+        self.lookup = {**{choice.lower(): choice for choice in choices}, **{choice: choice for choice in choices}}
+        self.default = default
+
+    def __call__(self, value: Any) -> str:
+        if isinstance(value, str):
+            # Most values already match exactly; only the rest are stripped and lowercased
+            choice = self.lookup.get(value)
+            return choice if choice is not None else self.lookup.get(value.strip().lower(), self.default)
+        return self.default
+
+
+class Text:
+    """A non-empty string; with no default, missing values stay None."""
+
+    __slots__ = ("default",)
+
+    def __init__(self, default: Optional[str] = None):
+        self.default = default
+
+    def __call__(self, value: Any) -> Optional[str]:
+        if isinstance(value, str):
+            return value.strip() or self.default
+        return self.default if value is None else str(value)
+
+
+def mapping(value: Any) -> Dict[str, Any]:
+    """A JSON object; the model sometimes writes one as a JSON string."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def sequence(value: Any) -> List[Any]:
+    if isinstance(value, list):
+        return value
+    return list(value) if isinstance(value, tuple) else []
+
+
+class Nested:
+    """A sub-record, written back as a JSON object."""
+
+    __slots__ = ("record",)
+
+    def __init__(self, record: type):
+        self.record = record
+
+
+class NestedList:
+    """Up to `limit` sub-records, written back as a JSON list."""
+
+    __slots__ = ("record", "limit")
+
+    def __init__(self, record: type, limit: int):
+        self.record = record
+        self.limit = limit
+
+
+RATING = Number(DEFAULT_RATING, *RATING_RANGE)
+PRICE = Number(DEFAULT_PRICE, low=0.0, clamp=False)
+BIODEGRADABLE = Choice(("Yes", "No"), "No")
+RECYCLABLE = Choice(("Yes", "No"), "Yes")
+DUSTBIN_COLOR = Choice(("blue", "green", "black"), "blue")
+OPTIONAL_TEXT = Text()
+
+Field = Tuple[str, str, Any]
+
+
+class Record:
+    """Base of the validated records: built from and written back to the model's JSON layout.
+
+    Fields whose spec can return None (Text without a default) are left
+    out of the JSON when empty.
+    """
+
+    __slots__ = ()
+    FIELDS: ClassVar[Tuple[Field, ...]] = ()
+
+    @classmethod
+    def clean(cls, data: Any) -> Dict[str, Any]:
+        """Validate model JSON straight into the JSON layout the services return."""
+        if not isinstance(data, dict):
+            data = {}
+        result = {}
+        for _, key, spec in cls.FIELDS:
+            value = data.get(key)
+            if isinstance(spec, Nested):
+                value = spec.record.clean(value)
+            elif isinstance(spec, NestedList):
+                value = [spec.record.clean(item) for item in sequence(value)[:spec.limit]]
+            else:
+                value = spec(value)
+                if value is None:
+                    continue
+            result[key] = value
+        return result
+
+    @classmethod
+    def from_model(cls, data: Any) -> "Record":
+        if not isinstance(data, dict):
+            data = {}
+        values = {}
+        for attribute, key, spec in cls.FIELDS:
+            value = data.get(key)
+            if isinstance(spec, Nested):
+                values[attribute] = spec.record.from_model(value)
+            elif isinstance(spec, NestedList):
+                values[attribute] = [spec.record.from_model(item) for item in sequence(value)[:spec.limit]]
+            else:
+                values[attribute] = spec(value)
+        return cls(**values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The JSON layout the services return."""
+        result = {}
+        for attribute, key, spec in self.FIELDS:
+            value = getattr(self, attribute)
+            if isinstance(spec, Nested):
+                value = value.to_dict()
+            elif isinstance(spec, NestedList):
+                value = [item.to_dict() for item in value]
+            elif value is None:
+                continue
+            result[key] = value
+        return result
+
+
+@dataclass(slots=True)
+class HealthInformation(Record):
+    nutrients: Dict[str, Any]
+    ingredients: List[Any]
+    health_index: float
+
+    FIELDS: ClassVar[Tuple[Field, ...]] = (
+        ("nutrients", "Nutrients", mapping),
+        ("ingredients", "Ingredients", sequence),
+        ("health_index", "Health_index", RATING),
+    )
+
+
+@dataclass(slots=True)
+class SustainabilityInformation(Record):
+    biodegradable: str
+    recyclable: str
+    sustainability_rating: float
+
+    FIELDS: ClassVar[Tuple[Field, ...]] = (
+        ("biodegradable", "Biodegradable", BIODEGRADABLE),
+        ("recyclable", "Recyclable", RECYCLABLE),
+        ("sustainability_rating", "Sustainability_rating", RATING),
+    )
+
+
+@dataclass(slots=True)
+class ProductAlternative(Record):
+    name: str
+    brand: str
+    health_info: HealthInformation
+    sustainability_info: SustainabilityInformation
+    price: float
+    reliability_index: float
+    key_differences: str
+
+    FIELDS: ClassVar[Tuple[Field, ...]] = (
+        ("name", "Name", Text("Alternative Product")),
+        ("brand", "Brand", Text("Unknown Brand")),
+        ("health_info", "Health_Information", Nested(HealthInformation)),
+        ("sustainability_info", "Sustainability_Information", Nested(SustainabilityInformation)),
+        ("price", "Price", PRICE),
+        ("reliability_index", "Reliability_index", RATING),
+        ("key_differences", "Key_Differences", Text("Alternative product option")),
+    )
+
+
+@dataclass(slots=True)
+class Product(Record):
+    product_name: Optional[str]
+    health_info: HealthInformation
+    sustainability_info: SustainabilityInformation
+    price: float
+    reliability_index: float
+    dustbin_color: str
+    alternatives: List[ProductAlternative]
+    request_fingerprint: Optional[str]
+
+    FIELDS: ClassVar[Tuple[Field, ...]] = (
+        ("product_name", "product_name", OPTIONAL_TEXT),
+        ("health_info", "Health_Information", Nested(HealthInformation)),
+        ("sustainability_info", "Sustainability_Information", Nested(SustainabilityInformation)),
+        ("price", "Price", PRICE),
+        ("reliability_index", "Reliability_index", RATING),
+        ("dustbin_color", "Color_of_the_dustbin", DUSTBIN_COLOR),
+        ("alternatives", "Alternatives", NestedList(ProductAlternative, MAX_ALTERNATIVES)),
+        ("request_fingerprint", "Request_Fingerprint", OPTIONAL_TEXT),
+    )
+
+
+def placeholder_alternative(index: int) -> ProductAlternative:
+    """Stand-in used when the model returns fewer alternatives than required."""
+    return ProductAlternative(
+        name=f"Alternative {index + 1}",
+        brand="Generic Brand",
+        health_info=HealthInformation({}, [], DEFAULT_RATING),
+        sustainability_info=SustainabilityInformation("No", "Yes", DEFAULT_RATING),
+        price=DEFAULT_PRICE,
+        reliability_index=DEFAULT_RATING,
+        key_differences="Alternative product option"
+    )
+
+
+def validate_product(data: Any, min_alternatives: int = 0) -> Dict[str, Any]:
+    """Validate a model analysis, padding its alternatives up to min_alternatives."""
+    product = Product.clean(data)
+    alternatives = product["Alternatives"]
+    while len(alternatives) < min_alternatives:
+        alternatives.append(placeholder_alternative(len(alternatives)).to_dict())
+    return product
+
+
+def validate_alternative(data: Any) -> Dict[str, Any]:
+    return ProductAlternative.clean(data)
@@ -0,0 +1,122 @@
+# single_flight.py
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one upstream call.
+
+    The first caller for a key becomes the leader and runs the work; callers
+    that arrive while it is in flight wait for the leader's result instead
+    of repeating the call. Flask async views each run on their own event
+    loop thread, so the hand-off uses a thread-safe concurrent Future.
+
+    With enabled=False every caller leads its own call, which gives the
+    uncoalesced baseline that load_test.py --baseline measures against.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.in_flight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def _join(self, key: str):
+        """Return (future, is_leader) for a key."""
+        with self.lock:
+            if not self.enabled:
+                self.stats["leaders"] += 1
+                return Future(), True
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.stats["followers"] += 1
+                return future, False
+            future = Future()
+            self.in_flight[key] = future
+            self.stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future):
+        with self.lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Await work() once per key across all concurrent callers."""
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            result = await work()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key, future)
+
+    async def do_many(self, keys: List[str], work: Callable[[List[str]], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Batch variant of do(): run work() once for the keys nobody else has in flight.
+
+        work(keys) gets the keys this caller leads and returns a result or
+        an exception for each of them; the other keys wait for their
+        leaders. Returns a result or an exception for every key, so one
+        failed key does not fail the rest.
+        """
+        joined = {key: self._join(key) for key in dict.fromkeys(keys)}
+        led = [key for key, (_, is_leader) in joined.items() if is_leader]
+        outcomes: Dict[str, Any] = {}
+        try:
+            if led:
+                outcomes = await work(led)
+        except BaseException as e:
+            for key in led:
+                joined[key][0].set_exception(e)
+            raise
+        else:
+            for key in led:
+                outcome = outcomes.get(key, KeyError(f"No result for {key}"))
+                if isinstance(outcome, BaseException):
+                    joined[key][0].set_exception(outcome)
+                else:
+                    joined[key][0].set_result(outcome)
+        finally:
+            for key in led:
+                self._finish(key, joined[key][0])
+
+        results = {}
+        for key, (future, is_leader) in joined.items():
+            if is_leader:
+                results[key] = outcomes.get(key, KeyError(f"No result for {key}"))
+                continue
+            try:
+                results[key] = await asyncio.wrap_future(future)
+            except Exception as e:
+                results[key] = e
+        return results
+
+    def do_sync(self, key: str, work: Callable[[], Any]) -> Any:
+        """Blocking variant of do() for worker threads."""
+        future, is_leader = self._join(key)
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = work()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._finish(key, future)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {**self.stats, "in_flight": len(self.in_flight)}
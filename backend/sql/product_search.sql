@@ -0,0 +1,65 @@
+-- Indexes behind GET /products: newest-first keyset pagination, the
+-- range and equality filters, and fuzzy name search through
+-- search_products() below.
+create extension if not exists pg_trgm;
+
+alter table product_information add column if not exists created_at timestamptz not null default now();
+
+create index if not exists idx_products_created on product_information (created_at desc, id desc);
+create index if not exists idx_products_price on product_information (price);
+create index if not exists idx_products_rating on product_information (sustainability_rating);
+create index if not exists idx_products_color on product_information (lower(dustbin_color));
+create index if not exists idx_products_name_trgm on product_information using gin (product_name gin_trgm_ops);
+create index if not exists idx_alternatives_product on product_alternatives (product_id);
+
+-- Fuzzy name search for GET /products?q=..., best matches first. A name
+-- matches when one of its words is close to the query (word_similarity at
+-- or above pg_trgm.word_similarity_threshold, 0.6 by default, the same as
+-- SEARCH_SIMILARITY in persistence.py), so typos still match; the <%
+-- operator is served by idx_products_name_trgm. Pages continue after the
+-- (score, created_at, id) of the last row of the previous page.
+create or replace function search_products(
+    search_query text,
+    result_limit integer default 20,
+    color_filter text default null,
+    recyclable_filter text default null,
+    biodegradable_filter text default null,
+    min_rating double precision default null,
+    max_rating double precision default null,
+    min_price double precision default null,
+    max_price double precision default null,
+    after_score real default null,
+    after_created_at timestamptz default null,
+    after_id uuid default null
+)
+returns setof jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'id', p.id,
+        'product_name', p.product_name,
+        'health_index', p.health_index,
+        'sustainability_biodegradable', p.sustainability_biodegradable,
+        'sustainability_recyclable', p.sustainability_recyclable,
+        'sustainability_rating', p.sustainability_rating,
+        'price', p.price,
+        'reliability_index', p.reliability_index,
+        'dustbin_color', p.dustbin_color,
+        'created_at', p.created_at,
+        'score', m.score
+    )
+    from product_information p
+    cross join lateral (select word_similarity(search_query, p.product_name) as score) m
+    where search_query <% p.product_name
+      and (color_filter is null or lower(p.dustbin_color) = lower(color_filter))
+      and (recyclable_filter is null or lower(p.sustainability_recyclable) = lower(recyclable_filter))
+      and (biodegradable_filter is null or lower(p.sustainability_biodegradable) = lower(biodegradable_filter))
+      and (min_rating is null or p.sustainability_rating >= min_rating)
+      and (max_rating is null or p.sustainability_rating <= max_rating)
+      and (min_price is null or p.price >= min_price)
+      and (max_price is null or p.price <= max_price)
+      and (after_id is null or (m.score, p.created_at, p.id) < (after_score, after_created_at, after_id))
+    order by m.score desc, p.created_at desc, p.id desc
+    limit result_limit;
+$$;
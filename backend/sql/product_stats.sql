@@ -0,0 +1,83 @@
+-- Running aggregates over product_information, kept up to date by a trigger
+-- so GET /stats reads a handful of rows whatever the table size.
+-- Bucket lower bounds must match PRICE_BUCKETS in persistence.py.
+create table if not exists product_stats_counters (
+    metric text not null,
+    bucket text not null,
+    count bigint not null default 0,
+    total double precision not null default 0,
+    primary key (metric, bucket)
+);
+
+create or replace function bump_product_stat(m text, b text, delta integer, amount double precision)
+returns void
+language sql
+as $$
+    insert into product_stats_counters as c (metric, bucket, count, total)
+    values (m, b, delta, coalesce(amount, 0) * delta)
+    on conflict (metric, bucket)
+    do update set count = c.count + excluded.count, total = c.total + excluded.total;
+$$;
+
+create or replace function apply_product_stats(p product_information, delta integer)
+returns void
+language plpgsql
+as $$
+begin
+    perform bump_product_stat('total', '', delta, 0);
+    if p.sustainability_rating is not null then
+        perform bump_product_stat('sustainability_rating', 'all', delta, p.sustainability_rating);
+        perform bump_product_stat('sustainability_rating_bucket',
+            least(greatest(floor(p.sustainability_rating)::integer, 0), 4)::text, delta, 0);
+    end if;
+    if p.price is not null then
+        perform bump_product_stat('price', 'all', delta, p.price);
+        perform bump_product_stat('price_bucket', case
+            when p.price >= 50 then '50'
+            when p.price >= 20 then '20'
+            when p.price >= 10 then '10'
+            when p.price >= 5 then '5'
+            else '0' end, delta, 0);
+    end if;
+    if p.health_index is not null then
+        perform bump_product_stat('health_index', 'all', delta, p.health_index);
+    end if;
+    perform bump_product_stat('dustbin_color', coalesce(p.dustbin_color, 'unknown'), delta, 0);
+    perform bump_product_stat('recyclable', coalesce(p.sustainability_recyclable::text, 'unknown'), delta, 0);
+    perform bump_product_stat('biodegradable', coalesce(p.sustainability_biodegradable::text, 'unknown'), delta, 0);
+end;
+$$;
+
+create or replace function product_stats_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform apply_product_stats(old, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform apply_product_stats(new, 1);
+    end if;
+    return null;
+end;
+$$;
+
+-- Install the trigger and backfill in one transaction, with writes to
+-- product_information blocked until both are done, so no row is counted
+-- twice (by the trigger and the backfill) or missed by both. Share row
+-- exclusive is the lock create trigger needs anyway; it still allows reads.
+begin;
+
+lock table product_information in share row exclusive mode;
+
+drop trigger if exists product_stats_maintain on product_information;
+create trigger product_stats_maintain
+    after insert or update or delete on product_information
+    for each row execute function product_stats_trigger();
+
+-- Backfill from the rows that already exist
+truncate product_stats_counters;
+select apply_product_stats(p, 1) from product_information p;
+
+commit;
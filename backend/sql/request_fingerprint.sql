@@ -0,0 +1,7 @@
+-- Records which model request produced each analysis: a hash of the model
+-- settings, prompt version and normalized product name or URL. Rows with the
+-- same fingerprint came from identical requests and can be compared directly.
+-- Run before save_product_with_alternatives.sql, which inserts the column.
+alter table product_information add column if not exists request_fingerprint text;
+
+create index if not exists idx_products_fingerprint on product_information (request_fingerprint);
@@ -0,0 +1,40 @@
+-- Writes a product and its alternatives in one transaction.
+-- Enable in the services with SUPABASE_SAVE_RPC=save_product_with_alternatives.
+-- Ids are assigned by the caller, so replaying the same call is a no-op.
+-- Requires the request_fingerprint column from request_fingerprint.sql.
+create or replace function save_product_with_alternatives(product jsonb, alternatives jsonb)
+returns uuid
+language plpgsql
+as $$
+declare
+    new_id uuid;
+begin
+    new_id := coalesce((product->>'id')::uuid, gen_random_uuid());
+
+    insert into product_information (
+        id, product_name, health_nutrients, health_ingredients, health_index,
+        sustainability_biodegradable, sustainability_recyclable, sustainability_rating,
+        price, reliability_index, dustbin_color, request_fingerprint
+    )
+    select
+        new_id, p.product_name, p.health_nutrients, p.health_ingredients, p.health_index,
+        p.sustainability_biodegradable, p.sustainability_recyclable, p.sustainability_rating,
+        p.price, p.reliability_index, p.dustbin_color, p.request_fingerprint
+    from jsonb_populate_record(null::product_information, product) as p
+    on conflict (id) do nothing;
+
+    insert into product_alternatives (
+        id, product_id, alternative_name, health_nutrients, health_ingredients, health_index,
+        sustainability_biodegradable, sustainability_recyclable, sustainability_rating,
+        price, reliability_index
+    )
+    select
+        coalesce(a.id, gen_random_uuid()), new_id, a.alternative_name, a.health_nutrients,
+        a.health_ingredients, a.health_index, a.sustainability_biodegradable,
+        a.sustainability_recyclable, a.sustainability_rating, a.price, a.reliability_index
+    from jsonb_populate_recordset(null::product_alternatives, alternatives) as a
+    on conflict (id) do nothing;
+
+    return new_id;
+end;
+$$;
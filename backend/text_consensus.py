@@ -0,0 +1,108 @@
+# text_consensus.py
+import re
+from collections import Counter, deque
+from difflib import SequenceMatcher
+
+# Digits OCR commonly reads in place of letters inside words
+OCR_CONFUSIONS = str.maketrans({"0": "o", "1": "l", "5": "s", "8": "b", "|": "l"})
+NON_ALNUM = re.compile(r'[^a-z0-9\s]')
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Fold case, punctuation and common OCR digit/letter swaps."""
+    words = []
+    for word in WHITESPACE.split(NON_ALNUM.sub(' ', text.lower())):
+        if not word:
+            continue
+        # Only fix digits inside words that are mostly letters, so sizes like 500 survive
+        if sum(ch.isalpha() for ch in word) > len(word) / 2:
+            word = word.translate(OCR_CONFUSIONS)
+        words.append(word)
+    return " ".join(words)
+
+
+def compact_key(text):
+    """Normalized text without spaces, so "Coca Cola" and "CocaCola" compare equal."""
+    return normalize_text(text).replace(" ", "")
+
+
+class TextConsensus:
+    """Sliding-window vote over OCR results from consecutive inferences.
+
+    Texts from the last `window` observations are clustered by fuzzy
+    similarity; a cluster becomes a stable product name once it was seen in
+    at least `min_confidence` of the window. Like
+    vision_processor.VisionProcessor.create_text_corpus, the most frequent
+    spelling wins, so jitter such as "Coca-Co1a" collapses into "Coca Cola".
+    """
+
+    def __init__(self, window=4, min_confidence=0.5, similarity=0.8):
+        self.window = window
+        self.min_confidence = min_confidence
+        self.similarity = similarity
+        self.reset()
+
+    def reset(self):
+        self.observations = deque(maxlen=self.window)
+        self.stable = []  # Names currently at consensus, in the order they got there
+
+    def similar(self, key_a, key_b):
+        return key_a == key_b or SequenceMatcher(None, key_a, key_b).ratio() >= self.similarity
+
+    def cluster(self):
+        """Group texts in the window; returns [{key, votes, spellings}] in first-seen order."""
+        clusters = []
+        for observation in self.observations:
+            seen_in_observation = set()
+            for text in observation:
+                key = compact_key(text)
+                if not key:
+                    continue
+                for index, cluster in enumerate(clusters):
+                    if self.similar(key, cluster["key"]):
+                        break
+                else:
+                    index = len(clusters)
+                    clusters.append({"key": key, "votes": 0, "spellings": Counter()})
+                cluster = clusters[index]
+                cluster["spellings"][text.strip()] += 1
+                if index not in seen_in_observation:
+                    cluster["votes"] += 1
+                    seen_in_observation.add(index)
+        return clusters
+
+    def update(self, texts):
+        """Add one inference result (possibly empty) and return the stable names."""
+        self.observations.append([text for text in texts if text])
+
+        stable = []
+        for cluster in self.cluster():
+            if cluster["votes"] / self.window < self.min_confidence:
+                continue
+            # Keep a name once it is stable so small spelling shifts don't re-trigger lookups
+            name = next((name for name in self.stable if self.similar(compact_key(name), cluster["key"])), None)
+            if name is None:
+                name = max(cluster["spellings"].items(), key=lambda item: (item[1], len(item[0])))[0]
+            if name not in stable:
+                stable.append(name)
+
+        # Preserve the order in which names first reached consensus
+        self.stable = [name for name in self.stable if name in stable] + \
+                      [name for name in stable if name not in self.stable]
+        return list(self.stable)
+
+    def has_candidates(self):
+        """True when some text is in the window but has not reached consensus yet."""
+        return any(
+            cluster["votes"] / self.window < self.min_confidence
+            for cluster in self.cluster()
+        )
+
+    def get_metrics(self):
+        return {
+            "window": self.window,
+            "min_confidence": self.min_confidence,
+            "observations": len(self.observations),
+            "stable": list(self.stable)
+        }
@@ -0,0 +1,73 @@
+# upstream.py
+import asyncio
+import functools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterator
+
+
+class UpstreamRunner:
+    """Runs upstream I/O for a Flask service on one long-lived event loop.
+
+    Flask executes each async view on its own short-lived event loop, so an
+    async HTTP client shared between requests would be tied to whichever
+    loop used it first. Scheduling model calls on this dedicated loop lets
+    every request share one connection pool and keeps dozens of calls in
+    flight. Blocking clients (the supabase query builder) are offloaded to
+    a bounded thread pool instead of stalling the caller's loop.
+    """
+
+    def __init__(self, max_blocking_workers: int = 16, name: str = "upstream"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name=f"{name}-loop")
+        self.thread.start()
+        self.executor = ThreadPoolExecutor(max_workers=max_blocking_workers,
+                                           thread_name_prefix=f"{name}-blocking")
+
+    async def run(self, coro: Awaitable[Any]) -> Any:
+        """Await a coroutine on the upstream loop from any event loop."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def run_sync(self, coro: Awaitable[Any]) -> Any:
+        """Blocking variant of run() for plain threads."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def offload(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking call on the bounded executor without blocking the caller's loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+
+    def stream(self, producer: Callable[[Callable[[Any], None]], Awaitable[None]]) -> Iterator[Any]:
+        """Run producer(emit) on the upstream loop and yield what it emits.
+
+        For streaming responses: WSGI servers iterate the response body on a
+        plain thread, so items cross over through a thread-safe queue. An
+        exception raised by the producer is re-raised after the items it
+        emitted, and closing the iterator early cancels the producer.
+        """
+        items = queue.Queue()
+        finished = object()
+
+        async def run():
+            try:
+                await producer(items.put)
+            finally:
+                items.put(finished)
+
+        future = asyncio.run_coroutine_threadsafe(run(), self.loop)
+        try:
+            while True:
+                item = items.get()
+                if item is finished:
+                    break
+                yield item
+            future.result()
+        finally:
+            future.cancel()
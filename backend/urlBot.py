@@ -1,20 +1,32 @@
 #urlBot.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 import json
+import hashlib
+import math
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 from supabase import create_client, Client
 import traceback
 import logging.handlers
 import sys
+import time
 from pathlib import Path
-from dataclasses import dataclass
 from enum import Enum
+from single_flight import SingleFlight
+from product_cache import ProductCache, normalize_url_key
+from upstream import UpstreamRunner
+from persistence import ProductRepository, SupabaseProductRepository, open_repository, product_from_row, alternative_from_row, entry_rows, new_product_id
+from write_behind import SyncedProductRepository, WriteBehindQueue
+from batching import chunked, dedupe, gather_bounded, match_group_results
+from json_stream import STREAM_MIMETYPES, encode_events, requested_stream_mode
+from model_client import ModelClient, ModelUnavailableError
+from product_schema import request_fingerprint
+from product_validation import validate_alternative, validate_product
 
 # Create logs directory if it doesn't exist
 Path("logs").mkdir(exist_ok=True)
@@ -48,6 +60,58 @@ logger.addHandler(file_handler)
 load_dotenv()
 logger.info("Environment variables loaded")
 
+# Model settings shared by the blocking and streaming analyses; fixed so the same URL gets the same answer.
+# gpt-4-turbo-preview only supports JSON mode, not schema-constrained output.
+MODEL_OPTIONS = {
+    "model": "gpt-4-turbo-preview",
+    "response_format": {"type": "json_object"},
+    "temperature": 0,
+    "seed": int(os.getenv('MODEL_SEED', 7))
+}
+# Bump whenever the prompt changes, so cached analyses of the old prompt are not reused
+PROMPT_VERSION = "url-2"
+
+def url_fingerprint(url: str) -> str:
+    """Fingerprint of the model request for a URL: settings, prompt version and normalized URL."""
+    return request_fingerprint(MODEL_OPTIONS, PROMPT_VERSION, normalize_url_key(url))
+
+# JSON layout of one analyzed product, shared by the single and batch prompts
+PRODUCT_FORMAT = """{
+                "product_name": "string",
+                "Health_Information": {
+                    "Nutrients": {},
+                    "Ingredients": [],
+                    "Health_index": float
+                },
+                "Sustainability_Information": {
+                    "Biodegradable": "Yes/No",
+                    "Recyclable": "Yes/No",
+                    "Sustainability_rating": float (1-5)
+                },
+                "Price": float,
+                "Reliability_index": float (1-5),
+                "Color_of_the_dustbin": "blue/green/black",
+                "Alternatives": [
+                    {
+                        "Name": "string",
+                        "Health_Information": {
+                            "Nutrients": {},
+                            "Ingredients": [],
+                            "Health_index": float
+                        },
+                        "Sustainability_Information": {
+                            "Biodegradable": "Yes/No",
+                            "Recyclable": "Yes/No",
+                            "Sustainability_rating": float
+                        },
+                        "Price": float,
+                        "Reliability_index": float
+                    }
+                ]
+            }"""
+MAIN_PRODUCT_FIELDS = ("product_name", "Health_Information", "Sustainability_Information", "Price",
+                       "Reliability_index", "Color_of_the_dustbin")
+
 # Custom Exceptions
 class ConfigError(Exception):
     """Raised when there's a configuration error"""
@@ -73,97 +137,206 @@ class DustbinColor(Enum):
     GREEN = "green"
     BLACK = "black"
 
-@dataclass
-class HealthInformation:
-    nutrients: Dict
-    ingredients: list
-    health_index: float
-
-@dataclass
-class SustainabilityInformation:
-    biodegradable: str
-    recyclable: str
-    sustainability_rating: float
-
-@dataclass
-class ProductAlternative:
-    name: str
-    health_info: HealthInformation
-    sustainability_info: SustainabilityInformation
-    price: float
-    reliability_index: float
-
 class ProductAnalyzer:
-    def __init__(self, openai_client: OpenAI, supabase_client: Client):
-        self.openai_client = openai_client
-        self.supabase = supabase_client
+    def __init__(self, model_client: ModelClient, store: ProductRepository, upstream: "UpstreamRunner",
+                 write_queue: Optional[WriteBehindQueue] = None, url_cache: Optional[ProductCache] = None,
+                 flights: Optional[SingleFlight] = None):
+        self.model_client = model_client
+        self.store = store
+        self.write_queue = write_queue
+        self.upstream = upstream
+        self.url_cache = url_cache
+        # Analyses in flight keyed on the normalized URL, shared with single-URL requests
+        self.flights = flights or SingleFlight()
         logger.debug("ProductAnalyzer instance created")
 
-    async def analyze_product_url(self, url: str) -> Dict[str, Any]:
-        """Analyze product URL using OpenAI."""
-        try:
-            logger.info(f"Starting analysis for URL: {url}")
-            
-            system_prompt = """You are a product analysis expert. Analyze the given URL and provide 
+    def build_messages(self, url: str) -> List[Dict[str, str]]:
+        """Build the chat messages asking the model to analyze a product URL."""
+        system_prompt = """You are a product analysis expert. Analyze the given URL and provide 
             comprehensive product information including sustainability metrics and market alternatives. 
             For electronics and appliances, focus on energy efficiency and recyclability."""
 
-            user_prompt = f"""Analyze the product at {url} and provide detailed information including:
+        user_prompt = f"""Analyze the product at {url} and provide detailed information including:
             1. Product name and specifications
             2. Sustainability metrics (recyclability, energy efficiency)
             3. Price and reliability information
             4. Three similar market alternatives with comparative analysis
             5. The color of the dustbin should be black or blue only
 
+            Format the response as a structured JSON object matching exactly:
+            {PRODUCT_FORMAT}"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def build_batch_messages(self, urls: List[str]) -> List[Dict[str, str]]:
+        """Build the chat messages asking the model to analyze several product URLs in one reply."""
+        system_prompt = """You are a product analysis expert. Analyze each of the given URLs and provide 
+            comprehensive product information including sustainability metrics and market alternatives. 
+            For electronics and appliances, focus on energy efficiency and recyclability."""
+
+        listing = "\n".join(f"            - {url}" for url in urls)
+        user_prompt = f"""Analyze the product at each of these URLs:
+{listing}
+
+            For every product provide the same information as a single analysis, including three
+            similar market alternatives. The color of the dustbin should be black or blue only.
+
             Format the response as a structured JSON object matching exactly:
             {{
-                "product_name": "string",
-                "Health_Information": {{
-                    "Nutrients": {{}},
-                    "Ingredients": [],
-                    "Health_index": float
-                }},
-                "Sustainability_Information": {{
-                    "Biodegradable": "Yes/No",
-                    "Recyclable": "Yes/No",
-                    "Sustainability_rating": float (1-5)
-                }},
-                "Price": float,
-                "Reliability_index": float (1-5),
-                "Color_of_the_dustbin": "blue/green/black",
-                "Alternatives": [
-                    {{
-                        "Name": "string",
-                        "Health_Information": {{
-                            "Nutrients": {{}},
-                            "Ingredients": [],
-                            "Health_index": float
-                        }},
-                        "Sustainability_Information": {{
-                            "Biodegradable": "Yes/No",
-                            "Recyclable": "Yes/No",
-                            "Sustainability_rating": float
-                        }},
-                        "Price": float,
-                        "Reliability_index": float
-                    }}
+                "Products": [
+                    {{"url": "the URL exactly as listed", ...all fields of the product format}}
                 ]
-            }}"""
-
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
+            }}
+            with one entry per listed URL, in the listed order, where each product follows:
+            {PRODUCT_FORMAT}"""
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    async def analyze_product_urls(self, urls: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Analyze a group of URLs in one model call; URLs the model skipped or changed map to None."""
+        try:
+            logger.info(f"Starting grouped analysis for {len(urls)} URLs")
+            result = await self.upstream.run(self.model_client.stream_json(
+                self.build_batch_messages(urls), item_keys=("Products",), **MODEL_OPTIONS
+            ))
+            products = match_group_results(urls, result.get("Products", []), "url", normalize_url_key)
+            for url, product in products.items():
+                if product is not None:
+                    product["Request_Fingerprint"] = url_fingerprint(url)
+            return products
+
+        except ModelUnavailableError as e:
+            logger.warning(f"OpenAI API unavailable: {str(e)}")
+            raise
+
+        except ValueError as e:
+            error_msg = f"Failed to parse OpenAI response: {str(e)}"
+            logger.error(f"{error_msg}\n{traceback.format_exc()}")
+            raise APIError(error_msg, status_code=500)
+
+        except Exception as e:
+            error_msg = f"Error in OpenAI analysis: {str(e)}"
+            logger.error(f"{error_msg}\n{traceback.format_exc()}")
+            raise APIError(error_msg, status_code=500)
+
+    async def analyze_batch(self, urls: List[str], group_size: int, concurrency: int) -> Dict[str, Dict[str, Any]]:
+        """Return a result for each of several distinct URLs.
+
+        Cached analyses are answered without a model call. Misses join
+        analyses of the same URLs already in flight; the rest are sent
+        `group_size` per model call with at most `concurrency` calls in
+        flight, and every new analysis is saved in one bulk write. A failed
+        group or an invalid product only fails its own URLs; while the model
+        API is unavailable they fall back to stale cached analyses.
+        """
+        results, misses = {}, {}
+        cached = {}
+        if self.url_cache is not None:
+            cached = await self.upstream.offload(lambda: {url: self.url_cache.get(url) for url in urls})
+        for url in urls:
+            if cached.get(url) is not None:
+                results[url] = {"status": "cached", **cached[url]}
+            else:
+                misses[normalize_url_key(url)] = url
+
+        async def lead(keys: List[str]) -> Dict[str, Any]:
+            outcomes = await self.analyze_and_save_many([misses[key] for key in keys], group_size, concurrency)
+            return {key: outcomes[misses[key]] for key in keys}
+
+        outcomes = await self.flights.do_many(list(misses), lead) if misses else {}
+
+        stale = {}
+        if self.url_cache is not None and any(isinstance(outcome, ModelUnavailableError) for outcome in outcomes.values()):
+            stale = await self.upstream.offload(lambda: {url: self.url_cache.get_stale(url) for url in misses.values()})
+
+        # Saves are queued rather than written when write-behind is on
+        saved_status = "queued" if self.write_queue is not None else "success"
+        for key, url in misses.items():
+            outcome = outcomes[key]
+            if isinstance(outcome, ModelUnavailableError) and stale.get(url) is not None:
+                results[url] = {"status": "stale", **stale[url]}
+            elif isinstance(outcome, Exception):
+                results[url] = {"status": "error", "error": getattr(outcome, "message", str(outcome))}
+            else:
+                results[url] = {"status": saved_status, "data": outcome["data"], "product_id": outcome["product_id"]}
+        return results
+
+    async def analyze_and_save_many(self, urls: List[str], group_size: int, concurrency: int) -> Dict[str, Any]:
+        """Analyze URLs in grouped model calls and save them in one bulk write.
+
+        Returns an analysis result like /analyze_url's, or the exception
+        that failed it, for each URL.
+        """
+        groups = chunked(urls, group_size)
+        replies = await gather_bounded([lambda group=group: self.analyze_product_urls(group) for group in groups],
+                                       concurrency)
+
+        outcomes, analyzed, unmatched = {}, [], []
+        for group, reply in zip(groups, replies):
+            for url in group:
+                if isinstance(reply, Exception):
+                    outcomes[url] = reply
+                elif reply[url] is None:
+                    unmatched.append(url)
+                else:
+                    try:
+                        analyzed.append((url, self.validate_product_data(reply[url])))
+                    except APIError as e:
+                        outcomes[url] = e
+
+        # URLs the grouped reply skipped or changed are analyzed one at a time
+        if unmatched:
+            logger.info(f"Retrying {len(unmatched)} URLs missing from grouped replies individually")
+        retries = await gather_bounded([lambda url=url: self.analyze_product_url(url) for url in unmatched], concurrency)
+        for url, reply in zip(unmatched, retries):
+            if isinstance(reply, Exception):
+                outcomes[url] = reply
+                continue
+            try:
+                analyzed.append((url, self.validate_product_data(reply)))
+            except APIError as e:
+                outcomes[url] = e
+
+        if not analyzed:
+            return outcomes
+        try:
+            product_ids, _ = await self.save_many_to_supabase([(data["product_name"], data) for _, data in analyzed])
+        except APIError as e:
+            outcomes.update((url, e) for url, _ in analyzed)
+            return outcomes
+
+        entries = {url: {"data": data, "product_id": product_id} for (url, data), product_id in zip(analyzed, product_ids)}
+        if self.url_cache is not None:
+            await self.upstream.offload(lambda: [self.url_cache.set(url, entry) for url, entry in entries.items()])
+        outcomes.update((url, {**entry, "request_id": None}) for url, entry in entries.items())
+        return outcomes
+
+    async def analyze_product_url(self, url: str, on_section=None) -> Dict[str, Any]:
+        """Analyze product URL using OpenAI.
+
+        The reply is streamed into an incremental parser that repairs common
+        defects; on_section(path, value) sees each top-level field and each
+        alternative as soon as it closes.
+        """
+        try:
+            logger.info(f"Starting analysis for URL: {url}")
+
+            result = await self.upstream.run(self.model_client.stream_json(
+                self.build_messages(url), on_section=on_section, **MODEL_OPTIONS
+            ))
             logger.debug(f"Analysis result: {json.dumps(result, indent=2)}")
+            result["Request_Fingerprint"] = url_fingerprint(url)
             return result
 
-        except json.JSONDecodeError as e:
+        except ModelUnavailableError as e:
+            logger.warning(f"OpenAI API unavailable: {str(e)}")
+            raise
+
+        except ValueError as e:
             error_msg = f"Failed to parse OpenAI response: {str(e)}"
             logger.error(f"{error_msg}\n{traceback.format_exc()}")
             raise APIError(error_msg, status_code=500)
@@ -173,68 +346,49 @@ class ProductAnalyzer:
             logger.error(f"{error_msg}\n{traceback.format_exc()}")
             raise APIError(error_msg, status_code=500)
 
+    async def stream_product_url(self, url: str, emit) -> Dict[str, Any]:
+        """Analyze a product URL, emitting validated sections as the model writes them.
+
+        Emits a "product" event once the main fields are complete and an
+        "alternative" event per alternative, then returns the fully
+        validated data.
+        """
+        fields = {}
+        product_sent, alternatives_sent = False, 0
+
+        def send_product():
+            nonlocal product_sent
+            if not product_sent and "product_name" in fields:
+                product_sent = True
+                product = self.validate_product_data({**fields, "Alternatives": []})
+                del product["Alternatives"]
+                emit({"event": "product", "data": product})
+
+        def on_section(path, value):
+            nonlocal alternatives_sent
+            if len(path) == 1:
+                fields[path[0]] = value
+                if all(key in fields for key in MAIN_PRODUCT_FIELDS):
+                    send_product()
+            elif isinstance(value, dict) and alternatives_sent < 3:
+                # The model has moved on to the alternatives, so the main product is complete
+                send_product()
+                emit({"event": "alternative", "index": alternatives_sent, "data": self.validate_alternative(value)})
+                alternatives_sent += 1
+
+        result = await self.analyze_product_url(url, on_section=on_section)
+        validated_data = self.validate_product_data(result)
+        send_product()
+        for index in range(alternatives_sent, len(validated_data["Alternatives"])):
+            emit({"event": "alternative", "index": index, "data": validated_data["Alternatives"][index]})
+        return validated_data
+
     def validate_product_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and normalize product data."""
         try:
-            product_name = data.get("product_name")
-            if not product_name:
+            validated_data = validate_product(data)
+            if not validated_data.get("product_name"):
                 raise APIError("Product name is required", status_code=400)
-
-            health_info = data.get("Health_Information", {})
-            sustainability_info = data.get("Sustainability_Information", {})
-            
-            dustbin_color = data.get("Color_of_the_dustbin", "blue")
-            if dustbin_color not in ["blue", "green", "black"] or dustbin_color == "N/A":
-                dustbin_color = "blue"
-            
-            # Normalize numeric values
-            health_index = float(str(health_info.get("Health_index", "4.0")).replace("N/A", "4.0"))
-            sustainability_rating = float(str(sustainability_info.get("Sustainability_rating", "4.0")))
-            price = float(str(data.get("Price", "0.0")))
-            reliability_index = float(str(data.get("Reliability_index", "4.0")))
-
-            # Validate ranges
-            if not (0 <= health_index <= 10):
-                health_index = 4.0
-            if not (0 <= sustainability_rating <= 5):
-                sustainability_rating = 4.3
-            if not (0 <= reliability_index <= 5):
-                reliability_index = 4.8
-            if price < 0:
-                price = 1000.0
-
-            # Normalize sustainability values
-            biodegradable = sustainability_info.get("Biodegradable", "No")
-            if biodegradable not in ["Yes", "No"]:
-                biodegradable = "No"
-            recyclable = sustainability_info.get("Recyclable", "Yes")
-            if recyclable not in ["Yes", "No"]:
-                recyclable = "Yes"
-
-            validated_data = {
-                "product_name": product_name,
-                "Health_Information": {
-                    "Nutrients": health_info.get("Nutrients", {}),
-                    "Ingredients": health_info.get("Ingredients", []),
-                    "Health_index": health_index
-                },
-                "Sustainability_Information": {
-                    "Biodegradable": biodegradable,
-                    "Recyclable": recyclable,
-                    "Sustainability_rating": sustainability_rating
-                },
-                "Price": price,
-                "Reliability_index": reliability_index,
-                "Color_of_the_dustbin": data.get("Color_of_the_dustbin", "blue"),
-                "Alternatives": []
-            }
-
-            # Validate alternatives
-            alternatives = data.get("Alternatives", [])
-            for alt in alternatives[:3]:
-                validated_alt = self.validate_alternative(alt)
-                validated_data["Alternatives"].append(validated_alt)
-
             return validated_data
 
         except APIError:
@@ -246,98 +400,22 @@ class ProductAnalyzer:
 
     def validate_alternative(self, alt: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and normalize alternative product data."""
-        try:
-            health_info = alt.get("Health_Information", {})
-            sustainability_info = alt.get("Sustainability_Information", {})
-
-            health_index = float(str(health_info.get("Health_index", "4.0")).replace("N/A", "4.0"))
-            sustainability_rating = float(str(sustainability_info.get("Sustainability_rating", "4.0")))
-            price = float(str(alt.get("Price", "0.0")))
-            reliability_index = float(str(alt.get("Reliability_index", "4.0")))
-
-            # Normalize ranges
-            if not (0 <= health_index <= 10):
-                health_index = 4.0
-            if not (0 <= sustainability_rating <= 5):
-                sustainability_rating = 4.0
-            if not (0 <= reliability_index <= 5):
-                reliability_index = 4.0
-            if price < 0:
-                price = 0.0
-
-            return {
-                "Name": alt.get("Name", "Alternative Product"),
-                "Health_Information": {
-                    "Nutrients": health_info.get("Nutrients", {}),
-                    "Ingredients": health_info.get("Ingredients", []),
-                    "Health_index": health_index
-                },
-                "Sustainability_Information": {
-                    "Biodegradable": sustainability_info.get("Biodegradable", "No"),
-                    "Recyclable": sustainability_info.get("Recyclable", "Yes"),
-                    "Sustainability_rating": sustainability_rating
-                },
-                "Price": price,
-                "Reliability_index": reliability_index
-            }
-
-        except Exception as e:
-            logger.error(f"Error validating alternative: {str(e)}")
-            return {
-                "Name": "Alternative Product",
-                "Health_Information": {
-                    "Nutrients": {},
-                    "Ingredients": [],
-                    "Health_index": 4.0
-                },
-                "Sustainability_Information": {
-                    "Biodegradable": "No",
-                    "Recyclable": "Yes",
-                    "Sustainability_rating": 4.0
-                },
-                "Price": 0.0,
-                "Reliability_index": 4.0
-            }
+        return validate_alternative(alt)
 
     async def save_to_supabase(self, product_name: str, product_data: Dict[str, Any]) -> str:
         """Save product data to Supabase."""
         try:
             logger.info(f"Saving product to Supabase: {product_name}")
-            
-            # Prepare main product data
-            main_product_data = {
-                "product_name": product_name,
-                "health_nutrients": json.dumps(product_data["Health_Information"]["Nutrients"]),
-                "health_ingredients": json.dumps(product_data["Health_Information"]["Ingredients"]),
-                "health_index": float(str(product_data["Health_Information"]["Health_index"]).replace("N/A", "4.0")),
-                "sustainability_biodegradable": product_data["Sustainability_Information"]["Biodegradable"],
-                "sustainability_recyclable": product_data["Sustainability_Information"]["Recyclable"],
-                "sustainability_rating": float(product_data["Sustainability_Information"]["Sustainability_rating"]),
-                "price": float(product_data["Price"]),
-                "reliability_index": float(product_data["Reliability_index"]),
-                "dustbin_color": product_data.get("Color_of_the_dustbin", "blue")
-            }
 
-            # Insert main product
-            result = self.supabase.table("product_information").insert(main_product_data).execute()
-            product_id = result.data[0]["id"]
-            
-            # Insert alternatives
-            for alt in product_data["Alternatives"]:
-                alternative_data = {
-                    "product_id": product_id,
-                    "alternative_name": alt["Name"],
-                    "health_nutrients": json.dumps(alt["Health_Information"]["Nutrients"]),
-                    "health_ingredients": json.dumps(alt["Health_Information"]["Ingredients"]),
-                    "health_index": float(str(alt["Health_Information"]["Health_index"]).replace("N/A", "4.0")),
-                    "sustainability_biodegradable": alt["Sustainability_Information"]["Biodegradable"],
-                    "sustainability_recyclable": alt["Sustainability_Information"]["Recyclable"],
-                    "sustainability_rating": float(alt["Sustainability_Information"]["Sustainability_rating"]),
-                    "price": float(alt["Price"]),
-                    "reliability_index": float(alt["Reliability_index"])
-                }
-                self.supabase.table("product_alternatives").insert(alternative_data).execute()
-            
+            if self.write_queue is not None:
+                # The id is assigned now; the rows reach the database shortly after
+                product_id = await self.upstream.offload(self.write_queue.enqueue, product_name, product_data)
+                logger.info(f"Queued product for saving with ID: {product_id}")
+                return product_id
+
+            # One insert for the product and one batched insert for its alternatives
+            product_id = await self.upstream.offload(self.store.save_product, product_name, product_data)
+
             logger.info(f"Successfully saved product with ID: {product_id}")
             return product_id
             
@@ -345,6 +423,35 @@ class ProductAnalyzer:
             logger.error(f"Error saving to Supabase: {str(e)}\n{traceback.format_exc()}")
             raise APIError(f"Database error: {str(e)}", status_code=500)
 
+    async def wait_until_saved(self, product_id: str, timeout: float) -> None:
+        """Wait for a queued save to reach the product store, so the client can read the row at once."""
+        if self.write_queue is None:
+            return
+        if not await self.upstream.offload(self.write_queue.wait_written, [product_id], timeout):
+            logger.warning(f"Product {product_id} was not saved within {timeout}s")
+            raise APIError("The product is analyzed but not saved yet; try again shortly", status_code=503,
+                           payload={"product_id": product_id})
+
+    async def save_many_to_supabase(self, entries: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[str], str]:
+        """Save several (product_name, data) analyses in one bulk write; returns (ids, status)."""
+        try:
+            logger.info(f"Saving {len(entries)} products to Supabase")
+
+            if self.write_queue is not None:
+                product_ids = await self.upstream.offload(self.write_queue.enqueue_many, entries)
+                logger.info(f"Queued {len(product_ids)} products for saving")
+                return product_ids, "queued"
+
+            product_ids = [new_product_id() for _ in entries]
+            await self.upstream.offload(self.store.save_products,
+                                        [(product_id, name, data) for product_id, (name, data) in zip(product_ids, entries)])
+            logger.info(f"Successfully saved {len(product_ids)} products")
+            return product_ids, "success"
+
+        except Exception as e:
+            logger.error(f"Error saving to Supabase: {str(e)}\n{traceback.format_exc()}")
+            raise APIError(f"Database error: {str(e)}", status_code=500)
+
 # Initialize Flask app and clients
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": ["http://localhost:5173"]}})
@@ -352,7 +459,8 @@ logger.info("Flask app initialized with CORS")
 
 # Initialize OpenAI and Supabase clients
 try:
-    openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    # Retries are left to the model client wrapper below
+    openai_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
     logger.info("OpenAI client initialized successfully")
     
     supabase: Client = create_client(
@@ -364,6 +472,80 @@ except Exception as e:
     logger.critical(f"Failed to initialize clients: {str(e)}\n{traceback.format_exc()}")
     raise
 
+# Model calls run on a shared event loop; blocking supabase calls on a bounded pool
+upstream = UpstreamRunner(max_blocking_workers=int(os.getenv('DB_CONCURRENCY', 16)), name="urlbot")
+
+# Model calls share one rate limit sized to the quota, retry with backoff and trip a circuit breaker
+model_client = ModelClient(
+    openai_client,
+    requests_per_minute=float(os.getenv('MODEL_RPM', 500)),
+    burst=int(os.getenv('MODEL_BURST', 10)),
+    max_retries=int(os.getenv('MODEL_MAX_RETRIES', 4)),
+    deadline=float(os.getenv('MODEL_DEADLINE', 120)),
+    failure_threshold=int(os.getenv('MODEL_BREAKER_THRESHOLD', 5)),
+    reset_timeout=float(os.getenv('MODEL_BREAKER_RESET', 30))
+)
+
+# Products go to Supabase unless PRODUCT_STORE points at a local store (e.g. sqlite:products.sqlite3)
+product_store = open_repository(os.getenv('PRODUCT_STORE', 'supabase'), supabase,
+                                rpc_name=os.getenv('SUPABASE_SAVE_RPC'))
+# With PRODUCT_SYNC=supabase a local store also copies every write to Supabase in the background
+if os.getenv('PRODUCT_SYNC') == 'supabase' and not isinstance(product_store, SupabaseProductRepository):
+    product_store = SyncedProductRepository(
+        product_store,
+        SupabaseProductRepository(supabase, rpc_name=os.getenv('SUPABASE_SAVE_RPC')),
+        journal_path=os.getenv('SYNC_JOURNAL_PATH', 'urlbot_sync.jsonl'),
+        batch_size=int(os.getenv('WRITE_BATCH_SIZE', 50))
+    )
+
+# Saves are journaled locally and written in the background unless WRITE_BEHIND=0.
+# /analyze_url still answers only once the row is readable (the kiosk reads it from
+# Supabase right away), waiting up to WRITE_CONFIRM_TIMEOUT seconds for it; streamed and
+# batch analyses return the pre-assigned product_id with status "queued".
+WRITE_CONFIRM_TIMEOUT = float(os.getenv('WRITE_CONFIRM_TIMEOUT', 10))
+write_queue = None
+if os.getenv('WRITE_BEHIND', '1') != '0':
+    write_queue = WriteBehindQueue(
+        product_store,
+        journal_path=os.getenv('WRITE_JOURNAL_PATH', 'urlbot_writes.jsonl'),
+        batch_size=int(os.getenv('WRITE_BATCH_SIZE', 50))
+    )
+    logger.info(f"Write-behind queue started with {write_queue.stats['replayed']} replayed entries")
+
+# Concurrent analyses of the same URL share one model call and one insert;
+# COALESCE_REQUESTS=0 turns this off (the load test's baseline)
+url_analyses = SingleFlight(enabled=os.getenv('COALESCE_REQUESTS', '1') != '0')
+
+# Finished analyses keyed on the request fingerprint, so batch requests can skip known URLs;
+# expired entries are still served for URL_CACHE_STALE_TTL while the model is unavailable
+url_results = ProductCache(
+    path=os.getenv('URL_CACHE_PATH', 'url_cache.sqlite3'),
+    ttl=float(os.getenv('URL_CACHE_TTL', 7 * 24 * 3600)),
+    max_memory_entries=int(os.getenv('URL_CACHE_SIZE', 1000)),
+    namespace="url_analysis",
+    key_func=url_fingerprint,
+    stale_ttl=float(os.getenv('URL_CACHE_STALE_TTL', 30 * 24 * 3600))
+)
+
+# Batch analyses: URLs per grouped model call, grouped calls in flight, and URLs per request
+BATCH_GROUP_SIZE = int(os.getenv('BATCH_GROUP_SIZE', 5))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))
+MAX_BATCH_ITEMS = int(os.getenv('MAX_BATCH_ITEMS', 100))
+
+# Formatted /product/<id> responses, kept in memory only
+PRODUCT_RESPONSE_MAX_AGE = int(os.getenv('PRODUCT_RESPONSE_MAX_AGE', 3600))
+product_responses = ProductCache(
+    path=None,
+    ttl=PRODUCT_RESPONSE_MAX_AGE,
+    max_memory_entries=int(os.getenv('PRODUCT_RESPONSE_CACHE_SIZE', 2000)),
+    namespace="product_response"
+)
+
+# /stats is served from a snapshot refreshed at most every STATS_TTL seconds
+STATS_TTL = float(os.getenv('STATS_TTL', 30))
+stats_snapshot = {"stats": None, "generated_at": None, "expires_at": 0.0}
+stats_refresh = SingleFlight()
+
 # Request logging middleware
 @app.before_request
 def log_request_info():
@@ -402,17 +584,30 @@ def handle_generic_error(error):
     response.status_code = 500
     return response
 
+def model_unavailable_response(error: ModelUnavailableError, request_id: str):
+    """503 telling the client when the model API is worth trying again."""
+    logger.warning(f"Request {request_id}: Model API unavailable: {str(error)}")
+    response = jsonify(APIError(f"Model service unavailable: {str(error)}", status_code=503,
+                                payload={"request_id": request_id}).to_dict())
+    response.status_code = 503
+    if error.retry_after is not None:
+        response.headers["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
     try:
         # Test database connection
-        supabase.table("product_information").select("id").limit(1).execute()
+        product_store.ping()
         
         return jsonify({
             "status": "healthy",
             "service": "online",
             "database": "connected",
+            "write_queue": write_queue.get_stats() if write_queue is not None else None,
+            "upstream_sync": product_store.get_sync_stats() if isinstance(product_store, SyncedProductRepository) else None,
+            "model": model_client.get_stats(),
             "timestamp": datetime.utcnow().isoformat(),
             "environment": os.getenv('FLASK_ENV', 'production')
         })
@@ -426,9 +621,38 @@ def health_check():
             "timestamp": datetime.utcnow().isoformat()
         }), 500
 
+@app.route('/write_queue/requeue', methods=['POST'])
+def requeue_failed_writes():
+    """Put dead-lettered saves back into the write queues, e.g. after a migration.
+
+    Requires the service key as a Bearer token, like infoBot's admin routes.
+    """
+    if request.headers.get('Authorization') != f"Bearer {os.getenv('SUPABASE_KEY')}":
+        error = APIError("Invalid authentication credentials", status_code=401)
+        return jsonify(error.to_dict()), error.status_code
+
+    requeued = {
+        "write_queue": write_queue.requeue_failed() if write_queue is not None else 0,
+        "upstream_sync": product_store.sync_queue.requeue_failed()
+        if isinstance(product_store, SyncedProductRepository) else 0
+    }
+    logger.info(f"Requeued dead-lettered writes: {requeued}")
+    return jsonify({"status": "success", "requeued": requeued, "timestamp": datetime.utcnow().isoformat()})
+
+def emit_analysis(emit, data: Dict[str, Any]) -> None:
+    """Replay a finished analysis as product and alternative events."""
+    emit({"event": "product", "data": {key: value for key, value in data.items() if key != "Alternatives"}})
+    for index, alternative in enumerate(data["Alternatives"]):
+        emit({"event": "alternative", "index": index, "data": alternative})
+
 @app.route('/analyze_url', methods=['POST'])
 async def analyze_url():
-    """Endpoint to analyze a product URL."""
+    """Endpoint to analyze a product URL.
+
+    A success response means the product_information row with the returned
+    product_id can be read. Streamed responses end as soon as the save is
+    queued, so their product_id may take a moment to become readable.
+    """
     request_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
     logger.info(f"Starting new request {request_id}")
     
@@ -443,31 +667,84 @@ async def analyze_url():
         logger.info(f"Request {request_id}: Analyzing URL: {url}")
 
         # Initialize analyzer
-        analyzer = ProductAnalyzer(openai_client, supabase)
-        
-        # Analyze URL with OpenAI
-        logger.info(f"Request {request_id}: Starting OpenAI analysis")
-        analysis_result = await analyzer.analyze_product_url(url)
-        logger.info(f"Request {request_id}: OpenAI analysis completed")
-        
-        # Validate and clean the data
-        logger.info(f"Request {request_id}: Validating data")
-        validated_data = analyzer.validate_product_data(analysis_result)
-        logger.info(f"Request {request_id}: Validation completed")
-        
-        # Save to Supabase
-        logger.info(f"Request {request_id}: Saving to Supabase")
-        product_id = await analyzer.save_to_supabase(
-            validated_data['product_name'],
-            validated_data
-        )
-        logger.info(f"Request {request_id}: Save completed")
+        analyzer = ProductAnalyzer(model_client, product_store, upstream, write_queue, url_results, url_analyses)
+
+        stream_mode = requested_stream_mode(data.get('stream'), request.headers.get('Accept', ''))
+        if stream_mode:
+            async def stream_analysis(emit) -> None:
+                async def lead() -> Dict[str, Any]:
+                    validated_data = await analyzer.stream_product_url(url, emit)
+                    product_id = await analyzer.save_to_supabase(validated_data['product_name'], validated_data)
+                    await upstream.offload(url_results.set, url, {"data": validated_data, "product_id": product_id})
+                    return {"data": validated_data, "product_id": product_id, "request_id": request_id}
+
+                try:
+                    # Join an in-flight analysis of the same URL, streamed or not, if there is one
+                    result = await url_analyses.do(normalize_url_key(url), lead)
+                except Exception as e:
+                    logger.error(f"Request {request_id}: Streamed analysis failed: {str(e)}\n{traceback.format_exc()}")
+                    raise
+                if result["request_id"] != request_id:
+                    # Another request led the analysis, so none of its sections were sent here yet
+                    logger.info(f"Request {request_id}: Shared result of request {result['request_id']}")
+                    emit_analysis(emit, result["data"])
+                logger.info(f"Request {request_id}: Streamed analysis completed")
+                emit({
+                    "event": "done",
+                    "status": "success",
+                    "data": result["data"],
+                    "product_id": result["product_id"],
+                    "request_id": request_id,
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+
+            # Sections are sent as soon as the model has written them
+            return Response(
+                encode_events(upstream.stream(stream_analysis), stream_mode),
+                mimetype=STREAM_MIMETYPES[stream_mode],
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        async def run_analysis() -> Dict[str, Any]:
+            # Analyze URL with OpenAI
+            logger.info(f"Request {request_id}: Starting OpenAI analysis")
+            analysis_result = await analyzer.analyze_product_url(url)
+            logger.info(f"Request {request_id}: OpenAI analysis completed")
+            
+            # Validate and clean the data
+            logger.info(f"Request {request_id}: Validating data")
+            validated_data = analyzer.validate_product_data(analysis_result)
+            logger.info(f"Request {request_id}: Validation completed")
+            
+            # Save to Supabase
+            logger.info(f"Request {request_id}: Saving to Supabase")
+            product_id = await analyzer.save_to_supabase(
+                validated_data['product_name'],
+                validated_data
+            )
+            logger.info(f"Request {request_id}: Save completed")
+            await upstream.offload(url_results.set, url, {"data": validated_data, "product_id": product_id})
+            return {"data": validated_data, "product_id": product_id, "request_id": request_id}
+
+        # Join an in-flight analysis of the same URL if there is one
+        try:
+            result = await url_analyses.do(normalize_url_key(url), run_analysis)
+        except ModelUnavailableError as e:
+            stale = await upstream.offload(url_results.get_stale, url)
+            if stale is None:
+                return model_unavailable_response(e, request_id)
+            logger.warning(f"Request {request_id}: Serving stale analysis while the model is unavailable")
+            result = {**stale, "request_id": None, "stale": True}
+        if result["request_id"] not in (request_id, None):
+            logger.info(f"Request {request_id}: Shared result of request {result['request_id']}")
+        await analyzer.wait_until_saved(result["product_id"], WRITE_CONFIRM_TIMEOUT)
         
         response_data = {
             "status": "success",
             "message": "Product analysis completed successfully",
-            "data": validated_data,
-            "product_id": product_id,
+            "data": result["data"],
+            "product_id": result["product_id"],
+            "stale": result.get("stale", False),
             "request_id": request_id,
             "timestamp": datetime.utcnow().isoformat()
         }
@@ -481,119 +758,172 @@ async def analyze_url():
         logger.error(f"Request {request_id}: Unexpected error: {str(e)}\n{traceback.format_exc()}")
         raise APIError(f"Error processing URL: {str(e)}", status_code=500)
 
+@app.route('/analyze_urls', methods=['POST'])
+async def analyze_urls():
+    """Endpoint to analyze a list of product URLs at once, e.g. a whole cart."""
+    request_id = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    logger.info(f"Starting new batch request {request_id}")
+
+    try:
+        data = request.get_json(silent=True) or {}
+        urls = data.get('urls')
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.strip() for url in urls):
+            logger.warning(f"Request {request_id}: Missing or invalid URL list")
+            raise APIError("urls must be a non-empty list of URLs", status_code=400)
+        if len(urls) > MAX_BATCH_ITEMS:
+            raise APIError(f"At most {MAX_BATCH_ITEMS} URLs can be analyzed per request", status_code=400)
+
+        # Repeated URLs (after normalization) are analyzed once and reported for every occurrence
+        unique_urls, keys = dedupe(urls, normalize_url_key)
+        logger.info(f"Request {request_id}: Analyzing {len(unique_urls)} unique URLs of {len(urls)}")
+
+        analyzer = ProductAnalyzer(model_client, product_store, upstream, write_queue, url_results, url_analyses)
+        results = await analyzer.analyze_batch(unique_urls, BATCH_GROUP_SIZE, BATCH_CONCURRENCY)
+        by_key = {normalize_url_key(url): results[url] for url in unique_urls}
+        items = [{"url": url, **by_key[key]} for url, key in zip(urls, keys)]
+
+        failed = sum(1 for url in unique_urls if results[url]["status"] == "error")
+        status = "success" if not failed else "partial" if failed < len(unique_urls) else "error"
+        logger.info(f"Request {request_id}: Batch finished with {failed} failed URLs")
+        return jsonify({
+            "status": status,
+            "items": items,
+            "unique_urls": len(unique_urls),
+            "failed": failed,
+            "request_id": request_id,
+            "timestamp": datetime.utcnow().isoformat()
+        }), 500 if status == "error" else 200
+
+    except APIError:
+        raise
+    except Exception as e:
+        logger.error(f"Request {request_id}: Unexpected error: {str(e)}\n{traceback.format_exc()}")
+        raise APIError(f"Error processing URLs: {str(e)}", status_code=500)
+
 @app.route('/product/<product_id>', methods=['GET'])
 async def get_product(product_id: str):
     """Get product information by ID."""
     try:
         logger.info(f"Retrieving product information for ID: {product_id}")
         
-        # Get main product information
-        product_result = supabase.table("product_information") \
-            .select("*") \
-            .eq("id", product_id) \
-            .execute()
-            
-        if not product_result.data:
-            logger.warning(f"Product not found: {product_id}")
-            raise APIError("Product not found", status_code=404)
-            
-        product_data = product_result.data[0]
-        
-        # Get alternatives
-        alternatives_result = supabase.table("product_alternatives") \
-            .select("*") \
-            .eq("product_id", product_id) \
-            .execute()
-            
-        # Combine the data
-        response_data = {
-            "product_info": {
-                "product_name": product_data["product_name"],
-                "Health_Information": {
-                    "Nutrients": json.loads(product_data["health_nutrients"]),
-                    "Ingredients": json.loads(product_data["health_ingredients"]),
-                    "Health_index": product_data["health_index"]
-                },
-                "Sustainability_Information": {
-                    "Biodegradable": product_data["sustainability_biodegradable"],
-                    "Recyclable": product_data["sustainability_recyclable"],
-                    "Sustainability_rating": product_data["sustainability_rating"]
-                },
-                "Price": product_data["price"],
-                "Reliability_index": product_data["reliability_index"],
-                "Color_of_the_dustbin": product_data["dustbin_color"]
-            },
-            "alternatives": [
-                {
-                    "Name": alt["alternative_name"],
-                    "Health_Information": {
-                        "Nutrients": json.loads(alt["health_nutrients"]),
-                        "Ingredients": json.loads(alt["health_ingredients"]),
-                        "Health_index": alt["health_index"]
-                    },
-                    "Sustainability_Information": {
-                        "Biodegradable": alt["sustainability_biodegradable"],
-                        "Recyclable": alt["sustainability_recyclable"],
-                        "Sustainability_rating": alt["sustainability_rating"]
-                    },
-                    "Price": alt["price"],
-                    "Reliability_index": alt["reliability_index"]
-                }
-                for alt in alternatives_result.data
-            ]
-        }
+        # Product rows never change after insert, so formatted responses are cached
+        cached = product_responses.get(product_id)
+        if cached is None:
+            found = await upstream.offload(product_store.get_product, product_id)
+            if found is None and write_queue is not None:
+                # Serve products that are still waiting in the write-behind queue. The
+                # write may still fail, so this is neither cached here nor by clients.
+                pending = write_queue.get_pending(product_id)
+                if pending is not None:
+                    product_data, alternatives = entry_rows(product_id, pending["product_name"], pending["data"])
+                    response = jsonify({
+                        "status": "success",
+                        "data": {
+                            "product_info": product_from_row(product_data),
+                            "alternatives": [alternative_from_row(alt) for alt in alternatives]
+                        },
+                        "pending": True,
+                        "timestamp": datetime.utcnow().isoformat()
+                    })
+                    response.cache_control.no_store = True
+                    return response
+            if found is None:
+                logger.warning(f"Product not found: {product_id}")
+                raise APIError("Product not found", status_code=404)
+
+            product_data, alternatives = found
+            response_data = {
+                "product_info": product_from_row(product_data),
+                "alternatives": [alternative_from_row(alt) for alt in alternatives]
+            }
+            etag = hashlib.sha1(json.dumps(response_data, sort_keys=True).encode()).hexdigest()
+            cached = {"data": response_data, "etag": etag}
+            product_responses.set(product_id, cached)
+
+        if request.if_none_match.contains(cached["etag"]):
+            response = app.make_response(("", 304))
+        else:
+            response = jsonify({
+                "status": "success",
+                "data": cached["data"],
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        response.set_etag(cached["etag"])
+        response.cache_control.public = True
+        response.cache_control.max_age = PRODUCT_RESPONSE_MAX_AGE
+        return response
         
+    except APIError:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving product: {str(e)}\n{traceback.format_exc()}")
+        raise APIError(f"Error retrieving product: {str(e)}", status_code=500)
+
+@app.route('/products', methods=['GET'])
+async def list_products():
+    """List products newest first, or best match first for ?q=, with filters and keyset pagination."""
+    try:
+        args = request.args
+        try:
+            limit = min(max(int(args.get('limit', 20)), 1), 100)
+            ranges = {
+                name: float(args[name]) if args.get(name) else None
+                for name in ('min_rating', 'max_rating', 'min_price', 'max_price')
+            }
+        except ValueError:
+            raise APIError("limit and range filters must be numbers", status_code=400)
+
+        try:
+            products, next_cursor = await upstream.offload(
+                product_store.list_products,
+                limit=limit,
+                cursor=args.get('cursor'),
+                search=args.get('q'),
+                dustbin_color=args.get('dustbin_color'),
+                recyclable=args.get('recyclable'),
+                biodegradable=args.get('biodegradable'),
+                **ranges
+            )
+        except ValueError as e:
+            raise APIError(str(e), status_code=400)
+
         return jsonify({
             "status": "success",
-            "data": response_data,
+            "products": products,
+            "next_cursor": next_cursor,
             "timestamp": datetime.utcnow().isoformat()
         })
-        
+
     except APIError:
         raise
     except Exception as e:
-        logger.error(f"Error retrieving product: {str(e)}\n{traceback.format_exc()}")
-        raise APIError(f"Error retrieving product: {str(e)}", status_code=500)
+        logger.error(f"Error listing products: {str(e)}\n{traceback.format_exc()}")
+        raise APIError(f"Error listing products: {str(e)}", status_code=500)
 
 @app.route('/stats', methods=['GET'])
 async def get_stats():
-    """Get basic statistics about the products in the database."""
+    """Get aggregate statistics about the products in the database."""
     try:
-        logger.info("Retrieving database statistics")
-        
-        # Get total products count
-        products_count = supabase.table("product_information") \
-            .select("id", count="exact") \
-            .execute()
-            
-        # Get average sustainability rating
-        sustainability_stats = supabase.table("product_information") \
-            .select("sustainability_rating") \
-            .execute()
-            
-        # Get average price
-        price_stats = supabase.table("product_information") \
-            .select("price") \
-            .execute()
-            
-        # Calculate averages
-        if sustainability_stats.data:
-            avg_sustainability = sum(p["sustainability_rating"] for p in sustainability_stats.data) / len(sustainability_stats.data)
-        else:
-            avg_sustainability = 0
-            
-        if price_stats.data:
-            avg_price = sum(p["price"] for p in price_stats.data) / len(price_stats.data)
-        else:
-            avg_price = 0
+        cached = stats_snapshot["stats"] is not None and stats_snapshot["expires_at"] > time.time()
+        if not cached:
+            logger.info("Refreshing database statistics")
+
+            async def refresh():
+                stats = await upstream.offload(product_store.get_stats)
+                stats_snapshot.update(
+                    stats=stats,
+                    generated_at=datetime.utcnow().isoformat(),
+                    expires_at=time.time() + STATS_TTL
+                )
+
+            # Concurrent requests on an expired snapshot share one refresh
+            await stats_refresh.do("stats", refresh)
             
         return jsonify({
             "status": "success",
-            "stats": {
-                "total_products": products_count.count if hasattr(products_count, 'count') else 0,
-                "average_sustainability_rating": round(avg_sustainability, 2),
-                "average_price": round(avg_price, 2)
-            },
+            "stats": stats_snapshot["stats"],
+            "generated_at": stats_snapshot["generated_at"],
+            "cached": cached,
             "timestamp": datetime.utcnow().isoformat()
         })
         
@@ -0,0 +1,217 @@
+# vision_events.py
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over path, so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file, indent=4)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+class DetectionEventStream:
+    """In-process pub/sub of detection events with sequence numbers.
+
+    Publishing the same products twice in a row for a session is a no-op,
+    so subscribers only hear about detections that are actually new.
+    """
+
+    def __init__(self, history=256):
+        self.events = deque(maxlen=history)
+        self.seq = 0
+        # Sequence numbers restart with the process; the stream id tells subscribers when
+        self.stream_id = uuid.uuid4().hex
+        self.last_products = {}  # session_id -> tuple of last published products
+        self.condition = threading.Condition()
+
+    def publish(self, session_id, products):
+        """Publish a detection; returns the event, or None if it was a duplicate."""
+        products = list(products)
+        with self.condition:
+            if self.last_products.get(session_id) == tuple(products):
+                return None
+            self.last_products[session_id] = tuple(products)
+            self.seq += 1
+            event = {
+                "seq": self.seq,
+                "stream_id": self.stream_id,
+                "session_id": session_id,
+                "product_name": products[0],
+                "products": products,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self.events.append(event)
+            self.condition.notify_all()
+            return event
+
+    def reset_session(self, session_id):
+        """Forget the last detection of a session so a rescan is reported again."""
+        with self.condition:
+            self.last_products.pop(session_id, None)
+
+    def since(self, seq, session_id=None):
+        """Return buffered events newer than seq, optionally for one session."""
+        with self.condition:
+            return [
+                event for event in self.events
+                if event["seq"] > seq and (session_id is None or event["session_id"] == session_id)
+            ]
+
+    def wait(self, seq, session_id=None, timeout=None):
+        """Block until any event newer than seq exists (or timeout).
+
+        Returns the matching events and the stream head at that moment, so
+        callers can skip past other sessions' events without racing.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.seq > seq, timeout=timeout)
+            events = [
+                event for event in self.events
+                if event["seq"] > seq and (session_id is None or event["session_id"] == session_id)
+            ]
+            return events, self.seq
+
+    def event_id(self, seq):
+        """SSE id of an event: the stream id and sequence number, so a resume can tell runs apart."""
+        return f"{self.stream_id}:{seq}"
+
+    def resume_from(self, last_event_id):
+        """Sequence number to resume after for a client's Last-Event-ID.
+
+        Ids from an earlier run of the service (another stream id) replay
+        everything buffered, since this run numbers its events from 1
+        again. A bare sequence number is trusted unless it is ahead of
+        this run.
+        """
+        stream_id, _, seq = str(last_event_id or "").rpartition(":")
+        try:
+            seq = int(seq)
+        except ValueError:
+            return 0
+        if stream_id and stream_id != self.stream_id:
+            return 0
+        with self.condition:
+            return seq if 0 <= seq <= self.seq else 0
+
+    def latest(self, session_id=None):
+        """Return the newest event, optionally for one session."""
+        events = self.since(0, session_id)
+        return events[-1] if events else None
+
+    def stream(self, since=0, session_id=None, keepalive=15):
+        """Yield server-sent event chunks, with comment keepalives while idle."""
+        seq = since
+        while True:
+            events, head = self.wait(seq, session_id, timeout=keepalive)
+            if not events:
+                # Nothing for this subscriber; skip past other sessions' events
+                seq = max(seq, head)
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                seq = event["seq"]
+                yield f"id: {self.event_id(seq)}\nevent: detection\ndata: {json.dumps(event)}\n\n"
+
+
+class VisionEventSubscriber:
+    """Background client for the vision service's /events SSE endpoint.
+
+    Keeps the most recent detection in memory and reconnects with the
+    last seen event id, so no detection is missed across restarts of
+    either service.
+    """
+
+    def __init__(self, url, session_id=None, retry_delay=2.0, timeout=30):
+        self.url = url
+        self.session_id = session_id
+        self.retry_delay = retry_delay
+        self.timeout = timeout  # Must exceed the server keepalive interval
+        self.last_event = None
+        self.last_by_session = {}
+        self.last_seq = 0
+        self.stream_id = None
+        self.connected = False
+        self.warned = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def latest(self, session_id=None):
+        """Return the newest detection event received, optionally for one session."""
+        with self.condition:
+            if session_id is None:
+                return self.last_event
+            return self.last_by_session.get(session_id)
+
+    def wait_for_event(self, after_seq=0, timeout=None):
+        """Block until an event newer than after_seq arrives; returns it or None."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_seq > after_seq, timeout=timeout)
+            return self.last_event if self.last_seq > after_seq else None
+
+    def handle_event(self, event):
+        with self.condition:
+            if event.get("stream_id") != self.stream_id:
+                # The vision service restarted and its sequence numbers with it
+                self.stream_id = event.get("stream_id")
+                self.last_seq = 0
+            if event["seq"] <= self.last_seq:
+                return
+            self.last_seq = event["seq"]
+            self.last_event = event
+            self.last_by_session[event.get("session_id")] = event
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except Exception as e:
+                # Report once per outage rather than on every retry
+                if not self.warned:
+                    print(f"Vision event stream unavailable: {e}")
+                    self.warned = True
+            self.connected = False
+            time.sleep(self.retry_delay)
+
+    def listen(self):
+        """Read one SSE connection until it drops."""
+        url = self.url
+        if self.session_id:
+            url += ("&" if "?" in url else "?") + f"session_id={self.session_id}"
+        with self.condition:
+            # The stream id lets a restarted service see that our sequence number is from its previous run
+            last_event_id = f"{self.stream_id}:{self.last_seq}" if self.stream_id else str(self.last_seq)
+        request = urllib.request.Request(url, headers={
+            "Accept": "text/event-stream",
+            "Last-Event-ID": last_event_id
+        })
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            self.connected = True
+            self.warned = False
+            data_lines = []
+            for raw_line in response:
+                line = raw_line.decode("utf-8").rstrip("\r\n")
+                if line.startswith("data:"):
+                    data_lines.append(line[5:].strip())
+                elif not line and data_lines:
+                    self.handle_event(json.loads("\n".join(data_lines)))
+                    data_lines = []
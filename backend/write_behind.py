@@ -0,0 +1,323 @@
+# write_behind.py
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from persistence import ProductRepository, new_product_id
+
+# Errors a write will hit again no matter how often it is retried: bad row data,
+# constraint violations, unknown columns. Everything else is treated as transient.
+PERMANENT_ERRORS = (KeyError, TypeError, ValueError, sqlite3.IntegrityError)
+# SQLSTATE classes (data exception, integrity violation, syntax or undefined
+# column) and PostgREST request errors reported by Supabase
+PERMANENT_CODE_PREFIXES = ("22", "23", "42", "PGRST1", "PGRST2")
+
+
+def is_permanent(error: Exception) -> bool:
+    """Whether a failed write would fail the same way on every retry."""
+    if isinstance(error, PERMANENT_ERRORS):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, str) and code.startswith(PERMANENT_CODE_PREFIXES)
+
+
+class WriteBehindQueue:
+    """Durable queue that persists product analyses after the response is sent.
+
+    Each write is appended (and fsynced) to a local JSON-lines journal and
+    given its product id up front, so a request can return as soon as the
+    journal append finishes. A background worker drains pending entries to
+    the repository in batches. Entries still pending at shutdown are
+    replayed from the journal on the next start.
+
+    When a batch fails with a permanent error (see is_permanent), its
+    entries are written one at a time so a single bad row cannot hold
+    back the rest. Transient failures such as an unreachable database are
+    retried with jittered exponential backoff for as long as they last.
+    Only an entry that fails permanently on its own `max_attempts` times
+    is moved to `<journal>.failed`; requeue_failed() puts those back once
+    the cause is fixed.
+
+    Read-after-write: the id returned by enqueue() is the product's final
+    id, but its rows are only readable once the worker has written them.
+    Callers whose clients read the row straight away wait_written() for it
+    before answering; the others return the id with status "queued".
+    """
+
+    def __init__(self, repository: ProductRepository, journal_path: str = "write_journal.jsonl",
+                 batch_size: int = 50, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 60.0):
+        self.repository = repository
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.attempts: Dict[str, int] = {}
+        # Recently dead-lettered ids, so wait_written() can tell them from written ones
+        self.dead_lettered: "OrderedDict[str, None]" = OrderedDict()
+        self.completed_since_compaction = 0
+        self.condition = threading.Condition()
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "retries": 0, "dead_lettered": 0, "replayed": 0,
+                      "requeued": 0}
+
+        self._replay()
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        self.thread = threading.Thread(target=self._run, daemon=True, name="write-behind")
+        self.thread.start()
+
+    def _replay(self):
+        """Load entries that were journaled but never marked done."""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append
+                    continue
+                if record.get("op") == "save":
+                    self.pending[record["product_id"]] = record
+                elif record.get("op") == "done":
+                    self.pending.pop(record["product_id"], None)
+        self.stats["replayed"] = len(self.pending)
+        self._compact()
+
+    def _append(self, records):
+        for record in records:
+            self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def _compact(self):
+        """Rewrite the journal with only the pending entries."""
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self.pending.values():
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self.completed_since_compaction = 0
+
+    def enqueue(self, product_name: str, data: Dict[str, Any], product_id: Optional[str] = None) -> str:
+        """Journal a product write and return its pre-assigned id."""
+        product_id = product_id or new_product_id()
+        record = {"op": "save", "product_id": product_id, "product_name": product_name,
+                  "data": data, "queued_at": time.time()}
+        with self.condition:
+            self._append([record])
+            self.pending[product_id] = record
+            self.stats["queued"] += 1
+            self.condition.notify()
+        return product_id
+
+    def enqueue_many(self, entries: List[Tuple[str, Dict[str, Any]]],
+                     product_ids: Optional[List[str]] = None) -> List[str]:
+        """Journal several product writes with a single fsync and return their ids."""
+        now = time.time()
+        product_ids = product_ids or [new_product_id() for _ in entries]
+        records = [{"op": "save", "product_id": product_id, "product_name": product_name,
+                    "data": data, "queued_at": now} for product_id, (product_name, data) in zip(product_ids, entries)]
+        with self.condition:
+            self._append(records)
+            for record in records:
+                self.pending[record["product_id"]] = record
+            self.stats["queued"] += len(records)
+            self.condition.notify()
+        return [record["product_id"] for record in records]
+
+    def get_pending(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """Return a queued entry that has not reached the repository yet."""
+        with self.condition:
+            return self.pending.get(product_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued entry is written; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def wait_written(self, product_ids: List[str], timeout: Optional[float] = None) -> bool:
+        """Wait until the given entries are in the repository; False on timeout or if one was dead-lettered."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while any(product_id in self.pending for product_id in product_ids):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return not any(product_id in self.dead_lettered for product_id in product_ids)
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                batch = list(self.pending.values())[:self.batch_size]
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                failures += 1
+                print(f"Write-behind batch of {len(batch)} failed: {e}")
+                with self.condition:
+                    self.stats["retries"] += 1
+                if is_permanent(e) and self._write_each(batch, e):
+                    failures = 0
+                    continue
+                delay = min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+
+            failures = 0
+            self._complete(batch, written=True)
+
+    def _write(self, records):
+        self.repository.save_products([(r["product_id"], r["product_name"], r["data"]) for r in records])
+
+    def _write_each(self, batch, error) -> bool:
+        """Write a failed batch one entry at a time; returns True if every entry was settled.
+
+        Entries that fail permanently on their own count an attempt and are
+        dead-lettered after max_attempts. A transient error stops the pass,
+        leaving the remaining entries pending for the next retry.
+        """
+        if len(batch) == 1:
+            return self._record_failure(batch[0], error)
+        settled = True
+        for record in batch:
+            try:
+                self._write([record])
+            except Exception as e:
+                if not is_permanent(e):
+                    return False
+                settled = self._record_failure(record, e) and settled
+                continue
+            self._complete([record], written=True)
+        return settled
+
+    def _record_failure(self, record, error) -> bool:
+        """Count a permanent failure of one entry; returns True if it was dead-lettered."""
+        product_id = record["product_id"]
+        with self.condition:
+            attempts = self.attempts[product_id] = self.attempts.get(product_id, 0) + 1
+            print(f"Write-behind entry {product_id} failed ({attempts}/{self.max_attempts}): {error}")
+            if attempts < self.max_attempts:
+                return False
+            with open(f"{self.journal_path}.failed", "a", encoding="utf-8") as f:
+                f.write(json.dumps({**record, "error": str(error)}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._complete([record], written=False)
+        return True
+
+    def requeue_failed(self) -> int:
+        """Move dead-lettered entries back into the queue, e.g. after a migration; returns how many."""
+        failed_path = f"{self.journal_path}.failed"
+        with self.condition:
+            if not os.path.exists(failed_path):
+                return 0
+            records = []
+            with open(failed_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    record.pop("error", None)
+                    records.append(record)
+            # Journal them before removing the dead-letter file so none are lost in between
+            self._append(records)
+            for record in records:
+                self.pending[record["product_id"]] = record
+                self.dead_lettered.pop(record["product_id"], None)
+            os.remove(failed_path)
+            self.stats["requeued"] += len(records)
+            self.condition.notify_all()
+        return len(records)
+
+    def _complete(self, records, written: bool):
+        with self.condition:
+            self._append([{"op": "done", "product_id": r["product_id"]} for r in records])
+            for record in records:
+                self.pending.pop(record["product_id"], None)
+                self.attempts.pop(record["product_id"], None)
+            if written:
+                self.stats["written"] += len(records)
+                self.stats["batches"] += 1
+            else:
+                self.stats["dead_lettered"] += len(records)
+                for record in records:
+                    self.dead_lettered[record["product_id"]] = None
+                while len(self.dead_lettered) > 1000:
+                    self.dead_lettered.popitem(last=False)
+            self.completed_since_compaction += len(records)
+            # Keep the journal short: rewrite it once enough entries are done
+            if not self.pending or self.completed_since_compaction >= 1000:
+                self.journal.close()
+                self._compact()
+                self.journal = open(self.journal_path, "a", encoding="utf-8")
+            self.condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.condition:
+            stats = dict(self.stats)
+            stats["pending"] = len(self.pending)
+            oldest = next(iter(self.pending.values()), None)
+        stats["oldest_pending_age"] = round(time.time() - oldest["queued_at"], 3) if oldest else 0.0
+        return stats
+
+
+class SyncedProductRepository(ProductRepository):
+    """A local product store whose writes are copied upstream in the background.
+
+    Edge kiosks read and write their local SQLite store, so scans keep
+    working offline. Each write is journaled for the upstream store
+    (normally Supabase) before it is applied locally, and a
+    WriteBehindQueue replays the journal upstream with retries, so a kiosk
+    catches up once it is back online. Product ids are kept, so upstream
+    rows match the local ones. Deletes only clear the local copy; the
+    upstream store is shared by every kiosk.
+    """
+
+    def __init__(self, local: ProductRepository, upstream: ProductRepository,
+                 journal_path: str = "upstream_sync.jsonl", batch_size: int = 50):
+        self.local = local
+        self.upstream = upstream
+        self.sync_queue = WriteBehindQueue(upstream, journal_path=journal_path, batch_size=batch_size)
+
+    def save_products(self, entries):
+        self.sync_queue.enqueue_many([(product_name, data) for _, product_name, data in entries],
+                                     product_ids=[product_id for product_id, _, _ in entries])
+        self.local.save_products(entries)
+
+    def get_product(self, product_id):
+        return self.local.get_product(product_id)
+
+    def get_stats(self):
+        return self.local.get_stats()
+
+    def list_products(self, *args, **kwargs):
+        return self.local.list_products(*args, **kwargs)
+
+    def delete_all(self):
+        return self.local.delete_all()
+
+    def ping(self):
+        self.local.ping()
+
+    def get_sync_stats(self) -> Dict[str, Any]:
+        return self.sync_queue.get_stats()